@@ -0,0 +1,185 @@
+# balances.py - Bulk USDC balance lookups
+# Resolves many addresses with one Multicall3 aggregate call (or a JSON-RPC
+# batch where Multicall3 isn't deployed) and caches results by block number.
+
+import os
+import asyncio
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+
+from rpc_pool import RPCPool
+from token_registry import TokenRegistry
+
+# Same address on every chain it is deployed to
+MULTICALL3_ADDRESS = "0xcA11bde05977b3631167028862bE2a173976CA11"
+
+MULTICALL3_ABI = [
+    {
+        "name": "aggregate",
+        "type": "function",
+        "stateMutability": "payable",
+        "inputs": [{
+            "name": "calls",
+            "type": "tuple[]",
+            "components": [
+                {"name": "target", "type": "address"},
+                {"name": "callData", "type": "bytes"}
+            ]
+        }],
+        "outputs": [
+            {"name": "blockNumber", "type": "uint256"},
+            {"name": "returnData", "type": "bytes[]"}
+        ]
+    },
+]
+
+MAX_BULK_ADDRESSES = 500
+MULTICALL_CHUNK_SIZE = 200  # balanceOf calls per aggregate
+BALANCE_CACHE_SIZE = int(os.getenv("BALANCE_CACHE_SIZE", "50000"))  # cached balances per network
+PORTFOLIO_TIMEOUT = float(os.getenv("PORTFOLIO_TIMEOUT", "3"))  # seconds allowed per chain
+
+
+class BalanceService:
+    """Bulk balanceOf lookups with a per-network, block-keyed cache"""
+
+    def __init__(self, w3, pools: Dict[str, RPCPool], registry: TokenRegistry):
+        self.w3 = w3
+        self.pools = pools
+        self.registry = registry
+        self.multicall = w3.eth.contract(address=MULTICALL3_ADDRESS, abi=MULTICALL3_ABI)
+        self._has_multicall: Dict[str, bool] = {}
+        self._cache: Dict[str, "OrderedDict[str, Tuple[int, int]]"] = {}  # address -> (block, wei)
+        self.hits = 0
+        self.misses = 0
+
+    async def get_balances(self, addresses: List[str], network: str) -> Dict:
+        """Balances for every address, in token units, plus the block they were read at"""
+        token = await self.registry.ensure(network)
+        checksummed = list(dict.fromkeys(self.w3.to_checksum_address(a) for a in addresses))
+
+        # Plain eth_blockNumber - fee data has nothing to do with balances
+        current_block = int(await self.pools[network].call("eth_blockNumber"), 16)
+        cache = self._cache.setdefault(network, OrderedDict())
+
+        balances: Dict[str, int] = {}
+        missing = []
+        for address in checksummed:
+            cached = cache.get(address)
+            if cached is not None and cached[0] >= current_block:
+                cache.move_to_end(address)
+                balances[address] = cached[1]
+                self.hits += 1
+            else:
+                missing.append(address)
+                self.misses += 1
+
+        source = "cache"
+        block_number = current_block
+        if missing:
+            if await self._multicall_deployed(network):
+                block_number, fetched = await self._fetch_multicall(token, missing, network)
+                source = "multicall"
+            else:
+                block_number, fetched = await self._fetch_batch(token, missing, network)
+                source = "batch"
+            for address, wei in fetched.items():
+                cache[address] = (block_number, wei)
+                cache.move_to_end(address)
+            while len(cache) > BALANCE_CACHE_SIZE:
+                cache.popitem(last=False)
+            balances.update(fetched)
+
+        scale = 10 ** token.decimals
+        return {
+            "network": network,
+            "token": token.symbol,
+            "block_number": block_number,
+            "source": source,
+            "balances": {address: balances[address] / scale for address in checksummed},
+        }
+
+    async def get_portfolio(self, address: str, networks: List[str], timeout: float = PORTFOLIO_TIMEOUT) -> Dict:
+        """
+        Balance of one address on every network at once. Each chain gets its
+        own timeout; slow or failing chains are reported instead of failing
+        the whole portfolio.
+        """
+        address = self.w3.to_checksum_address(address)
+
+        async def lookup(network: str) -> Dict:
+            try:
+                result = await asyncio.wait_for(self.get_balances([address], network), timeout)
+                token = self.registry.get(network)
+                return {
+                    "status": "ok",
+                    "balance": result["balances"][address],
+                    "token": result["token"],
+                    "chain_id": token.chain_id if token else None,
+                    "block_number": result["block_number"],
+                }
+            except asyncio.TimeoutError:
+                return {"status": "timeout", "error": f"No response within {timeout}s"}
+            except Exception as e:
+                return {"status": "error", "error": f"{type(e).__name__}: {e}"}
+
+        results = await asyncio.gather(*(lookup(network) for network in networks))
+        by_network = dict(zip(networks, results))
+        failed = [network for network, result in by_network.items() if result["status"] != "ok"]
+        return {
+            "address": address,
+            "complete": not failed,
+            "failed_networks": failed,
+            "networks": by_network,
+        }
+
+    async def _multicall_deployed(self, network: str) -> bool:
+        if network not in self._has_multicall:
+            code = await self.pools[network].call("eth_getCode", [MULTICALL3_ADDRESS, "latest"])
+            self._has_multicall[network] = bool(code) and code != "0x"
+            print(f"🧮 [BALANCES] Multicall3 on {network}: {self._has_multicall[network]}")
+        return self._has_multicall[network]
+
+    async def _fetch_multicall(self, token, addresses: List[str], network: str) -> Tuple[int, Dict[str, int]]:
+        """One aggregate eth_call per chunk; chunks go out as one JSON-RPC batch"""
+        chunks = [addresses[i:i + MULTICALL_CHUNK_SIZE] for i in range(0, len(addresses), MULTICALL_CHUNK_SIZE)]
+        calls = []
+        for chunk in chunks:
+            inner = [(token.address, token.contract.encode_abi("balanceOf", args=[a])) for a in chunk]
+            calls.append(("eth_call", [
+                {"to": MULTICALL3_ADDRESS, "data": self.multicall.encode_abi("aggregate", args=[inner])},
+                "latest"
+            ]))
+
+        results = await self.pools[network].batch(calls)
+
+        balances: Dict[str, int] = {}
+        block_number = 0
+        for chunk, raw in zip(chunks, results):
+            block, return_data = self.w3.codec.decode(["uint256", "bytes[]"], bytes.fromhex(raw[2:]))
+            block_number = max(block_number, block)
+            for address, data in zip(chunk, return_data):
+                balances[address] = int.from_bytes(data[:32], "big") if data else 0
+        return block_number, balances
+
+    async def _fetch_batch(self, token, addresses: List[str], network: str) -> Tuple[int, Dict[str, int]]:
+        """Fallback: plain balanceOf eth_calls in one JSON-RPC batch"""
+        calls = [("eth_blockNumber", [])] + [
+            ("eth_call", [{"to": token.address, "data": token.contract.encode_abi("balanceOf", args=[a])}, "latest"])
+            for a in addresses
+        ]
+        results = await self.pools[network].batch(calls)
+        block_number = int(results[0], 16)
+        return block_number, {
+            a: int(raw, 16) if raw and raw != "0x" else 0
+            for a, raw in zip(addresses, results[1:])
+        }
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "cached_addresses": {network: len(cache) for network, cache in self._cache.items()},
+            "multicall": dict(self._has_multicall),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
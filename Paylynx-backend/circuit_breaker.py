@@ -0,0 +1,114 @@
+# circuit_breaker.py - Circuit breaker for the reasoning model
+# Tracks the outcome and latency of recent model calls. When too many fail
+# (or are too slow) the breaker opens and callers skip the model entirely;
+# after a cool-down a single probe call decides whether to close it again.
+
+import os
+import time
+from collections import deque
+from typing import Dict, Optional
+
+BREAKER_WINDOW = int(os.getenv("BREAKER_WINDOW", "20"))  # recent calls considered
+BREAKER_MIN_CALLS = 5  # don't judge on fewer calls than this
+BREAKER_ERROR_RATE = float(os.getenv("BREAKER_ERROR_RATE", "0.5"))  # failure share that opens the breaker
+BREAKER_SLOW_CALL_MS = float(os.getenv("BREAKER_SLOW_CALL_MS", "4000"))  # slower successes count as failures; keep <= the latency budget
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "30"))  # cool-down before a probe
+EWMA_ALPHA = 0.2
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """closed → open on high error rate → half_open probe → closed / open"""
+
+    def __init__(self, name: str, window: int = BREAKER_WINDOW, error_rate: float = BREAKER_ERROR_RATE,
+                 slow_call_ms: float = BREAKER_SLOW_CALL_MS, open_seconds: float = BREAKER_OPEN_SECONDS):
+        self.name = name
+        self.error_rate_threshold = error_rate
+        self.slow_call_ms = slow_call_ms
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self._outcomes: deque = deque(maxlen=window)  # True = healthy call
+        self._probe_in_flight = False
+        self.latency_ms: Optional[float] = None
+
+        self.times_opened = 0
+        self.short_circuited = 0
+        self.budget_fallbacks = 0
+
+    def allow(self) -> bool:
+        """Whether the next call may go to the model"""
+        if self.state == OPEN:
+            if time.monotonic() - self.opened_at < self.open_seconds:
+                self.short_circuited += 1
+                return False
+            self.state = HALF_OPEN
+            print(f"🔌 [BREAKER] {self.name}: half-open, probing")
+        if self.state == HALF_OPEN:
+            if self._probe_in_flight:
+                self.short_circuited += 1
+                return False
+            self._probe_in_flight = True
+        return True
+
+    def record_success(self, latency_ms: float):
+        self.latency_ms = latency_ms if self.latency_ms is None else (
+            EWMA_ALPHA * latency_ms + (1 - EWMA_ALPHA) * self.latency_ms
+        )
+        self._record(latency_ms < self.slow_call_ms)
+
+    def record_failure(self):
+        self._record(False)
+
+    def release(self):
+        """The call ended without a verdict (client went away) - free a half-open probe, record nothing"""
+        if self.state == HALF_OPEN:
+            self._probe_in_flight = False
+
+    def record_budget_fallback(self):
+        """The model was still working when the latency budget ran out - counts as a slow call"""
+        self.budget_fallbacks += 1
+        self._record(False)
+
+    def _record(self, healthy: bool):
+        if self.state == HALF_OPEN:
+            self._probe_in_flight = False
+            if healthy:
+                self.state = CLOSED
+                self._outcomes.clear()
+                print(f"🔌 [BREAKER] {self.name}: closed")
+            else:
+                self._open()
+            return
+
+        self._outcomes.append(healthy)
+        if self.state == CLOSED and len(self._outcomes) >= BREAKER_MIN_CALLS:
+            if self.error_rate() >= self.error_rate_threshold:
+                self._open()
+
+    def _open(self):
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.times_opened += 1
+        print(f"🔌 [BREAKER] {self.name}: OPEN for {self.open_seconds}s (error rate {self.error_rate():.0%})")
+
+    def error_rate(self) -> float:
+        if not self._outcomes:
+            return 0.0
+        return 1 - sum(self._outcomes) / len(self._outcomes)
+
+    def stats(self) -> Dict:
+        return {
+            "state": self.state,
+            "error_rate": round(self.error_rate(), 3),
+            "window_calls": len(self._outcomes),
+            "latency_ms": round(self.latency_ms, 1) if self.latency_ms is not None else None,
+            "times_opened": self.times_opened,
+            "short_circuited": self.short_circuited,
+            "budget_fallbacks": self.budget_fallbacks,
+            "open_for_seconds": round(max(self.open_seconds - (time.monotonic() - self.opened_at), 0), 1)
+            if self.state == OPEN else 0,
+        }
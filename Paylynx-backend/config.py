@@ -3,7 +3,13 @@
 
 from web3 import Web3
 import os
+import asyncio
 from dotenv import load_dotenv
+from rpc_pool import RPCPool
+from token_registry import TokenRegistry, TokenMetadata
+from fee_oracle import FeeOracle, FeeQuote
+from balances import BalanceService
+import calldata
 
 load_dotenv()
 
@@ -18,30 +24,10 @@ RPC_ENDPOINTS = [
     "https://sepolia.base.org",  # Base Sepolia fallback
 ]
 
-def get_web3_with_fallback():
-    """Try connecting to RPC endpoints in order until one works"""
-    for rpc in RPC_ENDPOINTS:
-        if not rpc:
-            continue
-        try:
-            w3_instance = Web3(Web3.HTTPProvider(
-                rpc, 
-                request_kwargs={
-                    'timeout': 10,
-                    'headers': {'User-Agent': 'Paylynx/1.0'}
-                }
-            ))
-            if w3_instance.is_connected():
-                print(f"✅ Connected to RPC: {rpc[:50]}...")
-                return w3_instance
-        except Exception as e:
-            print(f"❌ Failed to connect to {rpc[:50]}: {str(e)}")
-            continue
-    
-    raise Exception("❌ All RPC endpoints failed. Check your network configuration.")
-
-# Initialize Web3
-w3 = get_web3_with_fallback()
+# Offline Web3 instance - used only for checksumming and ABI encoding/decoding.
+# Every network read goes through the async RPC pools below, so handlers never
+# block the event loop on a slow provider.
+w3 = Web3()
 
 # ════════════════════════════════════════════════════════════════
 # NETWORK CONFIGURATIONS
@@ -117,6 +103,24 @@ if ACTIVE_NETWORK not in NETWORKS:
 
 active_config = NETWORKS[ACTIVE_NETWORK]
 
+# ════════════════════════════════════════════════════════════════
+# RPC POOLS (one health-scored pool per network)
+# ════════════════════════════════════════════════════════════════
+
+def _network_endpoints(network: str) -> list:
+    """RPC_ENDPOINTS serve the active network; other networks use their RPC_URL"""
+    if network == ACTIVE_NETWORK:
+        return RPC_ENDPOINTS + [NETWORKS[network].get("RPC_URL")]
+    return [NETWORKS[network].get("RPC_URL")]
+
+rpc_pools = {
+    key: RPCPool(_network_endpoints(key), name=key, chain_id=cfg["CHAIN_ID"])
+    for key, cfg in NETWORKS.items()
+}
+
+# Pool for the active network - the default for every handler
+rpc_pool = rpc_pools[ACTIVE_NETWORK]
+
 print("\n" + "="*60)
 print(f"🌐 ACTIVE NETWORK: {active_config['NAME']}")
 print(f"   Chain ID: {active_config['CHAIN_ID']}")
@@ -251,25 +255,60 @@ ERC20_ABI = [
 # HELPER FUNCTIONS
 # ════════════════════════════════════════════════════════════════
 
-def get_usdc_contract():
-    """Get USDC contract instance for the active network"""
-    return w3.eth.contract(
-        address=w3.to_checksum_address(active_config["USDC_ADDRESS"]),
-        abi=ERC20_ABI
-    )
+# Decimals, symbol, name and chain id per network - loaded once, served from memory
+token_registry = TokenRegistry(w3, NETWORKS, rpc_pools, ERC20_ABI)
 
-def get_balance(address: str) -> float:
-    """Get USDC balance for an address"""
-    try:
-        contract = get_usdc_contract()
-        balance_wei = contract.functions.balanceOf(
-            w3.to_checksum_address(address)
-        ).call()
-        decimals = contract.functions.decimals().call()
-        return balance_wei / (10 ** decimals)
-    except Exception as e:
-        print(f"Error getting balance: {str(e)}")
-        return 0.0
+# Fee data sampled once per block, gas limits estimated once per token contract
+fee_oracle = FeeOracle(rpc_pools, token_registry)
+
+# The fast transfer encoder must agree with web3 before anything is signed with it
+calldata.cross_check(token_registry.contract(ACTIVE_NETWORK))
+
+# Bulk balanceOf via Multicall3 (JSON-RPC batch fallback), cached by block
+balance_service = BalanceService(w3, rpc_pools, token_registry)
+
+def get_usdc_contract(network: str = ACTIVE_NETWORK):
+    """Get USDC contract instance for a network (built once per network)"""
+    return token_registry.contract(network)
+
+def contract_call_params(contract, fn_name: str, *args) -> list:
+    """eth_call params for a view function, ready for pool.call or a batch"""
+    return [
+        {"to": contract.address, "data": contract.encode_abi(fn_name, args=list(args))},
+        "latest"
+    ]
+
+def decode_contract_result(contract, fn_name: str, raw: str):
+    """Decode raw eth_call output using the function's ABI outputs"""
+    output_types = [o["type"] for o in contract.get_function_by_name(fn_name).abi["outputs"]]
+    decoded = w3.codec.decode(output_types, bytes.fromhex(raw[2:]))
+    return decoded[0] if len(decoded) == 1 else decoded
+
+async def call_contract(contract, fn_name: str, *args, pool: RPCPool = None):
+    """Run a view function through the RPC pool and decode its result"""
+    raw = await (pool or rpc_pool).call("eth_call", contract_call_params(contract, fn_name, *args))
+    return decode_contract_result(contract, fn_name, raw)
+
+async def get_chain_id(pool: RPCPool = None) -> int:
+    """Chain ID reported by the RPC"""
+    return int(await (pool or rpc_pool).call("eth_chainId"), 16)
+
+def build_transfer_tx(token: TokenMetadata, recipient: str, amount: float, fees: FeeQuote, gas: int) -> dict:
+    """
+    Build an unsigned ERC20 transfer - no RPC calls. Decimals and chain id
+    come from the token registry, fees and gas limit from the fee oracle.
+    """
+    amount_wei = int(amount * (10 ** token.decimals))
+
+    tx = {
+        "value": 0,
+        "chainId": token.chain_id,
+        "gas": gas,
+        "to": token.address,
+        "data": calldata.encode_transfer(recipient, amount_wei),
+    }
+    tx.update(fees.tx_fields())
+    return tx
 
 def validate_address(address: str) -> bool:
     """Validate if an address is a valid Ethereum address"""
@@ -283,26 +322,27 @@ def validate_address(address: str) -> bool:
 # VERIFY CONFIGURATION ON STARTUP
 # ════════════════════════════════════════════════════════════════
 
-if __name__ == "__main__":
-    print("\n🧪 Testing Configuration...\n")
-    
-    # Test Web3 connection
-    print(f"✅ Web3 Connected: {w3.is_connected()}")
-    print(f"   Chain ID: {w3.eth.chain_id}")
+async def _self_test():
+    # Test RPC connection
+    chain_id = await get_chain_id()
+    print(f"✅ RPC Connected: {rpc_pool.status()['preferred']}")
+    print(f"   Chain ID: {chain_id}")
     
     # Test USDC contract
     try:
-        contract = get_usdc_contract()
-        name = contract.functions.name().call()
-        symbol = contract.functions.symbol().call()
-        decimals = contract.functions.decimals().call()
+        token = await token_registry.ensure(ACTIVE_NETWORK)
         
         print(f"\n✅ USDC Contract Loaded:")
-        print(f"   Name: {name}")
-        print(f"   Symbol: {symbol}")
-        print(f"   Decimals: {decimals}")
+        print(f"   Name: {token.name}")
+        print(f"   Symbol: {token.symbol}")
+        print(f"   Decimals: {token.decimals}")
         print(f"   Address: {active_config['USDC_ADDRESS']}")
     except Exception as e:
         print(f"\n❌ USDC Contract Error: {str(e)}")
-    
-    print("\n" + "="*60 + "\n")
\ No newline at end of file
+    finally:
+        await rpc_pool.close()
+
+if __name__ == "__main__":
+    print("\n🧪 Testing Configuration...\n")
+    asyncio.run(_self_test())
+    print("\n" + "="*60 + "\n")
@@ -0,0 +1,271 @@
+# contact_index.py - Fuzzy lookup of saved contacts by name
+# Each contact list is indexed once (cached by a fingerprint of the list):
+# exact names and name words in a dict, nicknames through alias groups
+# ("mum" -> "mom") and typos through a trigram index, so lookups stay well
+# under a millisecond even for users with thousands of saved accounts.
+
+import os
+import re
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+CONTACT_INDEX_CACHE_SIZE = int(os.getenv("CONTACT_INDEX_CACHE_SIZE", "1000"))  # contact lists kept indexed
+FUZZY_MIN_SIMILARITY = 0.75  # edit-distance similarity needed for a typo match
+FUZZY_CANDIDATES = 20  # trigram candidates verified with edit distance
+MIN_TRIGRAM_DICE = 0.3  # trigram overlap a candidate needs before the edit-distance check
+MIN_FUZZY_LENGTH = 3  # shorter words only match exactly ("to" must not become "tom")
+RESOLVE_MIN_SCORE = 0.5  # weakest match best() still resolves (a misspelled first or last name)
+# Scores: an exact full name is 1.0 and an exact name word 0.9 - the only matches at or
+# above RESOLVE_SCORE. Nicknames ("jack" -> John, "ma" -> Mom) and typos score below it,
+# so they come back as "did you mean" candidates instead of silently picking a payee.
+RESOLVE_SCORE = 0.85  # weakest match that resolves a payee's address without asking
+ALIAS_SCORE = 0.8
+FUZZY_WEIGHT = 0.8  # typo score = FUZZY_WEIGHT * similarity, always below ALIAS_SCORE
+NAME_WORD_PENALTY = 0.1  # "john" -> "John Doe" ranks below a contact named "John"
+
+# Words that mean the same person; any member finds contacts saved under another
+NICKNAME_GROUPS = [
+    {"mom", "mum", "mommy", "mummy", "mama", "mother", "ma", "momma"},
+    {"dad", "daddy", "papa", "pa", "father", "pop", "pops"},
+    {"grandma", "granny", "nana", "grandmother", "gran"},
+    {"grandpa", "granddad", "grandad", "grandfather", "gramps"},
+    {"bro", "brother"},
+    {"sis", "sister"},
+    {"wife", "wifey"},
+    {"husband", "hubby"},
+    {"william", "will", "bill", "billy", "liam"},
+    {"robert", "rob", "bob", "bobby", "robbie"},
+    {"richard", "rick", "ricky", "dick"},
+    {"james", "jim", "jimmy", "jamie"},
+    {"michael", "mike", "mikey", "mick"},
+    {"elizabeth", "liz", "lizzie", "beth", "betty", "eliza"},
+    {"katherine", "catherine", "kate", "katie", "cathy", "kathy"},
+    {"alexander", "alex", "xander"},
+    {"alexandra", "alex", "sandra", "lexi"},
+    {"christopher", "chris", "topher"},
+    {"jonathan", "jon", "jonny", "johnny"},
+    {"john", "johnny", "jack"},
+    {"daniel", "dan", "danny"},
+    {"samuel", "sam", "sammy"},
+    {"samantha", "sam", "sammy"},
+    {"nicholas", "nick", "nicky"},
+    {"thomas", "tom", "tommy"},
+    {"joseph", "joe", "joey"},
+    {"anthony", "tony"},
+    {"margaret", "maggie", "meg", "peggy"},
+    {"jennifer", "jen", "jenny"},
+    {"rebecca", "becky", "becca"},
+]
+
+_ALIASES: Dict[str, set] = {}
+for _group in NICKNAME_GROUPS:
+    for _word in _group:
+        _ALIASES.setdefault(_word, set()).update(_group - {_word})
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def normalize_name(name: str) -> str:
+    return " ".join(_WORD_RE.findall((name or "").lower()))
+
+
+def _trigrams(term: str) -> set:
+    padded = f"  {term} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _similarity(a: str, b: str) -> float:
+    """1 - optimal-string-alignment distance / longer length (transpositions cost 1)"""
+    if a == b:
+        return 1.0
+    la, lb = len(a), len(b)
+    if abs(la - lb) > max(la, lb) * (1 - FUZZY_MIN_SIMILARITY):
+        return 0.0
+    prev2 = None
+    prev = list(range(lb + 1))
+    for i in range(1, la + 1):
+        cur = [i] + [0] * lb
+        for j in range(1, lb + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                cur[j] = min(cur[j], prev2[j - 2] + 1)
+        prev2, prev = prev, cur
+    return 1 - prev[lb] / max(la, lb)
+
+
+class ContactIndex:
+    """Name → contacts index for one contact list"""
+
+    def __init__(self, contacts: List[Dict]):
+        self.contacts = contacts
+        self._terms: List[str] = []
+        self._term_contacts: List[List[Tuple[int, bool]]] = []  # term id -> [(contact idx, is full name)]
+        self._term_ids: Dict[str, int] = {}
+        self._postings: Dict[str, Dict[int, List[int]]] = {}  # trigram -> term length -> term ids
+        self.max_name_words = 0
+
+        for idx, contact in enumerate(contacts):
+            full = normalize_name(contact.get("name"))
+            if not full:
+                continue
+            self._add_term(full, idx, True)
+            words = full.split()
+            self.max_name_words = max(self.max_name_words, len(words))
+            if len(words) > 1:
+                for word in words:
+                    if len(word) >= 2:
+                        self._add_term(word, idx, False)
+
+    def _add_term(self, term: str, idx: int, full: bool):
+        term_id = self._term_ids.get(term)
+        if term_id is None:
+            term_id = len(self._terms)
+            self._term_ids[term] = term_id
+            self._terms.append(term)
+            self._term_contacts.append([])
+            for gram in _trigrams(term):
+                self._postings.setdefault(gram, {}).setdefault(len(term), []).append(term_id)
+        self._term_contacts[term_id].append((idx, full))
+
+    def named(self, name: str) -> List[Dict]:
+        """Contacts whose full name is exactly this (after normalization)"""
+        term_id = self._term_ids.get(normalize_name(name))
+        if term_id is None:
+            return []
+        return [self.contacts[idx] for idx, full in self._term_contacts[term_id] if full]
+
+    def lookup(self, name: str, limit: int = 3, fuzzy: bool = True) -> List[Tuple[Dict, float]]:
+        """Best matching contacts with a score in (0, 1], highest first"""
+        query = normalize_name(name)
+        if not query:
+            return []
+        scores: Dict[int, float] = {}
+
+        def credit(term_id: int, score: float):
+            for idx, full in self._term_contacts[term_id]:
+                value = score if full else score - NAME_WORD_PENALTY
+                if value > scores.get(idx, 0):
+                    scores[idx] = value
+
+        term_id = self._term_ids.get(query)
+        if term_id is not None:
+            credit(term_id, 1.0)
+
+        for alias in _ALIASES.get(query, ()):
+            alias_id = self._term_ids.get(alias)
+            if alias_id is not None:
+                credit(alias_id, ALIAS_SCORE)
+
+        if fuzzy and not scores and len(query) >= MIN_FUZZY_LENGTH:
+            # Only terms whose length could still reach FUZZY_MIN_SIMILARITY
+            slack = int(len(query) * (1 - FUZZY_MIN_SIMILARITY))
+            lengths = range(len(query) - slack, len(query) + slack + 1)
+            shared: Dict[int, int] = {}
+            grams = _trigrams(query)
+            for gram in grams:
+                by_length = self._postings.get(gram)
+                if not by_length:
+                    continue
+                for length in lengths:
+                    for candidate in by_length.get(length, ()):
+                        shared[candidate] = shared.get(candidate, 0) + 1
+            query_grams = len(grams)
+            dice = [
+                (2 * count / (query_grams + len(self._terms[candidate]) + 1), candidate)
+                for candidate, count in shared.items()
+            ]
+            ranked = sorted((d for d in dice if d[0] >= MIN_TRIGRAM_DICE), reverse=True)[:FUZZY_CANDIDATES]
+            for _, candidate in ranked:
+                similarity = _similarity(query, self._terms[candidate])
+                if similarity >= FUZZY_MIN_SIMILARITY:
+                    credit(candidate, FUZZY_WEIGHT * similarity)
+
+        best = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+        return [(self.contacts[idx], round(score, 3)) for idx, score in best]
+
+    def best(self, name: str, min_score: float = RESOLVE_MIN_SCORE) -> Optional[Dict]:
+        """The single clear match for a name, or None if nothing (or several) fit"""
+        matches = self.lookup(name, limit=2)
+        if not matches or matches[0][1] < min_score:
+            return None
+        if len(matches) > 1 and matches[1][1] == matches[0][1]:
+            return None  # two contacts fit equally well - ambiguous
+        return matches[0][0]
+
+    def relevant(self, text: str, k: int) -> List[Dict]:
+        """Up to k contacts mentioned (exactly, by nickname or misspelled) in free text"""
+        words = normalize_name(text).split()
+        # Single words may be misspelled; word pairs only catch exact two-word names
+        queries = [(word, True) for word in words] + [(f"{a} {b}", False) for a, b in zip(words, words[1:])]
+        scores: Dict[int, Tuple[float, Dict]] = {}
+        for query, fuzzy in queries:
+            for contact, score in self.lookup(query, limit=k, fuzzy=fuzzy):
+                key = id(contact)
+                if score > scores.get(key, (0, None))[0]:
+                    scores[key] = (score, contact)
+        ranked = sorted(scores.values(), key=lambda item: -item[0])
+        return [contact for _, contact in ranked[:k]]
+
+
+class ContactIndexCache:
+    """Indexes keyed by a fingerprint of the contact list - rebuilt only when it changes"""
+
+    def __init__(self, max_entries: int = CONTACT_INDEX_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._indexes: "OrderedDict[int, ContactIndex]" = OrderedDict()
+        self.builds = 0
+        self.hits = 0
+
+    def get(self, contacts: Optional[List[Dict]]) -> ContactIndex:
+        contacts = contacts or []
+        fingerprint = hash(tuple((c.get("name"), c.get("address")) for c in contacts))
+        index = self._indexes.get(fingerprint)
+        if index is not None:
+            self._indexes.move_to_end(fingerprint)
+            self.hits += 1
+            return index
+        index = ContactIndex(contacts)
+        self.builds += 1
+        self._indexes[fingerprint] = index
+        while len(self._indexes) > self.max_entries:
+            self._indexes.popitem(last=False)
+        return index
+
+    def stats(self) -> Dict:
+        return {"indexed_lists": len(self._indexes), "builds": self.builds, "hits": self.hits}
+
+
+if __name__ == "__main__":
+    import random
+    import string
+    import time
+
+    random.seed(7)
+    first = ["john", "alice", "bob", "maria", "chen", "fatima", "olu", "priya", "lucas", "emma", "noah", "ade"]
+    contacts = [{"name": "Mom", "address": "0x1"}, {"name": "Jonathan Smith", "address": "0x2"}]
+    for i in range(5000):
+        last = "".join(random.choices(string.ascii_lowercase, k=random.randint(4, 9)))
+        contacts.append({"name": f"{random.choice(first).title()} {last.title()}", "address": f"0x{i:040x}"})
+
+    started = time.perf_counter()
+    index = ContactIndex(contacts)
+    print(f"Indexed {len(contacts)} contacts in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    for query in ["mom", "mum", "ma", "Jonathan Smith", "jonathon", "jon", "smiht", contacts[1234]["name"], "zzz"]:
+        runs = 200
+        started = time.perf_counter()
+        for _ in range(runs):
+            matches = index.lookup(query)
+        per_call = (time.perf_counter() - started) / runs * 1000
+        top = [(c["name"], s) for c, s in matches[:2]]
+        print(f"{query!r:20s} {per_call:6.3f} ms  {top}")
+
+    # Only exact names and exact name words may resolve a payee
+    for query, resolves in [("mom", True), ("jonathan smith", True), ("ma", False), ("mum", False),
+                            ("jon", False), ("johnny", False), ("jonathon", False), ("jonathan smiht", False)]:
+        assert (index.best(query, min_score=RESOLVE_SCORE) is not None) == resolves, query
+
+    started = time.perf_counter()
+    picked = index.relevant("please send 50 to mum and jonathon", 8)
+    print(f"relevant(): {(time.perf_counter() - started) * 1000:.3f} ms → {[c['name'] for c in picked]}")
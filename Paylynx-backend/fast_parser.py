@@ -0,0 +1,403 @@
+# fast_parser.py - Deterministic intent parser that runs before the model
+# Simple commands ("send 50 to mom", "check my balance", "pay 0xabc... 20")
+# are parsed with fixed verbs, amount grammar and the user's saved contacts.
+# Every word of a money command has to be accounted for (verb, amount, owned
+# currency, exact contact); a leftover word or symbol sends it to Gemini.
+
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+from contact_index import ContactIndex, ContactIndexCache, normalize_name
+
+FAST_PATH_ENABLED = os.getenv("FAST_PATH_ENABLED", "true").lower() == "true"
+FAST_PATH_MIN_CONFIDENCE = float(os.getenv("FAST_PATH_MIN_CONFIDENCE", "0.9"))
+MAX_COMMAND_WORDS = 12  # longer balance/history/contacts prompts go to the model
+
+ADDRESS_RE = re.compile(r"\b0x[a-fA-F0-9]{40}\b")
+EMAIL_RE = re.compile(r"\b[\w.+-]+@[\w-]+(?:\.[\w-]+)+\b")
+TOKEN_RE = re.compile(r"\$?\d[\d,]*(?:\.\d+)?k?\b|[a-z]+(?:'[a-z]+)?|\?")
+DIGIT_AMOUNT_RE = re.compile(r"^\$?(\d{1,3}(?:,\d{3})+|\d+)(\.\d+)?(k?)$")
+# Anything besides tokens and plain punctuation (€, £, %, "-50", "'s" split off, emoji) defers to the model
+UNREAD_RE = re.compile(r"[^\s.,!:;]")
+
+UNITS = {
+    "zero": 0, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7,
+    "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12, "thirteen": 13,
+    "fourteen": 14, "fifteen": 15, "sixteen": 16, "seventeen": 17, "eighteen": 18, "nineteen": 19,
+}
+TENS = {
+    "twenty": 20, "thirty": 30, "forty": 40, "fifty": 50,
+    "sixty": 60, "seventy": 70, "eighty": 80, "ninety": 90,
+}
+SCALES = {"hundred": 100, "thousand": 1000}
+
+# Every other word in a money command must be one of these - an unknown currency
+# ("yen", "cents"), scale ("million"), possessive ("mom's friend") or trailing
+# remark ("lol jk") is left over, and a leftover means the model decides
+CURRENCY_WORDS = {"usdc", "usd", "dollar", "dollars", "buck", "bucks"}
+FILLER_WORDS = {"please", "pls", "now", "the", "my"}
+COMMAND_WORDS = {
+    "send_money": {"send", "pay", "transfer", "give", "tip", "wire", "to"},
+    "request_money": {"request", "charge", "invoice", "ask", "collect", "from", "for"},
+    "split_bill": {
+        "split", "divide", "go", "halves", "with", "between", "among", "and", "me", "myself",
+        "evenly", "equally", "bill", "dinner", "lunch", "tab", "check",
+    },
+}
+# Vocabulary of the fixed balance/history/contacts phrases ("check balance of bob" is not one)
+INFO_WORDS = {
+    "check", "show", "see", "view", "get", "list", "display", "tell", "please", "pls", "can", "you",
+    "me", "my", "i", "the", "all", "current", "what", "what's", "whats", "is", "how", "much",
+    "money", "usdc", "cash", "do", "have", "got", "in", "wallet", "account", "funds", "balance",
+    "history", "transaction", "transactions", "activity", "statement", "recent", "past", "previous",
+    "last", "payments", "transfers", "contact", "contacts", "address", "book", "saved",
+    "recipients", "people", "accounts", "addresses", "?",
+}
+
+SEND_VERBS = {"send", "pay", "transfer", "give", "tip", "wire"}
+REQUEST_RE = re.compile(r"\b(request|charge|invoice)\b|\bask \w+(?: \w+)? for\b|\bcollect from\b")
+SPLIT_RE = re.compile(r"\b(split|divide)\b|\bgo halves\b")
+SCHEDULE_RE = re.compile(
+    r"\b(schedule|scheduled|every|daily|weekly|monthly|yearly|recurring|tomorrow|tonight|later)\b"
+    r"|\bnext (week|month|year|monday|tuesday|wednesday|thursday|friday|saturday|sunday)\b"
+    r"|\bon (the )?\d+(st|nd|rd|th)\b|\b\d+\s*(am|pm)\b|\bin \d+ (days?|weeks?|hours?)\b"
+)
+BALANCE_RE = re.compile(
+    r"\bbalance\b|\bhow much (money |usdc |cash )?(do i have|have i got|is in my (wallet|account))\b"
+    r"|\bwhat do i have\b|\bmy funds\b"
+)
+HISTORY_RE = re.compile(
+    r"\b(history|transactions|activity|statement)\b"
+    r"|\b(recent|past|previous|last) (payments|transfers|transactions)\b"
+    r"|\b(what|how much|who) did i (send|pay|spend|receive)\b|\bshow (me )?my (payments|transfers)\b"
+)
+CONTACTS_RE = re.compile(
+    r"\b(contacts?|address book)\b|\bsaved (recipients|people|accounts|addresses)\b"
+)
+# References the deterministic parser can't resolve on its own
+AMBIGUOUS_RE = re.compile(
+    r"\b(him|her|them|it|again|same|usual|last|previous|someone|everyone)\b"
+    r"|\b(not|don't|dont|never|cancel|undo|stop|unless|if|or|maybe|instead|should|could|would)\b"
+)
+
+
+def _words_to_number(words: List[str]) -> Optional[int]:
+    """["one", "hundred", "and", "twenty"] -> 120"""
+    total, current = 0, 0
+    for word in words:
+        if word in UNITS:
+            current += UNITS[word]
+        elif word in TENS:
+            current += TENS[word]
+        elif word == "hundred":
+            current = max(current, 1) * 100
+        elif word == "thousand":
+            total += max(current, 1) * 1000
+            current = 0
+        elif word not in ("and", "a", "an"):
+            return None
+    return total + current
+
+
+def scan_amounts(tokens: List[str]) -> List[Tuple[float, int, int]]:
+    """(value, start, end) of every amount written in digits ("$1,200.50", "5k") or words ("twenty five")"""
+    amounts = []
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        match = DIGIT_AMOUNT_RE.match(token)
+        if match:
+            value = float(match.group(1).replace(",", "") + (match.group(2) or ""))
+            amounts.append((value * 1000 if match.group(3) else value, i, i + 1))
+            i += 1
+            continue
+
+        is_article = token in ("a", "an") and i + 1 < len(tokens) and tokens[i + 1] in SCALES
+        if token in UNITS or token in TENS or token in SCALES or is_article:
+            run = [token]
+            j = i + 1
+            while j < len(tokens) and (
+                tokens[j] in UNITS or tokens[j] in TENS or tokens[j] in SCALES
+                or (tokens[j] == "and" and j + 1 < len(tokens) and (tokens[j + 1] in UNITS or tokens[j + 1] in TENS))
+            ):
+                run.append(tokens[j])
+                j += 1
+            value = _words_to_number(run)
+            if value is not None and run != ["a"] and run != ["an"]:
+                amounts.append((float(value), i, j))
+            i = j
+            continue
+        i += 1
+    return amounts
+
+
+def extract_amounts(tokens: List[str]) -> List[float]:
+    """Every amount in the tokens"""
+    return [value for value, _, _ in scan_amounts(tokens)]
+
+
+def scan_contacts(tokens: List[str], index: ContactIndex) -> List[Tuple[List[Dict], int, int]]:
+    """(contacts, start, end) of saved contact names in the tokens - whole words, longest name wins"""
+    found = []
+    i = 0
+    while i < len(tokens):
+        for n in range(min(index.max_name_words, len(tokens) - i), 0, -1):
+            span = tokens[i:i + n]
+            # "mom's" normalizes to "mom s" - a possessive is never the contact itself
+            contacts = index.named(" ".join(span)) if all(t.isalpha() for t in span) else []
+            if contacts:
+                found.append((contacts, i, i + n))
+                i += n
+                break
+        else:
+            i += 1
+    return found
+
+
+def match_contacts(text: str, index: ContactIndex) -> List[Dict]:
+    """Saved contacts named in the text"""
+    matched: List[Dict] = []
+    for contacts, _, _ in scan_contacts(normalize_name(text).split(), index):
+        matched.extend(c for c in contacts if c not in matched)
+    return matched
+
+
+def _result(intent: str, confidence: float, reasoning: str, entities: Dict, suggested_action: str) -> Dict:
+    return {
+        "intent_type": intent,
+        "confidence": confidence,
+        "reasoning": reasoning,
+        "extracted_entities": entities,
+        "requires_clarification": False,
+        "clarification_questions": [],
+        "suggested_action": suggested_action,
+    }
+
+
+class FastIntentParser:
+    """Rule-based parser for unambiguous commands, with hit-rate counters"""
+
+    def __init__(self, min_confidence: float = FAST_PATH_MIN_CONFIDENCE,
+                 contact_indexes: Optional[ContactIndexCache] = None):
+        self.min_confidence = min_confidence
+        self.contact_indexes = contact_indexes or ContactIndexCache()
+        self.attempts = 0
+        self.hits = 0
+        self.by_intent: Dict[str, int] = {}
+
+    def parse(self, prompt: str, user_contacts: Optional[List[Dict]] = None) -> Optional[Dict]:
+        """IntentAnalysis fields for a confident parse, otherwise None (ask the model)"""
+        self.attempts += 1
+        result = self._parse(prompt, self.contact_indexes.get(user_contacts))
+        if result is None or result["confidence"] < self.min_confidence:
+            return None
+        self.hits += 1
+        self.by_intent[result["intent_type"]] = self.by_intent.get(result["intent_type"], 0) + 1
+        return result
+
+    def _parse(self, prompt: str, index: ContactIndex) -> Optional[Dict]:
+        text = prompt.strip().lower().replace("\u2019", "'")
+        addresses = list(dict.fromkeys(m.group(0) for m in ADDRESS_RE.finditer(prompt)))
+        emails = list(dict.fromkeys(m.group(0).lower() for m in EMAIL_RE.finditer(prompt)))
+        # Digits inside addresses/emails must not be read as amounts
+        stripped = EMAIL_RE.sub(" ", ADDRESS_RE.sub(" ", text))
+        if UNREAD_RE.search(TOKEN_RE.sub(" ", stripped)):
+            return None
+        tokens = TOKEN_RE.findall(stripped)
+        words = set(tokens)
+
+        families = set()
+        if words & COMMAND_WORDS["send_money"] - {"to"}:
+            families.add("send_money")
+        if REQUEST_RE.search(stripped):
+            families.add("request_money")
+        if SPLIT_RE.search(stripped):
+            families.add("split_bill")
+        if BALANCE_RE.search(stripped):
+            families.add("check_balance")
+        if HISTORY_RE.search(stripped):
+            families.add("view_history")
+        if CONTACTS_RE.search(stripped):
+            families.add("manage_contacts")
+
+        if len(families) != 1 or SCHEDULE_RE.search(stripped):
+            return None  # no verb, mixed signals, or dates to interpret
+        intent = families.pop()
+
+        if intent in ("check_balance", "view_history", "manage_contacts"):
+            if len(tokens) > MAX_COMMAND_WORDS or addresses or emails or words - INFO_WORDS:
+                return None  # amounts, names or anything else mean there's more to it
+            actions = {
+                "check_balance": "Fetch wallet balance",
+                "view_history": "Show recent transactions",
+                "manage_contacts": "Show saved contacts",
+            }
+            return _result(intent, 0.95, f"Fixed command phrase for {intent}", {}, actions[intent])
+
+        # Money movement - every detail has to be explicit, and every word accounted for
+        if AMBIGUOUS_RE.search(stripped) or "?" in words:
+            return None
+        # Exact names only - a nickname or typo guess is not "explicit" enough to skip the model
+        contact_spans = scan_contacts(tokens, index)
+        consumed = {i for _, start, end in contact_spans for i in range(start, end)}
+        rest = [t if i not in consumed else "" for i, t in enumerate(tokens)]
+        amount_spans = scan_amounts(rest)
+        consumed.update(i for _, start, end in amount_spans for i in range(start, end))
+        known = CURRENCY_WORDS | FILLER_WORDS | COMMAND_WORDS[intent]
+        if any(i not in consumed and t not in known for i, t in enumerate(tokens)):
+            return None
+
+        # Exactly one amount span - "send 50 50 to mom" is a typo or two payments, not $50
+        if len(amount_spans) != 1 or amount_spans[0][0] <= 0:
+            return None
+        value = amount_spans[0][0]
+        amount = int(value) if value.is_integer() else value
+        named: List[Dict] = []
+        for contacts, _, _ in contact_spans:
+            named.extend(c for c in contacts if c not in named)
+
+        if intent == "split_bill":
+            return self._split(stripped, amount, named, index)
+
+        recipients = len(named) + len(addresses) + len(emails)
+        if recipients != 1:
+            return None
+
+        entities: Dict = {"amount": amount, "token": "USDC"}
+        if named:
+            entities["recipient_name"] = named[0].get("name")
+            if named[0].get("address"):
+                entities["recipient_address"] = named[0]["address"]
+            source = f"saved contact '{named[0].get('name')}'"
+        elif addresses:
+            entities["recipient_address"] = addresses[0]
+            source = "explicit wallet address"
+        else:
+            entities["recipient_email"] = emails[0]
+            source = f"email {emails[0]}"
+
+        if intent == "request_money":
+            return _result(intent, 0.9, f"Request verb with amount ({amount}) from {source}",
+                           entities, "Create payment request")
+        return _result(intent, 0.95, f"Send verb with amount ({amount}) to {source}", entities,
+                       "Resolve email to wallet, then prepare transaction" if emails
+                       else "Prepare transaction with extracted data")
+
+    def _split(self, text: str, total: float, named: List[Dict], index: ContactIndex) -> Optional[Dict]:
+        """"split 120 with alice and bob" - every participant must be a saved contact"""
+        match = re.search(r"\b(?:with|between|among)\s+(.+)$", text)
+        if not match or not named:
+            return None
+        parts = [p.strip() for p in re.split(r",|\band\b|&", match.group(1)) if p.strip()]
+        if not parts or any(not index.named(p) and p not in ("me", "myself") for p in parts):
+            return None
+        recipients = [c.get("name") for c in named]
+        share = round(total / (len(recipients) + 1), 2)
+        return _result("split_bill", 0.9, f"Split {total} between you and {len(recipients)} saved contacts", {
+            "total_amount": total,
+            "token": "USDC",
+            "recipients": recipients,
+            "amount_per_person": share,
+            "user_pays": share,
+        }, "Prepare one transfer per participant")
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": FAST_PATH_ENABLED,
+            "attempts": self.attempts,
+            "hits": self.hits,
+            "skip_rate": round(self.hits / self.attempts, 3) if self.attempts else 0.0,
+            "by_intent": dict(self.by_intent),
+        }
+
+
+if __name__ == "__main__":
+    # Synthetic, hand-written corpus: what the fast path must parse and what it must
+    # leave to the model. Its hit count says nothing about a production skip rate.
+    contacts = [
+        {"name": "Mom", "address": "0x1111111111111111111111111111111111111111"},
+        {"name": "Dad", "address": "0x2222222222222222222222222222222222222222"},
+        {"name": "Alice", "address": "0x3333333333333333333333333333333333333333"},
+        {"name": "Bob", "address": "0x4444444444444444444444444444444444444444"},
+        {"name": "John Doe", "address": "0x5555555555555555555555555555555555555555"},
+        {"name": "Landlord", "address": "0x6666666666666666666666666666666666666666"},
+    ]
+    parsed = {
+        # prompt: (intent, amount, recipient name / address / email)
+        "send 50 to mom": ("send_money", 50, "Mom"),
+        "Send $20 to Alice": ("send_money", 20, "Alice"),
+        "pay bob 15": ("send_money", 15, "Bob"),
+        "transfer 100 usdc to dad": ("send_money", 100, "Dad"),
+        "send fifty dollars to mom": ("send_money", 50, "Mom"),
+        "give alice twenty five bucks": ("send_money", 25, "Alice"),
+        "pay the landlord 1,200": ("send_money", 1200, "Landlord"),
+        "send 0.5 to bob": ("send_money", 0.5, "Bob"),
+        "tip alice 5": ("send_money", 5, "Alice"),
+        "send $1k to dad": ("send_money", 1000, "Dad"),
+        "pay john doe 40": ("send_money", 40, "John Doe"),
+        "send 25 to 0x9f8E0c1b7A8D4F3e2B1C0d9E8F7a6B5c4D3e2F10":
+            ("send_money", 25, "0x9f8E0c1b7A8D4F3e2B1C0d9E8F7a6B5c4D3e2F10"),
+        "pay sarah@example.com 30": ("send_money", 30, "sarah@example.com"),
+        "send one hundred and twenty to mom": ("send_money", 120, "Mom"),
+        "wire 300 dollars to landlord": ("send_money", 300, "Landlord"),
+        "Send 10 USDC to Bob.": ("send_money", 10, "Bob"),
+        "request 20 from bob": ("request_money", 20, "Bob"),
+        "charge alice 35": ("request_money", 35, "Alice"),
+        "split 120 with alice and bob": ("split_bill", 120, None),
+        "split $90 dinner between mom, dad": ("split_bill", 90, None),
+        "check my balance": ("check_balance", None, None),
+        "what's my balance": ("check_balance", None, None),
+        "how much money do i have": ("check_balance", None, None),
+        "balance": ("check_balance", None, None),
+        "show my transaction history": ("view_history", None, None),
+        "show me my payments": ("view_history", None, None),
+        "recent transfers": ("view_history", None, None),
+        "show my contacts": ("manage_contacts", None, None),
+        "list saved recipients": ("manage_contacts", None, None),
+    }
+    model_only = [
+        # references, conditions, schedules, several amounts or recipients
+        "send him 20", "pay john back the 20 bucks I owe", "send 50 to mom and 20 to dad",
+        "send 50 50 to mom", "pay bob 20 twenty",
+        "send the same amount again", "pay rent on the 1st of every month", "send money to mom",
+        "send 50 to someone", "schedule 100 to dad next friday", "don't send anything to bob",
+        "pay bob 20 or 30 whatever he asked", "send 40 to carol", "what did i send last week",
+        "remind me to pay alice tomorrow", "split the bill",
+        # currencies, fractions and scales the parser doesn't own
+        "can you send 5 eth to bob", "pay mom 50 cents", "send 2 million to mom", "send 50 pounds to mom",
+        "send 50 gbp to mom", "send 50 naira to mom", "send mom 50 yen", "send €50 to mom",
+        "send £50 to mom", "send half of 100 to bob", "send -50 to mom", "send 5 quarters to dad",
+        # possessives and other leftovers after the recipient
+        "send 50 to mom's friend", "send 50 to bob's wife", "send 50 to bob’s wife", "send 50 to moms friend",
+        "send 50 to mom lol jk", "pay bob 20 for the pizza", "send 50 to mom 🙂",
+        "check balance of bob", "show bob's transactions", "show my balance in eur",
+        # not commands
+        "how do I add a new wallet?", "is it safe to send to an exchange?", "hi",
+        "what tokens do you support", "I owe alice for lunch", "what's the fee for sending 100?",
+    ]
+
+    def recipient(entities: Dict) -> Optional[str]:
+        return entities.get("recipient_name") or entities.get("recipient_address") or entities.get("recipient_email")
+
+    parser = FastIntentParser()
+    failures = []
+    for prompt, (intent, amount, to) in parsed.items():
+        result = parser.parse(prompt, contacts)
+        entities = result["extracted_entities"] if result else {}
+        got = (result["intent_type"], entities.get("amount", entities.get("total_amount")), recipient(entities)) if result else None
+        print(f"{prompt[:45]:45s} {got}")
+        if got != (intent, amount, to):
+            failures.append(f"{prompt!r}: expected {(intent, amount, to)}, got {got}")
+    for prompt in model_only:
+        result = parser.parse(prompt, contacts)
+        print(f"{prompt[:45]:45s} {'→ model' if result is None else result['extracted_entities']}")
+        if result is not None:
+            failures.append(f"{prompt!r}: must go to the model, parsed as {result['intent_type']} {result['extracted_entities']}")
+
+    stats = parser.stats()
+    print(f"\n{stats['hits']}/{stats['attempts']} synthetic prompts parsed without the model")
+    for intent, count in sorted(stats["by_intent"].items()):
+        print(f"   {intent:15s} {count}")
+    assert not failures, "\n".join(failures)
+    print("All fast-path expectations hold")
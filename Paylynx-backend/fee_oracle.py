@@ -0,0 +1,200 @@
+# fee_oracle.py - Per-block fee sampling and cached gas limits
+# Fee data is sampled once per block for each network in use and gas limits
+# for transfer / transferWithMemo are estimated once per token contract, so
+# preparing a transaction needs no fee or gas RPCs of its own.
+
+import os
+import time
+import asyncio
+from typing import Dict, Iterable, Optional, Tuple
+
+from rpc_pool import RPCPool, RPCBatch
+from token_registry import TokenRegistry
+import calldata
+
+FEE_REFRESH_INTERVAL = float(os.getenv("FEE_REFRESH_INTERVAL", "2"))  # seconds, roughly one block
+FEE_MAX_STALENESS = 30.0  # seconds before a cached quote is refreshed inline
+FEE_HOT_WINDOW = 300.0  # networks used within this window keep being sampled
+FEE_HISTORY_BLOCKS = 5
+FEE_REWARD_PERCENTILE = 50
+
+DEFAULT_GAS_LIMIT = 150_000  # used when estimation fails
+GAS_LIMIT_MULTIPLIER = 1.2
+# Estimates use a zero-value transfer; a real one may also create the
+# recipient's balance slot (a fresh SSTORE), so that cost is added on top.
+NEW_BALANCE_SLOT_GAS = 20_000
+GAS_ESTIMATE_RETRY = 300.0  # seconds before a failed estimate is retried
+ESTIMATE_SENDER = "0x000000000000000000000000000000000000dEaD"
+ESTIMATE_RECIPIENT = "0x0000000000000000000000000000000000000001"
+
+
+class FeeQuote:
+    """Fee data sampled at one block"""
+
+    def __init__(self, network: str, block_number: int, base_fee: Optional[int],
+                 priority_fee: int, gas_price: int):
+        self.network = network
+        self.block_number = block_number
+        self.base_fee = base_fee  # next block's base fee; None on legacy chains
+        self.priority_fee = priority_fee
+        self.gas_price = gas_price
+        self.sampled_at = time.monotonic()
+
+    def tx_fields(self) -> Dict:
+        """Fee fields to stamp onto an unsigned transaction"""
+        if self.base_fee is None:
+            return {"gasPrice": self.gas_price}
+        return {
+            "maxPriorityFeePerGas": self.priority_fee,
+            "maxFeePerGas": self.priority_fee + 2 * self.base_fee,
+        }
+
+    def to_dict(self) -> Dict:
+        return {
+            "block_number": self.block_number,
+            "base_fee": self.base_fee,
+            "priority_fee": self.priority_fee,
+            "gas_price": self.gas_price,
+            "age_seconds": round(time.monotonic() - self.sampled_at, 1),
+        }
+
+
+class FeeOracle:
+    """Keeps a fresh FeeQuote per network and gas limits per token contract"""
+
+    def __init__(self, pools: Dict[str, RPCPool], registry: TokenRegistry):
+        self.pools = pools
+        self.registry = registry
+        self._quotes: Dict[str, FeeQuote] = {}
+        self._gas_limits: Dict[Tuple[str, str, str], Tuple[int, float]] = {}  # -> (limit, retry_at)
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._last_used: Dict[str, float] = {}
+        self._pinned: set = set()
+        self._task: Optional[asyncio.Task] = None
+        self.samples = 0
+
+    # ── Fees ──────────────────────────────────────────
+
+    async def get_fees(self, network: str) -> FeeQuote:
+        """Latest cached quote; sampled inline only when cold or stale"""
+        self._last_used[network] = time.monotonic()
+        quote = self._quotes.get(network)
+        if quote is not None and time.monotonic() - quote.sampled_at < FEE_MAX_STALENESS:
+            return quote
+        return await self.refresh(network)
+
+    async def refresh(self, network: str) -> FeeQuote:
+        lock = self._locks.setdefault(network, asyncio.Lock())
+        async with lock:
+            quote = self._quotes.get(network)
+            if quote is not None and time.monotonic() - quote.sampled_at < FEE_REFRESH_INTERVAL:
+                return quote  # another caller just sampled
+
+            async with RPCBatch(self.pools[network]) as batch:
+                history = batch.add("eth_feeHistory", [
+                    hex(FEE_HISTORY_BLOCKS), "latest", [FEE_REWARD_PERCENTILE]
+                ])
+                gas_price = batch.add("eth_gasPrice")
+                block = batch.add("eth_blockNumber")  # feeHistory names the block too, but not on legacy chains
+
+            quote = self._quote_from(network, history, int(gas_price.result(), 16), block)
+            previous = self._quotes.get(network)
+            if (
+                previous is not None and quote.block_number >= 0
+                and previous.block_number == quote.block_number
+                and previous.tx_fields() == quote.tx_fields()
+            ):
+                previous.sampled_at = quote.sampled_at  # same block, nothing new
+            else:
+                self._quotes[network] = quote
+                self.samples += 1
+            return self._quotes[network]
+
+    def _quote_from(self, network: str, history: asyncio.Future, gas_price: int,
+                    block: asyncio.Future) -> FeeQuote:
+        if history.exception():
+            # eth_feeHistory unsupported - treat the chain as legacy
+            block_number = -1 if block.exception() else int(block.result(), 16)
+            return FeeQuote(network, block_number, None, 0, gas_price)
+
+        data = history.result()
+        base_fees = [int(fee, 16) for fee in data.get("baseFeePerGas") or []]
+        rewards = sorted(int(r[0], 16) for r in data.get("reward") or [] if r)
+        block_count = max(len(base_fees) - 1, 0)
+        block_number = int(data["oldestBlock"], 16) + block_count - 1
+
+        if not any(base_fees):
+            return FeeQuote(network, block_number, None, 0, gas_price)
+
+        priority_fee = rewards[len(rewards) // 2] if rewards else max(gas_price - base_fees[-1], 0)
+        return FeeQuote(network, block_number, base_fees[-1], priority_fee, gas_price)
+
+    # ── Gas limits ────────────────────────────────────
+
+    async def gas_limit(self, network: str, method: str = "transfer") -> int:
+        """Cached gas limit for transfer / transferWithMemo on the network's token"""
+        contract = self.registry.contract(network)
+        key = (network, contract.address, method)
+        cached = self._gas_limits.get(key)
+        if cached is not None and (cached[1] == 0 or time.monotonic() < cached[1]):
+            return cached[0]
+
+        if method == "transferWithMemo":
+            data = calldata.encode_transfer_with_memo(ESTIMATE_RECIPIENT, 0, b"")
+        else:
+            data = calldata.encode_transfer(ESTIMATE_RECIPIENT, 0)
+        try:
+            estimate = int(await self.pools[network].call("eth_estimateGas", [{
+                "from": ESTIMATE_SENDER,
+                "to": contract.address,
+                "data": data,
+            }]), 16)
+            limit = int(estimate * GAS_LIMIT_MULTIPLIER) + NEW_BALANCE_SLOT_GAS
+            self._gas_limits[key] = (limit, 0)
+            print(f"⛽ [FEE ORACLE] {network} {method}: estimate {estimate}, limit {limit}")
+        except Exception as e:
+            limit = DEFAULT_GAS_LIMIT
+            self._gas_limits[key] = (limit, time.monotonic() + GAS_ESTIMATE_RETRY)
+            print(f"⚠️ [FEE ORACLE] Gas estimate failed for {network} {method}, using {limit}: {e}")
+        return limit
+
+    # ── Background sampling ───────────────────────────
+
+    def start(self, networks: Iterable[str] = ()):
+        """Sample pinned networks (and any network used recently) every block"""
+        self._pinned.update(networks)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _hot_networks(self) -> set:
+        now = time.monotonic()
+        recent = {n for n, used in self._last_used.items() if now - used < FEE_HOT_WINDOW}
+        return self._pinned | recent
+
+    async def _run(self):
+        while True:
+            async def sample(network: str):
+                try:
+                    await self.refresh(network)
+                except Exception as e:
+                    print(f"❌ [FEE ORACLE] {network}: {type(e).__name__}: {e}")
+
+            await asyncio.gather(*(sample(n) for n in self._hot_networks()))
+            await asyncio.sleep(FEE_REFRESH_INTERVAL)
+
+    def status(self) -> Dict:
+        return {
+            "samples": self.samples,
+            "hot_networks": sorted(self._hot_networks()),
+            "quotes": {n: q.to_dict() for n, q in self._quotes.items()},
+            "gas_limits": {f"{n}:{m}": limit for (n, _, m), (limit, _) in self._gas_limits.items()},
+        }
@@ -0,0 +1,117 @@
+# intent_cache.py - Cache of IntentAnalysis results
+# Chat prompts repeat a lot ("check my balance", "send 50 to mom"), so model
+# answers are cached under the normalized prompt plus hashes of the contacts
+# and recent history the model saw. Bounded LRU with a TTL per entry, plus
+# single-flight so identical prompts already in flight share one model call.
+
+import os
+import re
+import json
+import time
+import asyncio
+import hashlib
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+INTENT_CACHE_SIZE = int(os.getenv("INTENT_CACHE_SIZE", "5000"))  # cached analyses per worker
+INTENT_CACHE_TTL = float(os.getenv("INTENT_CACHE_TTL", "600"))  # seconds an analysis is reused
+INTENT_HISTORY_WINDOW = 3  # trailing conversation messages included in the prompt
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_TRAILING_PUNCT_RE = re.compile(r"[\s.!?,;]+$")
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Lowercase, collapse whitespace and drop trailing punctuation"""
+    prompt = _WHITESPACE_RE.sub(" ", prompt.strip().lower())
+    return _TRAILING_PUNCT_RE.sub("", prompt)
+
+
+def _digest(value: Any) -> str:
+    raw = json.dumps(value, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.blake2b(raw.encode(), digest_size=8).hexdigest()
+
+
+def cache_key(prompt: str, contact_names: List[str], history: Optional[List[Dict]]) -> str:
+    """Key over exactly what the model sees: prompt, contact names and the history window"""
+    contacts = sorted({name.strip().lower() for name in contact_names if name})
+    window = [
+        (msg.get("role", "user"), msg.get("content", ""))
+        for msg in (history or [])[-INTENT_HISTORY_WINDOW:]
+    ]
+    return f"{normalize_prompt(prompt)}|{_digest(contacts)}|{_digest(window)}"
+
+
+class IntentCache:
+    """LRU + TTL cache from cache_key() to an analysis"""
+
+    def __init__(self, max_entries: int = INTENT_CACHE_SIZE, ttl: float = INTENT_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at, value)
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry[0] <= time.monotonic():
+            del self._entries[key]
+            self.expired += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key: str, value: Any):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+class SingleFlight:
+    """Concurrent calls with the same key share one in-flight execution"""
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, make_call: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            self.leaders += 1
+            task = asyncio.ensure_future(make_call())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.coalesced += 1
+        # Shielded so one caller disconnecting doesn't cancel the call for the others
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict:
+        return {
+            "in_flight": len(self._inflight),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+        }
@@ -0,0 +1,71 @@
+# intent_stream.py - Server-sent events for streamed intent analysis
+# The model streams its JSON answer in chunks; fields are emitted as SSE
+# events the moment they are complete in the buffer (intent type first, then
+# entities, then clarification), before the whole object has arrived.
+
+import re
+import json
+from typing import Dict, List, Tuple
+
+# Event name -> fields it carries (the first one triggers the event), in the
+# order the chat UI wants them
+STREAM_EVENTS = {
+    "intent": ["intent_type", "confidence"],
+    "entities": ["extracted_entities"],
+    "clarification": ["clarification_questions", "requires_clarification"],
+}
+
+_decoder = json.JSONDecoder()
+
+
+def sse_event(event: str, data) -> str:
+    """One text/event-stream frame"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def complete_field(buffer: str, field: str) -> Tuple[bool, object]:
+    """(True, value) once the field's value is fully present in a partial JSON buffer"""
+    match = re.search(r'"' + re.escape(field) + r'"\s*:\s*', buffer)
+    if not match:
+        return False, None
+    try:
+        value, end = _decoder.raw_decode(buffer, match.end())
+    except json.JSONDecodeError:
+        return False, None
+    if end >= len(buffer):
+        return False, None  # a number at the very end may still be growing ("0." -> "0.95")
+    return True, value
+
+
+class StreamedAnalysis:
+    """Accumulates streamed model text and reports newly completed events"""
+
+    def __init__(self):
+        self.buffer = ""
+        self.sent: Dict[str, Dict] = {}
+
+    def feed(self, chunk: str) -> List[Tuple[str, Dict]]:
+        self.buffer += chunk
+        ready = []
+        for event, fields in STREAM_EVENTS.items():
+            if event in self.sent:
+                continue
+            found, value = complete_field(self.buffer, fields[0])
+            if not found:
+                continue
+            data = {fields[0]: value}
+            for extra in fields[1:]:
+                extra_found, extra_value = complete_field(self.buffer, extra)
+                if extra_found:
+                    data[extra] = extra_value
+            self.sent[event] = data
+            ready.append((event, data))
+        return ready
+
+    def remaining(self, analysis: Dict) -> List[Tuple[str, Dict]]:
+        """Events not streamed yet, taken from the final analysis"""
+        return [
+            (event, {field: analysis.get(field) for field in fields})
+            for event, fields in STREAM_EVENTS.items()
+            if event not in self.sent
+        ]
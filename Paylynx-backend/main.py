@@ -5,14 +5,22 @@
 import os
 import json
 import re
+import math
+import time
 import base64
-from datetime import datetime
+import asyncio
+from datetime import datetime, timedelta, timezone
 from typing import Dict, List, Optional, Tuple
 from enum import Enum
 from tip403_policy import TIP403PolicyChecker
+from policy_cache import PolicySettingsCache, InvalidationBus
+from spend_ledger import SpendLedger
+from policy_rules import backtest
+from dateutil.parser import isoparse
 from dotenv import load_dotenv
 from fastapi import FastAPI, HTTPException, Depends, status, Request, APIRouter
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, field_validator
 from jose import jwt, JWTError
 import requests
@@ -26,7 +34,12 @@ if not SUPABASE_URL or not SUPABASE_ANON_KEY:
     raise ValueError("SUPABASE_URL and SUPABASE_ANON_KEY must be set in .env")
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
 
-policy_checker = TIP403PolicyChecker(supabase)  # Pass supabase to checker for user-specific settings
+# Policy settings are cached per worker; writes invalidate the other workers' copies
+policy_settings_cache = PolicySettingsCache()
+policy_invalidations = InvalidationBus(policy_settings_cache)
+# Daily spend is reserved in a ledger shared by all workers and surviving restarts
+spend_ledger = SpendLedger()
+policy_checker = TIP403PolicyChecker(supabase, policy_settings_cache, policy_invalidations, spend_ledger)  # Pass supabase to checker for user-specific settings
 
 PRIVY_APP_ID = os.getenv("PRIVY_APP_ID")
 if not PRIVY_APP_ID:
@@ -40,6 +53,21 @@ if not GEMINI_API_KEY:
 MAX_TRANSACTION_AMOUNT = float(os.getenv("MAX_TRANSACTION_AMOUNT", "10000"))
 RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
 
+# Minimum confidence before /agent/analyze-and-prepare builds a transaction
+PREPARE_MIN_CONFIDENCE = float(os.getenv("PREPARE_MIN_CONFIDENCE", "0.85"))
+
+# BATCH INTENT ANALYSIS
+MAX_BATCH_PROMPTS = int(os.getenv("MAX_BATCH_PROMPTS", "5000"))
+BATCH_INTENT_CONCURRENCY = int(os.getenv("BATCH_INTENT_CONCURRENCY", "8"))
+
+# Payments per /policy/check-batch request
+MAX_POLICY_BATCH = int(os.getenv("MAX_POLICY_BATCH", "500"))
+
+# POLICY BACKTEST
+BACKTEST_MAX_DAYS = 366
+BACKTEST_MAX_PAYMENTS = int(os.getenv("BACKTEST_MAX_PAYMENTS", "100000"))  # history rows replayed at most
+BACKTEST_PAGE_SIZE = 1000  # PostgREST's default row cap per request
+
 # MOCK MODE
 MOCK_PRIVY_LOOKUP = os.getenv("MOCK_PRIVY_LOOKUP", "false").lower() == "true"
 
@@ -81,22 +109,62 @@ async def verify_privy_token(request: Request) -> Dict:
 import google.generativeai as genai
 genai.configure(api_key=GEMINI_API_KEY)
 
-# Use the advanced Flash model for reasoning
-gemini_model = genai.GenerativeModel(
-    "gemini-2.5-flash",
-    generation_config=genai.types.GenerationConfig(
-        temperature=0.2,  # Lower for more consistent reasoning
-        top_p=0.95,
-        top_k=40,
-        max_output_tokens=2048,
-    )
-)
+from model_limiter import ModelLimiter, ModelOverloaded
+
+# Async model calls, bounded per worker so other requests keep being served
+gemini_limiter = ModelLimiter("gemini")
+
+from intent_cache import IntentCache, SingleFlight, cache_key, INTENT_HISTORY_WINDOW
+
+# Model answers for repeated prompts (same contacts + recent history)
+intent_cache = IntentCache()
+
+# Identical prompts arriving together (double taps, retries) share one model call
+intent_flight = SingleFlight()
+
+from circuit_breaker import CircuitBreaker
+from prompt_budget import PromptStats, select_contacts
+
+# Skip Gemini while it is failing; never wait longer than the budget for an answer
+reasoning_breaker = CircuitBreaker("gemini")
+INTENT_LATENCY_BUDGET = float(os.getenv("INTENT_LATENCY_BUDGET_MS", "4000")) / 1000
+if reasoning_breaker.slow_call_ms > INTENT_LATENCY_BUDGET * 1000:
+    # Calls between the two would fall back on every request without ever opening the breaker
+    raise ValueError("BREAKER_SLOW_CALL_MS must not exceed INTENT_LATENCY_BUDGET_MS")
+
+from contact_index import ContactIndexCache, RESOLVE_SCORE
+from fast_parser import FastIntentParser, FAST_PATH_ENABLED
+from intent_stream import StreamedAnalysis, sse_event
+
+# Fuzzy name lookup over each user's saved contacts, rebuilt only when the list changes
+contact_indexes = ContactIndexCache()
+
+# Unambiguous commands are parsed deterministically and never reach Gemini
+fast_parser = FastIntentParser(contact_indexes=contact_indexes)
 
 # ────────────────────────────────────────────────
 # Web3 Setup
 # ────────────────────────────────────────────────
 
-from config import w3, active_config, ERC20_ABI
+from config import (
+    w3, active_config, ERC20_ABI, ACTIVE_NETWORK, rpc_pool, rpc_pools,
+    NETWORKS, token_registry, fee_oracle, balance_service, build_transfer_tx
+)
+from balances import MAX_BULK_ADDRESSES
+from receipt_cache import ReceiptCache, format_receipt
+from receipt_tracker import ReceiptTracker
+from transfer_indexer import TransferIndexer
+
+# Confirmed receipts never change - cache them (memory + optional disk tier)
+receipt_cache = ReceiptCache()
+
+# Resolves pending rows in the transactions table as new blocks arrive
+receipt_tracker = ReceiptTracker(supabase, rpc_pool, cache=receipt_cache)
+
+# Local index of on-chain Transfer events for the active token
+transfer_indexer = TransferIndexer(
+    w3, rpc_pool, ACTIVE_NETWORK, token_registry.contract(ACTIVE_NETWORK).address, ERC20_ABI
+)
 
 # ────────────────────────────────────────────────
 # Intent Classification
@@ -130,6 +198,17 @@ class UserPrompt(BaseModel):
         if len(v) > 2000: raise ValueError("Prompt too long")
         return v
 
+class BatchIntentRequest(BaseModel):
+    prompts: List[UserPrompt]
+    concurrency: Optional[int] = None
+
+    @field_validator("prompts")
+    @classmethod
+    def validate_prompts(cls, v: List[UserPrompt]):
+        if len(v) < 1: raise ValueError("At least one prompt required")
+        if len(v) > MAX_BATCH_PROMPTS: raise ValueError(f"At most {MAX_BATCH_PROMPTS} prompts per batch")
+        return v
+
 class ReasoningStep(BaseModel):
     step_number: int
     description: str
@@ -143,6 +222,7 @@ class IntentAnalysis(BaseModel):
     requires_clarification: bool
     clarification_questions: List[str] = []
     suggested_action: str
+    source: str = "model"  # model | fast_path | fallback
 
 class PrepareTxRequest(BaseModel):
     amount: float
@@ -181,6 +261,13 @@ class TransactionCreate(BaseModel):
     amount: float
     recipient: str
     recipient_name: Optional[str] = None
+    reservation_id: Optional[str] = None  # from policy_check at prepare time
+
+    @field_validator("amount")
+    @classmethod
+    def validate_amount(cls, v: float):
+        if not (math.isfinite(v) and v > 0): raise ValueError("Amount must be a positive number")
+        return v
 
 class TransactionResponse(BaseModel):
     id: str
@@ -191,6 +278,17 @@ class TransactionResponse(BaseModel):
     status: str
     created_at: str
 
+class BalanceRequest(BaseModel):
+    addresses: List[str]
+    network: Optional[str] = None
+
+    @field_validator("addresses")
+    @classmethod
+    def validate_addresses(cls, v: List[str]):
+        if len(v) < 1: raise ValueError("At least one address required")
+        if len(v) > MAX_BULK_ADDRESSES: raise ValueError(f"At most {MAX_BULK_ADDRESSES} addresses per request")
+        return v
+
 class PolicySettings(BaseModel):
     enabled: bool
     max_single_payment: float
@@ -199,6 +297,47 @@ class PolicySettings(BaseModel):
     night_max_payment: float
     night_hour_start: int
     night_hour_end: int
+    # Rule engine (policy_rules.py) - all off unless set
+    denylist: List[str] = []
+    allowlist: List[str] = []
+    recipient_caps: Dict[str, float] = {}
+    max_per_recipient_daily: Optional[float] = None
+    velocity_max_payments: Optional[int] = None
+    velocity_window_minutes: int = 60
+    new_recipient_cooling_hours: Optional[float] = None
+    new_recipient_max_payment: float = 50.0
+
+class PolicyCheckPayment(BaseModel):
+    amount: float
+    recipient: str
+    scheduled_at: Optional[datetime] = None  # default: now
+
+class PolicyCheckBatch(BaseModel):
+    payments: List[PolicyCheckPayment]
+
+    @field_validator("payments")
+    @classmethod
+    def validate_payments(cls, v: List[PolicyCheckPayment]):
+        if len(v) < 1: raise ValueError("At least one payment required")
+        if len(v) > MAX_POLICY_BATCH: raise ValueError(f"At most {MAX_POLICY_BATCH} payments per request")
+        return v
+
+class PolicyBacktestRequest(BaseModel):
+    settings: PolicySettings
+    days: int = 365  # history replayed
+    max_affected: int = 100  # affected payments listed in the response
+
+    @field_validator("days")
+    @classmethod
+    def validate_days(cls, v: int):
+        if not 1 <= v <= BACKTEST_MAX_DAYS: raise ValueError(f"days must be between 1 and {BACKTEST_MAX_DAYS}")
+        return v
+
+    @field_validator("max_affected")
+    @classmethod
+    def validate_max_affected(cls, v: int):
+        if not 0 <= v <= 1000: raise ValueError("max_affected must be between 0 and 1000")
+        return v
 
 class BasicProfileUpdate(BaseModel):
     display_name: Optional[str] = None
@@ -316,6 +455,7 @@ async def get_user_profile(user: Dict = Depends(verify_privy_token)):
 
         if not create_response.data or len(create_response.data) == 0:
             raise HTTPException(500, detail="Failed to create profile")
+        await asyncio.to_thread(policy_checker.settings_updated, user_id, new_profile["policy_settings"])
 
         print(f" ✅ Profile created: @{unique_username}")
         print("="*60 + "\n")
@@ -448,6 +588,7 @@ async def update_policy_settings(
 
         if not result.data:
             raise HTTPException(404, detail="Profile not found")
+        await asyncio.to_thread(policy_checker.settings_updated, user_id, settings.dict())
 
         print(f" ✅ Policy settings updated successfully")
         print("="*60 + "\n")
@@ -507,35 +648,38 @@ async def delete_user_profile(user: Dict = Depends(verify_privy_token)):
 # Advanced Intent Parsing with Chain-of-Thought
 # ────────────────────────────────────────────────
 
-async def analyze_intent_with_reasoning(
+REASONING_CONFIG = genai.types.GenerationConfig(
+    temperature=0.2,  # Lower for more consistent reasoning
+    top_p=0.95,
+    top_k=40,
+    max_output_tokens=1500,
+    response_mime_type="application/json"
+)
+
+def quick_intent_analysis(
     prompt: str,
     conversation_history: List[Dict] = None,
     user_contacts: List[Dict] = None
-) -> IntentAnalysis:
-    """
-    Advanced intent analysis using chain-of-thought reasoning.
-    Understands context, ambiguity, and complex requests.
-    """
-    print("\n" + "="*60)
-    print("🧠 [ADVANCED INTENT ANALYSIS] Starting...")
-    print("="*60)
-    print(f" → User prompt: '{prompt}'")
+) -> Tuple[Optional[IntentAnalysis], str]:
+    """Fast-path parse or cached answer, if any, plus the cache key for a model call"""
+    if FAST_PATH_ENABLED:
+        fast = fast_parser.parse(prompt, user_contacts)
+        if fast is not None:
+            print(f" ⚡ Fast path → Intent: {fast['intent_type']}, entities: {list(fast['extracted_entities'].keys())}")
+            print("="*60 + "\n")
+            return IntentAnalysis(**fast, source="fast_path"), ""
 
-    # Build context
-    contacts_context = ""
-    if user_contacts:
-        contact_names = [c.get('name', '') for c in user_contacts]
-        contacts_context = f"\n\nUser's saved contacts: {', '.join(contact_names)}"
-        print(f" → Available contacts: {contact_names}")
+    contact_names = [c.get('name', '') for c in select_contacts(prompt, contact_indexes.get(user_contacts))]
+    key = cache_key(prompt, contact_names, conversation_history)
+    cached = intent_cache.get(key)
+    if cached is not None:
+        print(f" ⚡ Cache hit → Intent: {cached.intent_type}")
+        print("="*60 + "\n")
+        return cached.model_copy(deep=True), key
 
-    history_context = ""
-    if conversation_history:
-        history_context = "\n\nRecent conversation:\n"
-        for msg in conversation_history[-3:]:  # Last 3 messages
-            history_context += f"- {msg.get('role', 'user')}: {msg.get('content', '')}\n"
-        print(f" → Using {len(conversation_history[-3:])} messages of context")
+    return None, key
 
-    system_prompt = f"""You are an advanced AI reasoning system for a crypto payment application called Paylynx.
+REASONING_INSTRUCTIONS = """You are an advanced AI reasoning system for a crypto payment application called Paylynx.
 
 Your task is to analyze user input and extract payment intent with deep reasoning.
 
@@ -572,39 +716,36 @@ AMBIGUITY HANDLING:
 
 EXAMPLES:
 Input: "send 50 to mom"
-Output: {{
+Output: {
 "intent_type": "send_money",
 "confidence": 0.95,
 "reasoning": "Clear send intent with amount (50) and recipient name (mom). User likely has 'mom' saved as contact.",
-"extracted_entities": {{
+"extracted_entities": {
 "amount": 50,
 "token": "USDC",
 "recipient_name": "mom"
-}},
+},
 "requires_clarification": false,
 "suggested_action": "Check if 'mom' is in saved contacts. If yes, prepare transaction. If no, ask for address/email."
-}}
+}
 
 Input: "pay john back the 20 bucks I owe"
-Output: {{
+Output: {
 "intent_type": "send_money",
 "confidence": 0.9,
 "reasoning": "Payment intent with amount (20) and recipient (john). Context suggests this is repayment.",
-"extracted_entities": {{
+"extracted_entities": {
 "amount": 20,
 "token": "USDC",
 "recipient_name": "john",
 "note": "repayment"
-}},
+},
 "requires_clarification": false,
 "suggested_action": "Check for contact 'john', proceed with transaction"
-}}
-
-{contacts_context}{history_context}
-
-Now analyze this user input and return ONLY valid JSON following the schema above:
+}
 
-User input: "{prompt}"
+For each user input (with the user's saved contacts and recent conversation, when
+relevant), return ONLY valid JSON following the schema above.
 
 Think step by step:
 1. What is the user trying to do?
@@ -614,31 +755,147 @@ Think step by step:
 5. Do I need to ask for clarification?
 
 Return your analysis as JSON:
+"""
+
+# Static instructions are the system instruction - an identical prefix on every
+# call, which the API caches - so requests only send their dynamic part
+reasoning_model = genai.GenerativeModel("gemini-2.5-flash", system_instruction=REASONING_INSTRUCTIONS)
+
+# Prompt tokens per model call, so prompt-size changes are measurable
+prompt_stats = PromptStats(REASONING_INSTRUCTIONS)
+
+def build_reasoning_prompt(
+    prompt: str,
+    conversation_history: List[Dict] = None,
+    user_contacts: List[Dict] = None
+) -> str:
+    """Per-request prompt: relevant contacts, recent conversation and the input"""
+    relevant = select_contacts(prompt, contact_indexes.get(user_contacts))
+    prompt_stats.record_contacts(len(user_contacts or []), len(relevant))
 
+    contacts_context = ""
+    if relevant:
+        contact_names = [c.get('name', '') for c in relevant]
+        contacts_context = f"User's saved contacts: {', '.join(contact_names)}\n\n"
+        print(f" → Relevant contacts: {contact_names} (of {len(user_contacts)})")
+
+    history_context = ""
+    if conversation_history:
+        window = conversation_history[-INTENT_HISTORY_WINDOW:]
+        history_context = "Recent conversation:\n"
+        for msg in window:
+            history_context += f"- {msg.get('role', 'user')}: {msg.get('content', '')}\n"
+        history_context += "\n"
+        print(f" → Using {len(window)} messages of context")
+
+    return f"""{contacts_context}{history_context}User input: "{prompt}"
 """
 
+def parse_model_json(text: str) -> Dict:
+    """Parse the model's JSON answer, stripping a markdown fence if present"""
+    text = text.strip()
+    if text.startswith("```"):
+        lines = text.split('\n')
+        text = '\n'.join(lines[1:-1]).strip()
+        if text.startswith("json"):
+            text = text[4:].strip()
+    return json.loads(text)
+
+async def analyze_intent_with_reasoning(
+    prompt: str,
+    conversation_history: List[Dict] = None,
+    user_contacts: List[Dict] = None
+) -> IntentAnalysis:
+    """
+    Advanced intent analysis using chain-of-thought reasoning.
+    Understands context, ambiguity, and complex requests.
+    """
+    print("\n" + "="*60)
+    print("🧠 [ADVANCED INTENT ANALYSIS] Starting...")
+    print("="*60)
+    print(f" → User prompt: '{prompt}'")
+
+    analysis, key = quick_intent_analysis(prompt, conversation_history, user_contacts)
+    if analysis is not None:
+        return analysis
+
+    request_prompt = build_reasoning_prompt(prompt, conversation_history, user_contacts)
+
+    analysis = await intent_flight.do(
+        key, lambda: reason_with_model(request_prompt, prompt, key, user_contacts)
+    )
+    return analysis.model_copy(deep=True)
+
+async def reason_with_model(
+    request_prompt: str,
+    prompt: str,
+    key: str,
+    user_contacts: List[Dict] = None
+) -> IntentAnalysis:
+    """
+    Gemini answer for a cache key within the latency budget. Falls back to
+    the regex parser when the breaker is open, the budget runs out or the
+    call fails. A call that outlives the budget still fills the cache.
+    Time spent queued for a limiter slot is never held against Gemini.
+    """
+    if not reasoning_breaker.allow():
+        print(" ⛔ Reasoning breaker open → skipping Gemini")
+        return fallback_to_legacy_parse(prompt, user_contacts)
+
+    overran = asyncio.Event()
+    granted = asyncio.get_running_loop().create_future()  # set to the monotonic time the slot was granted
+    call = asyncio.ensure_future(call_reasoning_model(request_prompt, key, overran, granted))
+    done, _ = await asyncio.wait({call}, timeout=INTENT_LATENCY_BUDGET)
+    if not done:
+        if not granted.done():
+            call.cancel()  # still queued behind our own traffic - says nothing about Gemini
+            print(f" ⏳ No Gemini slot within {INTENT_LATENCY_BUDGET}s budget")
+        elif (time.monotonic() - granted.result()) * 1000 >= reasoning_breaker.slow_call_ms:
+            overran.set()  # the breaker counts this call now, not when it finally ends
+            reasoning_breaker.record_budget_fallback()
+            print(f" ⏱️ No answer within {INTENT_LATENCY_BUDGET}s budget")
+        else:
+            print(f" ⏱️ No answer within {INTENT_LATENCY_BUDGET}s budget (call still running)")
+        print(f" → Falling back to legacy parser...")
+        return fallback_to_legacy_parse(prompt, user_contacts)
+
+    analysis = call.result()
+    if analysis is None:
+        print(f" → Falling back to legacy parser...")
+        return fallback_to_legacy_parse(prompt, user_contacts)
+    return analysis
+
+async def call_reasoning_model(request_prompt: str, key: str, overran: Optional[asyncio.Event] = None,
+                               granted: Optional[asyncio.Future] = None) -> Optional[IntentAnalysis]:
+    """One Gemini call; caches and returns the analysis, or None on failure"""
+    model_ms = 0.0  # time inside generate_content_async - the only latency the breaker sees
+
+    def record(healthy: bool):
+        if overran is not None and overran.is_set():
+            return  # already recorded as a budget overrun
+        if healthy:
+            reasoning_breaker.record_success(model_ms)
+        else:
+            reasoning_breaker.record_failure()
+
     try:
         print(" → Calling Gemini with advanced reasoning prompt...")
-        response = gemini_model.generate_content(
-            system_prompt,
-            generation_config=genai.types.GenerationConfig(
-                temperature=0.2,
-                max_output_tokens=1500,
-                response_mime_type="application/json"
+        async with gemini_limiter.slot():
+            started = time.monotonic()
+            if granted is not None:
+                granted.set_result(started)
+            response = await asyncio.wait_for(
+                reasoning_model.generate_content_async(request_prompt, generation_config=REASONING_CONFIG),
+                gemini_limiter.call_timeout
             )
-        )
+            model_ms = (time.monotonic() - started) * 1000
+        prompt_stats.record(request_prompt, getattr(response, "usage_metadata", None))
 
         text = response.text.strip()
         print(f" ← Gemini response length: {len(text)} characters")
 
-        # Clean markdown if present
-        if text.startswith("```"):
-            lines = text.split('\n')
-            text = '\n'.join(lines[1:-1]).strip()
-            if text.startswith("json"):
-                text = text[4:].strip()
-
-        parsed = json.loads(text)
+        parsed = parse_model_json(text)
+        analysis = IntentAnalysis(**{**parsed, "source": "model"})
         print(f" ✅ Analysis complete")
         print(f" → Intent: {parsed.get('intent_type', 'unknown')}")
         print(f" → Confidence: {parsed.get('confidence', 0)}")
@@ -646,17 +903,137 @@ Return your analysis as JSON:
         print(f" → Extracted entities: {list(parsed.get('extracted_entities', {}).keys())}")
         print("="*60 + "\n")
 
-        return IntentAnalysis(**parsed)
+        record(True)
+        intent_cache.put(key, analysis.model_copy(deep=True))  # only model answers are cached
+        return analysis
 
     except json.JSONDecodeError as e:
         print(f" ❌ JSON decode error: {e}")
-        print(f" → Falling back to legacy parser...")
-        return fallback_to_legacy_parse(prompt, user_contacts)
+        record(False)
+
+    except ModelOverloaded as e:
+        print(f" ⏳ Gemini unavailable: {e}")
+        reasoning_breaker.release()  # our own limiter is full - no verdict on the model
+
+    except asyncio.TimeoutError:
+        print(" ⏳ Gemini call timed out")
+        record(False)
+
+    except asyncio.CancelledError:
+        if overran is None or not overran.is_set():
+            reasoning_breaker.release()  # cancelled by us, not failed by the model
+        raise
 
     except Exception as e:
         print(f" ❌ Error in advanced analysis: {type(e).__name__}: {e}")
-        print(f" → Falling back to legacy parser...")
-        return fallback_to_legacy_parse(prompt, user_contacts)
+        record(False)
+
+    return None
+
+async def stream_intent_analysis(
+    prompt: str,
+    conversation_history: List[Dict] = None,
+    user_contacts: List[Dict] = None
+):
+    """
+    Server-sent events for one analysis: intent, entities and clarification
+    as soon as the model has produced each of them, then the full analysis.
+    The final "analysis" event is authoritative (e.g. after a fallback).
+    """
+    print("\n" + "="*60)
+    print("📡 [STREAMING INTENT ANALYSIS] Starting...")
+    print("="*60)
+    print(f" → User prompt: '{prompt}'")
+
+    stream = StreamedAnalysis()
+    analysis, key = quick_intent_analysis(prompt, conversation_history, user_contacts)
+    if analysis is None and not reasoning_breaker.allow():
+        print(" ⛔ Reasoning breaker open → skipping Gemini")
+        analysis = fallback_to_legacy_parse(prompt, user_contacts)
+
+    if analysis is None:
+        request_prompt = build_reasoning_prompt(prompt, conversation_history, user_contacts)
+        try:
+            print(" → Streaming Gemini response...")
+            async with gemini_limiter.slot():
+                started = time.monotonic()
+                loop = asyncio.get_running_loop()
+                deadline = loop.time() + gemini_limiter.call_timeout
+                response = await asyncio.wait_for(
+                    reasoning_model.generate_content_async(
+                        request_prompt, generation_config=REASONING_CONFIG, stream=True
+                    ),
+                    gemini_limiter.call_timeout
+                )
+                chunks = response.__aiter__()
+                chunk = None
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), max(deadline - loop.time(), 0))
+                    except StopAsyncIteration:
+                        break
+                    for event, data in stream.feed(chunk.text):
+                        yield sse_event(event, data)
+                model_ms = (time.monotonic() - started) * 1000
+                prompt_stats.record(request_prompt, getattr(chunk, "usage_metadata", None))
+
+            analysis = IntentAnalysis(**{**parse_model_json(stream.buffer), "source": "model"})
+            reasoning_breaker.record_success(model_ms)
+            intent_cache.put(key, analysis.model_copy(deep=True))
+            print(f" ✅ Streamed analysis complete → Intent: {analysis.intent_type}")
+        except (asyncio.CancelledError, GeneratorExit):
+            reasoning_breaker.release()  # the client disconnected - says nothing about the model
+            raise
+        except ModelOverloaded as e:
+            reasoning_breaker.release()  # our own limiter is full - no verdict on the model
+            print(f" ⏳ Gemini unavailable: {e}")
+            print(f" → Falling back to legacy parser...")
+            analysis = fallback_to_legacy_parse(prompt, user_contacts)
+        except Exception as e:
+            reasoning_breaker.record_failure()
+            print(f" ❌ Streaming analysis failed: {type(e).__name__}: {e}")
+            print(f" → Falling back to legacy parser...")
+            analysis = fallback_to_legacy_parse(prompt, user_contacts)
+
+    result = analysis.model_dump()
+    for event, data in stream.remaining(result):
+        yield sse_event(event, data)
+    yield sse_event("analysis", result)
+    yield sse_event("done", {})
+
+async def stream_batch_analysis(prompts: List[UserPrompt], concurrency: int):
+    """
+    NDJSON lines in completion order, at most `concurrency` analyses at a
+    time. The result queue is bounded, so a slow reader pauses the workers
+    instead of buffering the whole batch.
+    """
+    started = time.monotonic()
+    results: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+    indexes = iter(range(len(prompts)))
+    print(f"📦 [BATCH INTENT] {len(prompts)} prompts, concurrency {concurrency}")
+
+    async def worker():
+        for i in indexes:
+            item = prompts[i]
+            try:
+                analysis = await analyze_intent_with_reasoning(
+                    item.prompt, item.conversation_history, item.user_contacts
+                )
+                line = {"index": i, "analysis": analysis.model_dump()}
+            except Exception as e:
+                line = {"index": i, "error": f"{type(e).__name__}: {e}"}
+            await results.put(line)
+
+    workers = [asyncio.create_task(worker()) for _ in range(min(concurrency, len(prompts)))]
+    try:
+        for _ in range(len(prompts)):
+            yield json.dumps(await results.get(), default=str) + "\n"
+        elapsed_ms = round((time.monotonic() - started) * 1000)
+        print(f"📦 [BATCH INTENT] Done: {len(prompts)} prompts in {elapsed_ms} ms")
+        yield json.dumps({"done": True, "total": len(prompts), "elapsed_ms": elapsed_ms}) + "\n"
+    finally:
+        for task in workers:
+            task.cancel()
 
 def fallback_to_legacy_parse(prompt: str, user_contacts: List[Dict] = None) -> IntentAnalysis:
     """Fallback to regex-based parsing when Gemini fails"""
@@ -683,23 +1060,34 @@ def fallback_to_legacy_parse(prompt: str, user_contacts: List[Dict] = None) -> I
         intent = IntentType.SEND_MONEY
         confidence += 0.2
 
-    # Try to extract recipient name
-    name_match = re.search(r'(?:to|for)\s+([a-zA-Z]+)', prompt.lower())
+    # Try to extract recipient name (up to three words, e.g. "to john doe")
+    name_match = re.search(r'\b(?:to|for)\s+([a-zA-Z]+(?:\s+[a-zA-Z]+){0,2})', prompt.lower())
     recipient_name = None
     if name_match:
-        recipient_name = name_match.group(1)
+        recipient_name = name_match.group(1).split()[0]
         entities["recipient_name"] = recipient_name
         confidence += 0.1
 
-    # Check if it's a saved contact
-    if user_contacts and recipient_name:
-        for contact in user_contacts:
-            if contact.get('name', '').lower() == recipient_name.lower():
+    # Check if it's a saved contact - nicknames ("mum") and typos are suggested, not resolved
+    if user_contacts and name_match:
+        index = contact_indexes.get(user_contacts)
+        words = name_match.group(1).split()
+        for n in range(len(words), 0, -1):
+            matches = index.lookup(" ".join(words[:n]), limit=1)
+            if not matches:
+                continue
+            contact, score = matches[0]
+            if score >= RESOLVE_SCORE:
+                entities["recipient_name"] = contact.get('name')
                 entities["recipient_address"] = contact.get('address')
                 requires_clarification = False
                 confidence = 0.9
-                reasoning = f"Found saved contact '{recipient_name}'"
-                break
+                reasoning = f"Found saved contact '{contact.get('name')}'"
+            else:
+                # A nickname or typo is only a candidate - the user confirms before an address is attached
+                clarification.append(f"Did you mean your contact {contact.get('name')}?")
+                reasoning = f"Closest saved contact to '{recipient_name}' is '{contact.get('name')}'"
+            break
 
     # Try to extract wallet address
     addr_match = re.search(r'(0x[a-fA-F0-9]{40})', prompt)
@@ -734,7 +1122,8 @@ def fallback_to_legacy_parse(prompt: str, user_contacts: List[Dict] = None) -> I
         extracted_entities=entities,
         requires_clarification=requires_clarification,
         clarification_questions=clarification,
-        suggested_action=suggested_action
+        suggested_action=suggested_action,
+        source="fallback"
     )
 
 async def parse_intent(prompt: str) -> dict:
@@ -820,9 +1209,9 @@ async def health_check():
         supabase.table("accounts").select("id").limit(1).execute()
         print(" ✅ Database connected")
 
-        print(" → Checking Web3 connection...")
-        is_connected = w3.is_connected()
-        print(f" ✅ Web3 connected: {is_connected}")
+        print(" → Checking RPC connection...")
+        block_number = int(await rpc_pool.call("eth_blockNumber"), 16)
+        print(f" ✅ RPC connected at block {block_number}")
 
         return {
             "status": "healthy",
@@ -835,6 +1224,63 @@ async def health_check():
         print(f" ❌ Health check failed: {str(e)}")
         raise HTTPException(500, detail=f"Health check failed: {str(e)}")
 
+@app.get("/metrics")
+async def get_metrics():
+    """Runtime metrics for monitoring"""
+    return {
+        "rpc": {network: pool.status() for network, pool in rpc_pools.items()},
+        "tokens": token_registry.status(),
+        "receipt_tracker": receipt_tracker.status(),
+        "receipt_cache": receipt_cache.stats(),
+        "fee_oracle": fee_oracle.status(),
+        "balances": balance_service.stats(),
+        "transfer_indexer": transfer_indexer.status(),
+        "gemini": gemini_limiter.stats(),
+        "intent_cache": intent_cache.stats(),
+        "fast_path": fast_parser.stats(),
+        "contact_indexes": contact_indexes.stats(),
+        "policy_settings_cache": policy_settings_cache.stats(),
+        "policy_invalidations": policy_invalidations.status(),
+        "spend_ledger": spend_ledger.status(),
+        "intent_single_flight": intent_flight.stats(),
+        "reasoning_breaker": reasoning_breaker.stats(),
+        "prompt_tokens": prompt_stats.stats(),
+    }
+
+@app.on_event("startup")
+async def prewarm_token_registry():
+    await token_registry.prewarm()
+
+@app.on_event("startup")
+async def start_receipt_tracker():
+    receipt_tracker.start()
+
+@app.on_event("startup")
+async def start_fee_oracle():
+    fee_oracle.start([ACTIVE_NETWORK])
+
+@app.on_event("startup")
+async def start_transfer_indexer():
+    transfer_indexer.start()
+
+@app.on_event("startup")
+async def start_policy_invalidations():
+    policy_invalidations.start()
+
+@app.on_event("startup")
+async def start_spend_ledger():
+    spend_ledger.start()
+
+@app.on_event("shutdown")
+async def close_rpc_pools():
+    await receipt_tracker.stop()
+    await fee_oracle.stop()
+    await transfer_indexer.stop()
+    await policy_invalidations.stop()
+    await spend_ledger.stop()
+    for pool in rpc_pools.values():
+        await pool.close()
+
 @app.post("/agent/parse-intent")
 async def parse_user_intent(request: UserPrompt):
     """Legacy endpoint for backward compatibility"""
@@ -852,6 +1298,62 @@ async def analyze_user_intent(request: UserPrompt):
         request.user_contacts
     )
 
+@app.post("/agent/analyze-intent/stream")
+async def analyze_user_intent_stream(request: UserPrompt):
+    """
+    Streaming variant of /agent/analyze-intent (text/event-stream).
+    Events: intent → entities → clarification → analysis → done
+    """
+    return StreamingResponse(
+        stream_intent_analysis(request.prompt, request.conversation_history, request.user_contacts),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/agent/analyze-intent/batch")
+async def analyze_user_intent_batch(request: BatchIntentRequest):
+    """
+    Analyze many prompts with bounded parallelism (fast path and cache
+    apply per prompt). Streams NDJSON: one {"index", "analysis"|"error"}
+    line per prompt as it completes, then a {"done": true} line.
+    """
+    concurrency = max(1, min(request.concurrency or BATCH_INTENT_CONCURRENCY, BATCH_INTENT_CONCURRENCY))
+    return StreamingResponse(
+        stream_batch_analysis(request.prompts, concurrency),
+        media_type="application/x-ndjson"
+    )
+
+def validate_transfer(amount: float, recipient: str) -> str:
+    """Amount limits and recipient checks; returns the checksummed recipient"""
+    if not math.isfinite(amount) or amount <= 0:
+        raise HTTPException(400, detail="Amount must be greater than 0")
+    if amount > MAX_TRANSACTION_AMOUNT:
+        print(f" ❌ Amount exceeds limit: ${amount:,.2f}")
+        raise HTTPException(
+            400,
+            detail=f"Transaction amount ${amount:,.2f} exceeds maximum allowed (${MAX_TRANSACTION_AMOUNT:,.2f})"
+        )
+    print(f" ✅ Amount OK: ${amount:,.2f}")
+
+    # Validate recipient address
+    try:
+        checksummed = w3.to_checksum_address(recipient)
+        print(f" ✅ Valid address: {checksummed}")
+    except ValueError as e:
+        print(f" ❌ Invalid address: {str(e)}")
+        raise HTTPException(400, detail="Invalid recipient address format")
+
+    if checksummed == "0x0000000000000000000000000000000000000000":
+        raise HTTPException(400, detail="Cannot send to zero address")
+    return checksummed
+
+async def release_reservation(user_id: str, policy_result: Dict):
+    """Give back the daily-limit hold of a prepare that didn't return a transaction"""
+    try:
+        await asyncio.to_thread(policy_checker.release_payment, user_id, policy_result.get("reservation_id"))
+    except Exception as e:
+        print(f" ⚠️ Could not release reservation (expires on its own): {e}")
+
 @app.post("/agent/prepare-transaction", response_model=PrepareTxResponse)
 async def prepare_unsigned_tx(
     request: PrepareTxRequest,
@@ -868,15 +1370,22 @@ async def prepare_unsigned_tx(
     print(f" → Recipient: {request.recipient}")
 
     try:
+        # ═══════════════════════════════════════════════════════════
+        # SECURITY VALIDATION
+        # ═══════════════════════════════════════════════════════════
+        print("\n[Step 1] Security validation...")
+        recipient = validate_transfer(request.amount, request.recipient)
+
         # ═══════════════════════════════════════════════════════════
         # TIP-403 POLICY CHECK
         # ═══════════════════════════════════════════════════════════
-        print("\n[Step 1] TIP-403 Policy Check...")
+        print("\n[Step 2] TIP-403 Policy Check...")
 
-        policy_result = policy_checker.check_payment(
+        policy_result = await asyncio.to_thread(
+            policy_checker.check_payment,
             user_id=user_id,
             amount=request.amount,
-            recipient=request.recipient,
+            recipient=recipient,
             context="AI-initiated payment"
         )
 
@@ -901,54 +1410,29 @@ async def prepare_unsigned_tx(
         print(f" → Daily spent: ${policy_result.get('daily_spent', 0):.2f}")
         print(f" → Daily remaining: ${policy_result.get('daily_remaining', 0):.2f}")
 
-        # ═══════════════════════════════════════════════════════════
-        # SECURITY VALIDATION
-        # ═══════════════════════════════════════════════════════════
-        print("\n[Step 2] Security validation...")
-
-        if request.amount > MAX_TRANSACTION_AMOUNT:
-            print(f" ❌ Amount exceeds limit: ${request.amount:,.2f}")
-            raise HTTPException(
-                400,
-                detail=f"Transaction amount ${request.amount:,.2f} exceeds maximum allowed (${MAX_TRANSACTION_AMOUNT:,.2f})"
-            )
-        print(f" ✅ Amount OK: ${request.amount:,.2f}")
-
-        if request.amount <= 0:
-            raise HTTPException(400, detail="Amount must be greater than 0")
-
-        # Validate recipient address
-        try:
-            recipient = w3.to_checksum_address(request.recipient)
-            print(f" ✅ Valid address: {recipient}")
-        except ValueError as e:
-            print(f" ❌ Invalid address: {str(e)}")
-            raise HTTPException(400, detail="Invalid recipient address format")
-
-        if recipient == "0x0000000000000000000000000000000000000000":
-            raise HTTPException(400, detail="Cannot send to zero address")
-
         # ═══════════════════════════════════════════════════════════
         # BUILD TRANSACTION
         # ═══════════════════════════════════════════════════════════
         print("\n[Step 3] Building transaction...")
-        token_addr = w3.to_checksum_address("0x20c0000000000000000000000000000000000000")
-        contract = w3.eth.contract(address=token_addr, abi=ERC20_ABI)
-        decimals = contract.functions.decimals().call()
-        amount_wei = int(request.amount * (10 ** decimals))
-        tx = contract.functions.transfer(recipient, amount_wei).build_transaction({
-            "chainId": w3.eth.chain_id,
-            "gas": 150_000,
-        })
+        try:
+            token, fees, gas_limit = await asyncio.gather(
+                token_registry.ensure(ACTIVE_NETWORK),
+                fee_oracle.get_fees(ACTIVE_NETWORK),
+                fee_oracle.gas_limit(ACTIVE_NETWORK, "transfer"),
+            )
+            tx = build_transfer_tx(token, recipient, request.amount, fees=fees, gas=gas_limit)
+        except BaseException:
+            await release_reservation(user_id, policy_result)
+            raise
 
         print(f" ✅ Transaction built")
         print("="*60 + "\n")
 
         return PrepareTxResponse(
             tx_data=tx,
-            chain_id=w3.eth.chain_id,
-            token_address=token_addr,
-            estimated_gas=tx.get("gas", 150_000),
+            chain_id=token.chain_id,
+            token_address=token.address,
+            estimated_gas=tx["gas"],
             policy_check=policy_result,
             tip403_compliant=True
         )
@@ -959,11 +1443,239 @@ async def prepare_unsigned_tx(
         print(f"❌ Error: {str(e)}")
         raise HTTPException(500, detail=f"Failed to prepare transaction: {str(e)}")
 
+async def load_user_contacts(user_id: str) -> List[Dict]:
+    """Saved accounts, in the shape the intent engine expects for contacts"""
+    response = await asyncio.to_thread(
+        lambda: supabase.table("accounts")
+        .select("name, address")
+        .eq("user_id", user_id)
+        .execute()
+    )
+    return response.data or []
+
+def resolve_contact_address(entities: Dict, contacts: List[Dict], prompt: str) -> Tuple[Optional[str], Optional[str]]:
+    """
+    (address, source) for a payee the user actually named: a saved contact
+    matched by exact name, or an address typed in the prompt. A model-supplied
+    address that is neither is not trusted.
+    """
+    claimed = (entities.get("recipient_address") or "").lower()
+    name = entities.get("recipient_name")
+    if name:
+        contact = contact_indexes.get(contacts).best(name, min_score=RESOLVE_SCORE)  # no nickname or typo guesses when preparing a transfer
+        if contact and contact.get("address"):
+            if claimed and claimed != contact["address"].lower():
+                return None, None  # the address doesn't belong to the contact the user named
+            return contact["address"], "contact"
+    if claimed and claimed in prompt.lower():
+        return entities["recipient_address"], "address"
+    return None, None
+
+@app.post("/agent/analyze-and-prepare")
+async def analyze_and_prepare(request: UserPrompt, user: Dict = Depends(verify_privy_token)):
+    """
+    Intent analysis plus, for a confident send_money intent, recipient
+    resolution (contacts / Privy), the TIP-403 check and the unsigned
+    transaction - one round trip instead of analyze → accounts → lookup →
+    prepare. "status" says how far it got; "prepared" is set only when a
+    transaction was built.
+    """
+    print("\n" + "="*60)
+    print("⚡ [ANALYZE + PREPARE] Starting...")
+    print("="*60)
+
+    user_id = user.get('sub', 'unknown')
+
+    # Independent of the analysis - start these before the model is called
+    settings_task = asyncio.ensure_future(asyncio.to_thread(policy_checker.get_user_settings, user_id))
+    chain_task = asyncio.gather(
+        token_registry.ensure(ACTIVE_NETWORK),
+        fee_oracle.get_fees(ACTIVE_NETWORK),
+        fee_oracle.gas_limit(ACTIVE_NETWORK, "transfer"),
+    )
+
+    try:
+        contacts = request.user_contacts or await load_user_contacts(user_id)
+        analysis = await analyze_intent_with_reasoning(
+            request.prompt, request.conversation_history, contacts
+        )
+        result = {"analysis": analysis.model_dump(), "recipient": None, "prepared": None}
+
+        entities = analysis.extracted_entities
+        if (
+            analysis.intent_type != IntentType.SEND_MONEY
+            or analysis.requires_clarification
+            or analysis.confidence < PREPARE_MIN_CONFIDENCE
+            or not entities.get("amount")
+            or analysis.source == "fallback"  # the regex fallback's amount is just the first number in the prompt
+        ):
+            print(f" → Not a confident payment ({analysis.intent_type}, {analysis.confidence}, {analysis.source}) - analysis only")
+            result["status"] = "analysis_only"
+            return result
+
+        # Resolve recipient: saved contact → address in the prompt → Privy (email in the prompt)
+        address, source = resolve_contact_address(entities, contacts, request.prompt)
+        email = entities.get("recipient_email")
+        if address is None and email and email.lower() in request.prompt.lower():
+            try:
+                lookup = await asyncio.to_thread(lookup_privy_wallet, email)
+                address, source = lookup["address"], f"privy_{lookup['source']}"
+            except HTTPException as e:
+                result.update(status="unresolved_recipient", reason=e.detail)
+                return result
+        if address is None:
+            who = entities.get("recipient_name") or entities.get("recipient_address") or "the recipient"
+            result.update(status="unresolved_recipient", reason=f"No exact saved contact or address in your message for {who}")
+            return result
+        print(f" ✅ Recipient resolved via {source}: {address}")
+
+        try:
+            amount = float(entities["amount"])
+            recipient = validate_transfer(amount, address)
+        except (TypeError, ValueError):
+            result.update(status="invalid", reason=f"Invalid amount: {entities['amount']}")
+            return result
+        except HTTPException as e:
+            result.update(status="invalid", reason=e.detail)
+            return result
+        result["recipient"] = {"address": recipient, "source": source, "name": entities.get("recipient_name")}
+
+        policy_result = await asyncio.to_thread(
+            policy_checker.check_payment,
+            user_id=user_id,
+            amount=amount,
+            recipient=recipient,
+            context="AI-initiated payment",
+            settings=await settings_task
+        )
+        if not policy_result["allowed"]:
+            print(f" ❌ Payment blocked by TIP-403 policy: {policy_result['reason']}")
+            result.update(status="blocked", reason=policy_result["reason"], policy_check=policy_result)
+            return result
+
+        try:
+            token, fees, gas_limit = await chain_task
+            tx = build_transfer_tx(token, recipient, amount, fees=fees, gas=gas_limit)
+            result["prepared"] = PrepareTxResponse(
+                tx_data=tx,
+                chain_id=token.chain_id,
+                token_address=token.address,
+                estimated_gas=tx["gas"],
+                policy_check=policy_result,
+                tip403_compliant=True
+            ).model_dump()
+        except BaseException:
+            await release_reservation(user_id, policy_result)
+            raise
+        result["status"] = "prepared"
+
+        print(f" ✅ Transaction prepared for {amount} → {recipient}")
+        print("="*60 + "\n")
+        return result
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"❌ Error: {str(e)}")
+        raise HTTPException(500, detail=f"Failed to analyze and prepare: {str(e)}")
+    finally:
+        for task in (settings_task, chain_task):
+            if not task.done():
+                task.cancel()
+            elif not task.cancelled():
+                task.exception()  # mark as retrieved when the result went unused
+
 @app.get("/policy/limits")
 async def get_policy_limits(user: Dict = Depends(verify_privy_token)):
     """Get TIP-403 policy limits and user's current status"""
     user_id = user.get("sub")
-    return policy_checker.get_policy_info(user_id)
+    return await asyncio.to_thread(policy_checker.get_policy_info, user_id)
+
+@app.post("/policy/check-batch")
+async def check_policy_batch(request: PolicyCheckBatch, user: Dict = Depends(verify_privy_token)):
+    """Dry-run TIP-403 checks for several payments at once (split bill, scheduled payouts)"""
+    user_id = user.get("sub")
+    results = await asyncio.to_thread(policy_checker.check_payments, user_id, [
+        {
+            "amount": p.amount,
+            "recipient": p.recipient,
+            "at": p.scheduled_at.timestamp() if p.scheduled_at else None,
+        }
+        for p in request.payments
+    ])
+    allowed = sum(1 for r in results if r["allowed"])
+    return {"allowed": allowed, "blocked": len(results) - allowed, "results": results}
+
+def load_transaction_history(user_id: str, since: datetime) -> List[Dict]:
+    """The user's non-failed transactions since a date, oldest first (paged past the row cap)"""
+    rows: List[Dict] = []
+    while len(rows) < BACKTEST_MAX_PAYMENTS:
+        page = supabase.table("transactions") \
+            .select("tx_hash, amount, recipient, recipient_name, status, created_at") \
+            .eq("user_id", user_id) \
+            .neq("status", "failed") \
+            .gte("created_at", since.isoformat()) \
+            .order("created_at") \
+            .range(len(rows), len(rows) + BACKTEST_PAGE_SIZE - 1) \
+            .execute().data or []
+        rows.extend(page)
+        if len(page) < BACKTEST_PAGE_SIZE:
+            break
+    return rows[:BACKTEST_MAX_PAYMENTS]
+
+@app.post("/policy/backtest")
+async def backtest_policy(request: PolicyBacktestRequest, user: Dict = Depends(verify_privy_token)):
+    """
+    Dry run: which of the user's past payments would candidate settings have
+    blocked? Returns per-rule counts for the candidate and the current
+    settings, plus the affected payments. Nothing is saved.
+    """
+    print("\n" + "="*60)
+    print("🧪 [POLICY BACKTEST] Starting...")
+    print("="*60)
+
+    user_id = user["sub"]
+    since = datetime.now(timezone.utc) - timedelta(days=request.days)
+    history, current = await asyncio.gather(
+        asyncio.to_thread(load_transaction_history, user_id, since),
+        asyncio.to_thread(policy_checker.get_user_settings, user_id),
+    )
+
+    recipients = [tx["recipient"] or "" for tx in history]
+    # Payees first paid before the replayed window are not "new" inside it
+    first_paid = await asyncio.to_thread(policy_checker.first_paid, user_id, list(set(recipients)))
+
+    started = time.perf_counter()
+    amounts = [float(tx["amount"]) for tx in history]
+    times = [isoparse(tx["created_at"]).timestamp() for tx in history]
+    candidate = backtest(request.settings.dict(), amounts, recipients, times, request.max_affected, first_paid)
+    baseline = backtest(current, amounts, recipients, times, 0, first_paid)
+    elapsed_ms = round((time.perf_counter() - started) * 1000, 2)
+
+    for item in candidate["affected"]:
+        tx = history[item.pop("index")]
+        item.update({
+            "tx_hash": tx["tx_hash"],
+            "amount": tx["amount"],
+            "recipient": tx["recipient"],
+            "recipient_name": tx.get("recipient_name"),
+            "created_at": tx["created_at"],
+        })
+
+    print(f" → Replayed {len(history)} payments over {request.days} days in {elapsed_ms} ms")
+    print(f" → Would block {candidate['blocked']} (currently {baseline['blocked']})")
+    print("="*60 + "\n")
+    return {
+        "days": request.days,
+        "payments": candidate["payments"],
+        "blocked": candidate["blocked"],
+        "blocked_amount": candidate["blocked_amount"],
+        "by_rule": candidate["by_rule"],
+        "current": {"blocked": baseline["blocked"], "by_rule": baseline["by_rule"]},
+        "affected": candidate["affected"],
+        "truncated": len(history) >= BACKTEST_MAX_PAYMENTS,
+        "elapsed_ms": elapsed_ms,
+    }
 
 @app.get("/policy/info")
 async def get_policy_framework_info():
@@ -989,7 +1701,7 @@ async def get_tempo_info():
     """Get Tempo network information"""
     return {
         "network": "Tempo Testnet",
-        "chain_id": w3.eth.chain_id,
+        "chain_id": (await token_registry.ensure(ACTIVE_NETWORK)).chain_id,
         "rpc": "Connected to Tempo RPC",
         "features_used": [
             "Instant USDC settlement",
@@ -1020,11 +1732,16 @@ async def record_transaction(tx: TransactionCreate, user: Dict = Depends(verify_
     }
 
     try:
-        response = supabase.table("transactions").insert(data).execute()
+        # Ledger first: the payment is already on chain, and a retry after a failed
+        # insert re-commits the same reservation instead of counting it twice
+        await asyncio.to_thread(policy_checker.record_payment, user["sub"], tx.amount, tx.recipient, tx.reservation_id)
+
+        response = await asyncio.to_thread(lambda: supabase.table("transactions").insert(data).execute())
 
         if not response.data or len(response.data) == 0:
             raise HTTPException(500, detail="Failed to record transaction")
 
+        receipt_tracker.track(tx.tx_hash)
         return {"status": "recorded", "id": str(response.data[0]["id"])}
 
     except Exception as e:
@@ -1045,24 +1762,46 @@ async def list_transactions(limit: int = 20, user: Dict = Depends(verify_privy_t
 
     return response.data
 
+@app.get("/transfers/{address}")
+async def list_onchain_transfers(address: str, limit: int = 50, before_block: Optional[int] = None):
+    """List every on-chain transfer of the active token to or from an address"""
+    if not w3.is_address(address):
+        raise HTTPException(400, detail="Invalid wallet address format")
+    if limit > 500:
+        raise HTTPException(400, detail="Limit cannot exceed 500")
+
+    token = await token_registry.ensure(ACTIVE_NETWORK)
+    transfers = await asyncio.to_thread(transfer_indexer.history, address, limit, before_block)
+    for transfer in transfers:
+        transfer["amount"] = transfer["amount_wei"] / (10 ** token.decimals)
+
+    return {
+        "address": w3.to_checksum_address(address),
+        "network": ACTIVE_NETWORK,
+        "indexed_through_block": await asyncio.to_thread(transfer_indexer.checkpoint),
+        "transfers": transfers
+    }
+
 @app.get("/transaction/{tx_hash}/receipt")
 async def get_receipt(tx_hash: str):
     """Get transaction receipt from blockchain"""
     if not re.match(r'^0x[a-fA-F0-9]{64}$', tx_hash):
         raise HTTPException(400, detail="Invalid transaction hash")
 
-    try:
-        receipt = w3.eth.get_transaction_receipt(tx_hash)
-        status = "success" if receipt["status"] == 1 else "failed"
+    hit, cached = await receipt_cache.get(tx_hash)
+    if hit and cached is not None:
+        return {**cached, "tx_hash": tx_hash}
 
-        return {
-            "tx_hash": tx_hash,
-            "status": status,
-            "gas_used": receipt["gasUsed"],
-            "block_number": receipt["blockNumber"],
-            "confirmed": True
-        }
-    except Exception as e:
+    receipt = None
+    if not hit:
+        try:
+            receipt = await rpc_pool.call("eth_getTransactionReceipt", [tx_hash])
+            if receipt is None:
+                receipt_cache.put_pending(tx_hash)
+        except Exception as e:
+            print(f" ⚠️ Receipt lookup failed for {tx_hash}: {str(e)}")
+
+    if receipt is None:
         return {
             "tx_hash": tx_hash,
             "status": "pending",
@@ -1070,6 +1809,10 @@ async def get_receipt(tx_hash: str):
             "message": "Transaction not yet confirmed"
         }
 
+    result = format_receipt(tx_hash, receipt)
+    await receipt_cache.put_confirmed(tx_hash, result)
+    return result
+
 @app.post("/accounts", response_model=AccountResponse, status_code=201)
 async def create_account(account: AccountCreate, request: Request):
     """Create a new saved account/contact"""
@@ -1174,88 +1917,159 @@ async def delete_account(account_id: str, request: Request):
     except Exception as e:
         raise HTTPException(500, detail=f"Database error: {str(e)}")
 
-@app.post("/privy/lookup-address")
-async def lookup_privy_address(request: Request):
-    """Look up Privy wallet address by email"""
+@app.post("/balances")
+async def get_bulk_balances(request: BalanceRequest):
+    """Get USDC balances for many addresses in one call"""
+    network = request.network or ACTIVE_NETWORK
+    if network not in NETWORKS:
+        raise HTTPException(400, detail=f"Unknown network. Must be one of: {list(NETWORKS.keys())}")
+
+    for address in request.addresses:
+        if not w3.is_address(address):
+            raise HTTPException(400, detail=f"Invalid wallet address format: {address}")
+
     try:
-        print("\n" + "="*60)
-        print("🔍 [PRIVY LOOKUP] Starting...")
+        return await balance_service.get_balances(request.addresses, network)
+    except Exception as e:
+        raise HTTPException(500, detail=f"Balance lookup error: {str(e)}")
 
-        body = await request.json()
-        email = body.get("email")
+@app.get("/portfolio/{address}")
+async def get_portfolio(address: str, networks: Optional[str] = None):
+    """Get an address's USDC balance on every configured network concurrently"""
+    if not w3.is_address(address):
+        raise HTTPException(400, detail="Invalid wallet address format")
 
-        if not email:
-            raise HTTPException(400, detail="Email required")
+    selected = [n.strip() for n in networks.split(",")] if networks else list(NETWORKS.keys())
+    unknown = [n for n in selected if n not in NETWORKS]
+    if unknown:
+        raise HTTPException(400, detail=f"Unknown networks {unknown}. Must be one of: {list(NETWORKS.keys())}")
 
-        if not re.match(r'^[^\s@]+@[^\s@]+\.[^\s@]+$', email):
-            raise HTTPException(400, detail="Invalid email format")
+    return await balance_service.get_portfolio(address, selected)
 
-        print(f" → Email: {email}")
+@app.get("/accounts/balances")
+async def get_contact_balances(request: Request):
+    """Get USDC balances for all of the user's saved accounts/contacts"""
+    auth_header = request.headers.get("Authorization")
+    user_id = "anonymous"
 
-        # MOCK MODE
-        if MOCK_PRIVY_LOOKUP:
-            fake_address = f"0x{''.join([f'{i:02x}' for i in range(20)])}"
-            print(f" ✅ Mock address: {fake_address}")
-            return {
-                "success": True,
-                "address": fake_address,
-                "email": email,
-                "source": "mock"
-            }
+    if auth_header and auth_header.startswith("Bearer "):
+        token = auth_header.split(" ")[1]
+        try:
+            payload = jwt.get_unverified_claims(token)
+            user_id = payload.get("sub", "anonymous")
+        except:
+            pass
 
-        # Real Privy API call
-        privy_api_secret = os.getenv("PRIVY_APP_SECRET")
-        if not privy_api_secret:
-            raise HTTPException(500, detail="Privy not configured")
-
-        credentials = f"{PRIVY_APP_ID}:{privy_api_secret}"
-        encoded = base64.b64encode(credentials.encode()).decode()
-
-        privy_response = requests.post(
-            "https://api.privy.io/v1/users/email/address",
-            headers={
-                "Authorization": f"Basic {encoded}",
-                "Content-Type": "application/json",
-                "privy-app-id": PRIVY_APP_ID
-            },
-            json={"address": email},
-            timeout=10
+    try:
+        response = supabase.table("accounts") \
+            .select("id, name, address") \
+            .eq("user_id", user_id) \
+            .execute()
+        accounts = [a for a in (response.data or []) if w3.is_address(a.get("address", ""))]
+        if not accounts:
+            return {"network": ACTIVE_NETWORK, "accounts": []}
+
+        result = await balance_service.get_balances(
+            [a["address"] for a in accounts[:MAX_BULK_ADDRESSES]], ACTIVE_NETWORK
         )
+        balances = result["balances"]
+        return {
+            "network": ACTIVE_NETWORK,
+            "block_number": result["block_number"],
+            "accounts": [
+                {**a, "balance": balances.get(w3.to_checksum_address(a["address"]))}
+                for a in accounts[:MAX_BULK_ADDRESSES]
+            ]
+        }
+    except Exception as e:
+        raise HTTPException(500, detail=f"Balance lookup error: {str(e)}")
+
+def lookup_privy_wallet(email: str) -> Dict:
+    """Privy wallet address for an email (blocking HTTP call - run in a thread)"""
+    # MOCK MODE
+    if MOCK_PRIVY_LOOKUP:
+        fake_address = f"0x{''.join([f'{i:02x}' for i in range(20)])}"
+        print(f" ✅ Mock address: {fake_address}")
+        return {
+            "success": True,
+            "address": fake_address,
+            "email": email,
+            "source": "mock"
+        }
+
+    # Real Privy API call
+    privy_api_secret = os.getenv("PRIVY_APP_SECRET")
+    if not privy_api_secret:
+        raise HTTPException(500, detail="Privy not configured")
+
+    credentials = f"{PRIVY_APP_ID}:{privy_api_secret}"
+    encoded = base64.b64encode(credentials.encode()).decode()
+
+    privy_response = requests.post(
+        "https://api.privy.io/v1/users/email/address",
+        headers={
+            "Authorization": f"Basic {encoded}",
+            "Content-Type": "application/json",
+            "privy-app-id": PRIVY_APP_ID
+        },
+        json={"address": email},
+        timeout=10
+    )
+
+    if privy_response.status_code == 200:
+        data = privy_response.json()
 
-        if privy_response.status_code == 200:
-            data = privy_response.json()
-
-            # Find wallet in linked accounts
-            for account in data.get("linked_accounts", []):
-                if account.get("type") == "wallet":
-                    address = account.get("address")
-                    if address:
-                        print(f" ✅ Found wallet: {address}")
-                        return {
-                            "success": True,
-                            "address": address,
-                            "email": email,
-                            "source": "linked_wallet"
-                        }
-
-            # Check embedded wallet
-            if "wallet" in data:
-                address = data["wallet"].get("address")
+        # Find wallet in linked accounts
+        for account in data.get("linked_accounts", []):
+            if account.get("type") == "wallet":
+                address = account.get("address")
                 if address:
+                    print(f" ✅ Found wallet: {address}")
                     return {
                         "success": True,
                         "address": address,
                         "email": email,
-                        "source": "embedded_wallet"
+                        "source": "linked_wallet"
                     }
 
-            raise HTTPException(404, detail="User has no wallet configured")
+        # Check embedded wallet
+        if "wallet" in data:
+            address = data["wallet"].get("address")
+            if address:
+                return {
+                    "success": True,
+                    "address": address,
+                    "email": email,
+                    "source": "embedded_wallet"
+                }
 
-        elif privy_response.status_code == 404:
-            raise HTTPException(404, detail=f"No account found for '{email}'")
+        raise HTTPException(404, detail="User has no wallet configured")
 
-        else:
-            raise HTTPException(500, detail=f"Privy error (code {privy_response.status_code})")
+    elif privy_response.status_code == 404:
+        raise HTTPException(404, detail=f"No account found for '{email}'")
+
+    else:
+        raise HTTPException(500, detail=f"Privy error (code {privy_response.status_code})")
+
+@app.post("/privy/lookup-address")
+async def lookup_privy_address(request: Request):
+    """Look up Privy wallet address by email"""
+    try:
+        print("\n" + "="*60)
+        print("🔍 [PRIVY LOOKUP] Starting...")
+
+        body = await request.json()
+        email = body.get("email")
+
+        if not email:
+            raise HTTPException(400, detail="Email required")
+
+        if not re.match(r'^[^\s@]+@[^\s@]+\.[^\s@]+$', email):
+            raise HTTPException(400, detail="Invalid email format")
+
+        print(f" → Email: {email}")
+
+        return await asyncio.to_thread(lookup_privy_wallet, email)
 
     except HTTPException:
         raise
@@ -0,0 +1,103 @@
+# model_limiter.py - Bounded concurrency for reasoning-model calls
+# Model calls are awaited on the event loop (never blocking it), at most
+# GEMINI_MAX_CONCURRENCY at a time. Extra callers wait in a bounded FIFO queue
+# and every call gets a hard timeout, so a slow model can't pile up requests.
+
+import os
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))  # model calls in flight per worker
+GEMINI_MAX_QUEUE = int(os.getenv("GEMINI_MAX_QUEUE", "64"))  # callers allowed to wait for a slot
+GEMINI_QUEUE_TIMEOUT = float(os.getenv("GEMINI_QUEUE_TIMEOUT", "5"))  # seconds a caller may wait for a slot
+GEMINI_CALL_TIMEOUT = float(os.getenv("GEMINI_CALL_TIMEOUT", "20"))  # seconds allowed per model call
+EWMA_ALPHA = 0.2
+
+T = TypeVar("T")
+
+
+class ModelOverloaded(Exception):
+    """Raised when a call can't get a slot (queue full or waited too long)"""
+
+
+class ModelLimiter:
+    """Semaphore + bounded wait queue + per-call timeout around async model calls"""
+
+    def __init__(self, name: str = "gemini", max_concurrency: int = GEMINI_MAX_CONCURRENCY,
+                 max_queue: int = GEMINI_MAX_QUEUE, queue_timeout: float = GEMINI_QUEUE_TIMEOUT,
+                 call_timeout: float = GEMINI_CALL_TIMEOUT):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.call_timeout = call_timeout
+        self._slots = asyncio.Semaphore(max_concurrency)  # waiters are served FIFO
+
+        self.active = 0
+        self.waiting = 0
+        self.calls = 0
+        self.errors = 0
+        self.rejected = 0
+        self.queue_timeouts = 0
+        self.call_timeouts = 0
+        self.latency_ms: Optional[float] = None
+        self.wait_ms: Optional[float] = None
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold one concurrency slot (e.g. for a streamed response); raises ModelOverloaded"""
+        if self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise ModelOverloaded(f"{self.name}: {self.waiting} calls already queued")
+
+        queued_at = time.monotonic()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.queue_timeouts += 1
+            raise ModelOverloaded(f"{self.name}: no free slot within {self.queue_timeout}s")
+        finally:
+            self.waiting -= 1
+
+        started = time.monotonic()
+        self.wait_ms = self._ewma(self.wait_ms, (started - queued_at) * 1000)
+        self.active += 1
+        self.calls += 1
+        try:
+            yield
+        except asyncio.TimeoutError:
+            self.call_timeouts += 1
+            raise
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self.active -= 1
+            self._slots.release()
+            self.latency_ms = self._ewma(self.latency_ms, (time.monotonic() - started) * 1000)
+
+    async def run(self, make_call: Callable[[], Awaitable[T]], timeout: Optional[float] = None) -> T:
+        """Await make_call() once a slot is free; raises ModelOverloaded or asyncio.TimeoutError"""
+        async with self.slot():
+            return await asyncio.wait_for(make_call(), timeout or self.call_timeout)
+
+    @staticmethod
+    def _ewma(current: Optional[float], sample: float) -> float:
+        return sample if current is None else EWMA_ALPHA * sample + (1 - EWMA_ALPHA) * current
+
+    def stats(self) -> Dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "active": self.active,
+            "waiting": self.waiting,
+            "calls": self.calls,
+            "errors": self.errors,
+            "rejected": self.rejected,
+            "queue_timeouts": self.queue_timeouts,
+            "call_timeouts": self.call_timeouts,
+            "latency_ms": round(self.latency_ms, 1) if self.latency_ms is not None else None,
+            "queue_wait_ms": round(self.wait_ms, 1) if self.wait_ms is not None else None,
+        }
@@ -0,0 +1,203 @@
+# policy_cache.py - In-memory TIP-403 settings with cross-worker invalidation
+# Policy settings are read on every payment check but change rarely. Each
+# worker keeps a bounded TTL cache; PUT /policy/settings writes through and
+# appends the user to a shared SQLite invalidation log that every other
+# worker polls, so a change is visible everywhere within about a second.
+
+import os
+import time
+import uuid
+import asyncio
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+POLICY_CACHE_SIZE = int(os.getenv("POLICY_CACHE_SIZE", "10000"))  # users kept per worker
+POLICY_CACHE_TTL = float(os.getenv("POLICY_CACHE_TTL", "300"))  # seconds - bounds staleness if the bus is down
+POLICY_INVALIDATION_PATH = os.getenv("POLICY_INVALIDATION_PATH", "policy_invalidations.db")
+POLICY_INVALIDATION_POLL = float(os.getenv("POLICY_INVALIDATION_POLL", "1.0"))  # seconds between polls
+PRUNE_EVERY_POLLS = 600  # trim the log about every ten minutes
+
+
+class PolicySettingsCache:
+    """
+    LRU + TTL map of user_id -> policy settings. Reads that miss run in worker
+    threads: take version() before the DB read and pass it to put(), which
+    drops the result if the user was invalidated while the read was in flight.
+    """
+
+    def __init__(self, max_entries: int = POLICY_CACHE_SIZE, ttl: float = POLICY_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # user_id -> (expires_at, settings)
+        self._seq = 0  # bumped by every invalidation
+        self._invalidated: "OrderedDict[str, int]" = OrderedDict()  # user_id -> seq of last invalidation
+        self._forgotten_seq = 0  # newest seq dropped from _invalidated - older versions can't be trusted
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.stale_puts = 0
+
+    def get(self, user_id: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[user_id]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[1]
+
+    def version(self) -> int:
+        """Invalidation sequence to pass to put() for a read starting now"""
+        with self._lock:
+            return self._seq
+
+    def put(self, user_id: str, settings: Dict, version: Optional[int] = None) -> bool:
+        """Store settings; with a version, only if the user wasn't invalidated since it was taken"""
+        with self._lock:
+            if version is not None:
+                last = self._invalidated.get(user_id, self._forgotten_seq)
+                if last > version:
+                    self.stale_puts += 1
+                    return False
+            self._entries[user_id] = (time.monotonic() + self.ttl, settings)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return True
+
+    def invalidate(self, user_id: str):
+        with self._lock:
+            self._seq += 1
+            self._invalidated[user_id] = self._seq
+            self._invalidated.move_to_end(user_id)
+            while len(self._invalidated) > self.max_entries:
+                _, seq = self._invalidated.popitem(last=False)
+                self._forgotten_seq = max(self._forgotten_seq, seq)
+            if self._entries.pop(user_id, None) is not None:
+                self.invalidations += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "invalidations": self.invalidations,
+                "stale_puts": self.stale_puts,
+            }
+
+
+class InvalidationBus:
+    """Shared append-only log of changed users; each worker follows it from its own position"""
+
+    def __init__(self, cache: PolicySettingsCache, path: str = POLICY_INVALIDATION_PATH,
+                 interval: float = POLICY_INVALIDATION_POLL):
+        self.cache = cache
+        self.interval = interval
+        self.worker_id = uuid.uuid4().hex[:12]
+        self.published = 0
+        self.received = 0
+        self.last_error: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+
+        self._lock = threading.Lock()  # one connection, used from worker threads (publish runs in one too)
+        self.db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS policy_invalidations (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT NOT NULL,
+                worker TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+        """)
+        self.db.commit()
+        # Only changes made after this worker started matter - its cache starts empty
+        self.last_seq = self.db.execute("SELECT COALESCE(MAX(seq), 0) FROM policy_invalidations").fetchone()[0]
+
+    def publish(self, user_id: str):
+        """Tell the other workers to drop their copy of this user's settings (blocking - call off the loop)"""
+        try:
+            with self._lock, self.db:
+                self.db.execute(
+                    "INSERT INTO policy_invalidations (user_id, worker, created_at) VALUES (?, ?, ?)",
+                    (user_id, self.worker_id, time.time())
+                )
+            self.published += 1
+        except sqlite3.Error as e:
+            self.last_error = f"publish: {e}"  # the TTL still bounds how stale other workers get
+            print(f"❌ [POLICY CACHE] {self.last_error}")
+
+    def poll(self) -> List[str]:
+        """Apply invalidations published by other workers since the last poll"""
+        return self._apply(self._fetch())
+
+    def _fetch(self) -> List[tuple]:
+        with self._lock:
+            return self.db.execute(
+                "SELECT seq, user_id, worker FROM policy_invalidations WHERE seq > ? ORDER BY seq",
+                (self.last_seq,)
+            ).fetchall()
+
+    def _apply(self, rows: List[tuple]) -> List[str]:
+        users = []
+        for seq, user_id, worker in rows:
+            self.last_seq = seq
+            if worker != self.worker_id:
+                self.cache.invalidate(user_id)
+                users.append(user_id)
+        self.received += len(users)
+        return users
+
+    def prune(self):
+        """Entries well past the cache TTL can no longer matter to anyone"""
+        with self._lock, self.db:
+            self.db.execute("DELETE FROM policy_invalidations WHERE created_at < ?", (time.time() - 2 * self.cache.ttl,))
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            print(f"🛡️ [POLICY CACHE] Following invalidations as worker {self.worker_id}")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        polls = 0
+        while True:
+            try:
+                # Read off the loop, but touch the cache only on it
+                self._apply(await asyncio.to_thread(self._fetch))
+                polls += 1
+                if polls % PRUNE_EVERY_POLLS == 0:
+                    await asyncio.to_thread(self.prune)
+                self.last_error = None
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+                print(f"❌ [POLICY CACHE] {self.last_error}")
+            await asyncio.sleep(self.interval)
+
+    def status(self) -> Dict:
+        return {
+            "worker": self.worker_id,
+            "running": self._task is not None and not self._task.done(),
+            "last_seq": self.last_seq,
+            "published": self.published,
+            "received": self.received,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,440 @@
+# policy_rules.py - Compiled TIP-403 policy rules, evaluated in batches
+# A user's settings compile once into a plan: the enabled rules, in order,
+# with their parameters resolved (plans are cached by settings content, so
+# users on the defaults share one). A plan judges any number of candidate
+# payments in one pass over numpy columns of the payments and recent history.
+
+import json
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+PLAN_CACHE_SIZE = 1024  # distinct settings kept compiled
+DAY_SECONDS = 24 * 3600
+
+# Settings the rule engine adds on top of the original TIP-403 limits (all off by default)
+RULE_DEFAULTS = {
+    "denylist": [],  # recipients that can never be paid
+    "allowlist": [],  # if set, only these recipients can be paid
+    "recipient_caps": {},  # recipient -> max per rolling 24h
+    "max_per_recipient_daily": None,  # cap for recipients without their own entry
+    "velocity_max_payments": None,  # at most N payments ...
+    "velocity_window_minutes": 60,  # ... per this many minutes
+    "new_recipient_cooling_hours": None,  # recipients first paid less than this long ago are "new"
+    "new_recipient_max_payment": 50.0,  # largest payment to a new recipient
+}
+
+RULE_TYPES: List[type] = []
+
+
+def register_rule(cls):
+    """Add a rule type to every compiled plan (evaluated in registration order)"""
+    RULE_TYPES.append(cls)
+    return cls
+
+
+def _addresses(values) -> set:
+    return {v.lower() for v in values or ()}
+
+
+class PaymentBatch:
+    """Candidate payments plus the history they are judged against, as time-sorted columns"""
+
+    def __init__(self, amounts: Sequence[float], recipients: Sequence[str], times: Sequence[float],
+                 history: Sequence[Tuple[float, float, str]] = (), first_paid: Optional[Dict[str, float]] = None):
+        self.size = len(amounts)
+        all_times = np.array([h[0] for h in history] + list(times), dtype=np.float64)
+        all_amounts = np.array([h[1] for h in history] + list(amounts), dtype=np.float64)
+        all_recipients = np.array([h[2].lower() for h in history] + [r.lower() for r in recipients], dtype=object)
+        is_candidate = np.zeros(len(all_times), dtype=bool)
+        is_candidate[len(history):] = True
+
+        order = np.argsort(all_times, kind="stable")  # history first on equal timestamps
+        self.time = all_times[order]
+        self.amount = all_amounts[order]
+        self.names, codes = np.unique(all_recipients[order], return_inverse=True)
+        self.code = codes.astype(np.int64).reshape(-1)
+        self.is_candidate = is_candidate[order]
+        self._candidate_rows = np.nonzero(self.is_candidate)[0]
+        self._candidate_index = order[self._candidate_rows] - len(history)  # row -> caller's position
+        self._rows = np.empty(self.size, dtype=np.int64)
+        self._rows[self._candidate_index] = self._candidate_rows
+        self.first_paid = first_paid or {}
+        self._cache: Dict = {}
+
+    def candidates(self, values: np.ndarray) -> np.ndarray:
+        """A per-row column reduced to the candidates, in the caller's order"""
+        out = np.empty(self.size, dtype=values.dtype)
+        out[self._candidate_index] = values[self._candidate_rows]
+        return out
+
+    def row_of(self, candidate: int) -> int:
+        return int(self._rows[candidate])
+
+    # ── Shared features (computed once per batch, whatever rules ask) ──
+
+    def window_sum(self, seconds: float, counts: bool = False) -> np.ndarray:
+        """Per row: total (or number) of payments in (t - seconds, t], including the row itself"""
+        key = ("sum", seconds, counts)
+        if key not in self._cache:
+            values = np.ones_like(self.amount) if counts else self.amount
+            prefix = np.concatenate(([0.0], np.cumsum(values)))
+            start = np.searchsorted(self.time, self.time - seconds, side="right")
+            self._cache[key] = prefix[np.arange(1, len(values) + 1)] - prefix[start]
+        return self._cache[key]
+
+    def recipient_window_sum(self, seconds: float) -> np.ndarray:
+        """window_sum restricted to payments to the same recipient"""
+        key = ("recipient_sum", seconds)
+        if key not in self._cache:
+            order = np.lexsort((self.time, self.code))
+            t0 = self.time.min() if len(self.time) else 0.0
+            span = (self.time.max() - t0 if len(self.time) else 0.0) + seconds + 1
+            # One sorted key per (recipient, time): windows never cross recipients
+            keys = self.code[order] * span + (self.time[order] - t0)
+            prefix = np.concatenate(([0.0], np.cumsum(self.amount[order])))
+            start = np.searchsorted(keys, keys - seconds, side="right")
+            sums = np.empty_like(self.amount)
+            sums[order] = prefix[np.arange(1, len(order) + 1)] - prefix[start]
+            self._cache[key] = sums
+        return self._cache[key]
+
+    def local_hour(self) -> np.ndarray:
+        if "hour" not in self._cache:
+            offset = datetime.now().astimezone().utcoffset().total_seconds()
+            self._cache["hour"] = ((self.time + offset) // 3600 % 24).astype(np.int64)
+        return self._cache["hour"]
+
+    def first_seen(self) -> np.ndarray:
+        """Per row: when the recipient was first paid (history, earlier candidates or the ledger)"""
+        if "first" not in self._cache:
+            first = np.full(len(self.names), np.inf)
+            np.minimum.at(first, self.code, self.time)
+            known = np.array([self.first_paid.get(name, np.inf) for name in self.names], dtype=np.float64)
+            self._cache["first"] = np.minimum(first, known)[self.code]
+        return self._cache["first"]
+
+    def recipient_in(self, addresses: set) -> np.ndarray:
+        """Per row: recipient is one of the addresses"""
+        listed = np.array([name in addresses for name in self.names], dtype=bool)
+        return listed[self.code]
+
+
+class Rule:
+    """One compiled check; blocked() flags rows of a batch, verdict() explains one"""
+
+    blocked_by = ""
+    policy = ""
+
+    @classmethod
+    def compile(cls, settings: Dict) -> Optional["Rule"]:
+        """The rule with its parameters, or None when the settings turn it off"""
+        raise NotImplementedError
+
+    def blocked(self, batch: PaymentBatch) -> np.ndarray:
+        raise NotImplementedError
+
+    def verdict(self, batch: PaymentBatch, row: int) -> Dict:
+        return {"reason": f"Blocked by {self.blocked_by}"}
+
+
+@register_rule
+class DenylistRule(Rule):
+    blocked_by = "denylist"
+    policy = "TIP-403 Recipient Denylist"
+
+    def __init__(self, addresses: set):
+        self.addresses = addresses
+
+    @classmethod
+    def compile(cls, settings):
+        addresses = _addresses(settings.get("denylist"))
+        return cls(addresses) if addresses else None
+
+    def blocked(self, batch):
+        return batch.recipient_in(self.addresses)
+
+    def verdict(self, batch, row):
+        return {"reason": f"Recipient {batch.names[batch.code[row]]} is on your blocked list"}
+
+
+@register_rule
+class AllowlistRule(Rule):
+    blocked_by = "allowlist"
+    policy = "TIP-403 Recipient Allowlist"
+
+    def __init__(self, addresses: set):
+        self.addresses = addresses
+
+    @classmethod
+    def compile(cls, settings):
+        addresses = _addresses(settings.get("allowlist"))
+        return cls(addresses) if addresses else None
+
+    def blocked(self, batch):
+        return ~batch.recipient_in(self.addresses)
+
+    def verdict(self, batch, row):
+        return {"reason": f"Recipient {batch.names[batch.code[row]]} is not on your allowed list"}
+
+
+@register_rule
+class SinglePaymentRule(Rule):
+    blocked_by = "max_single_payment"
+    policy = "TIP-403 Single Payment Limit"
+
+    def __init__(self, limit: float):
+        self.limit = limit
+
+    @classmethod
+    def compile(cls, settings):
+        return cls(float(settings["max_single_payment"]))
+
+    def blocked(self, batch):
+        return batch.amount > self.limit
+
+    def verdict(self, batch, row):
+        return {"reason": f"Amount ${batch.amount[row]:.2f} exceeds single payment limit of ${self.limit:.2f}"}
+
+
+@register_rule
+class NightRule(Rule):
+    blocked_by = "night_time_limit"
+    policy = "TIP-403 Time-Based Restriction"
+
+    def __init__(self, start: int, end: int, limit: float):
+        self.start, self.end, self.limit = start, end, limit
+
+    @classmethod
+    def compile(cls, settings):
+        if not settings.get("night_time_enabled", True):
+            return None
+        return cls(int(settings["night_hour_start"]), int(settings["night_hour_end"]), float(settings["night_max_payment"]))
+
+    def blocked(self, batch):
+        hour = batch.local_hour()
+        if self.start > self.end:  # wraps midnight, e.g. 22 -> 6
+            night = (hour >= self.start) | (hour < self.end)
+        else:
+            night = (hour >= self.start) & (hour < self.end)
+        return night & (batch.amount > self.limit)
+
+    def verdict(self, batch, row):
+        return {
+            "reason": f"Night time payments limited to ${self.limit:.2f}. Current amount: ${batch.amount[row]:.2f}",
+            "time": f"{batch.local_hour()[row]}:00",
+        }
+
+
+@register_rule
+class NewRecipientRule(Rule):
+    blocked_by = "new_recipient_cooling"
+    policy = "TIP-403 New Recipient Cooling Period"
+
+    def __init__(self, hours: float, limit: float):
+        self.hours, self.limit = hours, limit
+
+    @classmethod
+    def compile(cls, settings):
+        hours = settings.get("new_recipient_cooling_hours")
+        if not hours:
+            return None
+        return cls(float(hours), float(settings.get("new_recipient_max_payment", RULE_DEFAULTS["new_recipient_max_payment"])))
+
+    def blocked(self, batch):
+        is_new = batch.time - batch.first_seen() < self.hours * 3600
+        return is_new & (batch.amount > self.limit)
+
+    def verdict(self, batch, row):
+        return {"reason": f"Payments to a recipient first paid less than {self.hours:g}h ago are limited to "
+                          f"${self.limit:.2f}. Current amount: ${batch.amount[row]:.2f}"}
+
+
+@register_rule
+class RecipientCapRule(Rule):
+    blocked_by = "max_per_recipient_daily"
+    policy = "TIP-403 Per-Recipient Limit"
+
+    def __init__(self, caps: Dict[str, float], default: Optional[float]):
+        self.caps, self.default = caps, default
+
+    @classmethod
+    def compile(cls, settings):
+        caps = {k.lower(): float(v) for k, v in (settings.get("recipient_caps") or {}).items()}
+        default = settings.get("max_per_recipient_daily")
+        if not caps and default is None:
+            return None
+        return cls(caps, float(default) if default is not None else None)
+
+    def _limits(self, batch) -> np.ndarray:
+        key = ("recipient_caps", id(self))
+        if key not in batch._cache:
+            fallback = np.inf if self.default is None else self.default
+            limits = np.array([self.caps.get(name, fallback) for name in batch.names], dtype=np.float64)
+            batch._cache[key] = limits[batch.code]
+        return batch._cache[key]
+
+    def blocked(self, batch):
+        return batch.recipient_window_sum(DAY_SECONDS) > self._limits(batch) + 1e-6
+
+    def verdict(self, batch, row):
+        total = batch.recipient_window_sum(DAY_SECONDS)[row]
+        return {"reason": f"Payments to {batch.names[batch.code[row]]} would reach ${total:.2f} in 24h, "
+                          f"over the ${self._limits(batch)[row]:.2f} limit for this recipient"}
+
+
+@register_rule
+class VelocityRule(Rule):
+    blocked_by = "velocity"
+    policy = "TIP-403 Payment Velocity"
+
+    def __init__(self, max_payments: int, minutes: float):
+        self.max_payments, self.minutes = max_payments, minutes
+
+    @classmethod
+    def compile(cls, settings):
+        max_payments = settings.get("velocity_max_payments")
+        if not max_payments:
+            return None
+        minutes = float(settings.get("velocity_window_minutes") or RULE_DEFAULTS["velocity_window_minutes"])
+        return cls(int(max_payments), min(minutes, DAY_SECONDS / 60))  # the ledger keeps 24h
+
+    def blocked(self, batch):
+        return batch.window_sum(self.minutes * 60, counts=True) > self.max_payments
+
+    def verdict(self, batch, row):
+        return {"reason": f"At most {self.max_payments} payments per {self.minutes:g} minutes"}
+
+
+@register_rule
+class DailyLimitRule(Rule):
+    blocked_by = "max_daily_limit"
+    policy = "TIP-403 Daily Spending Limit"
+
+    def __init__(self, limit: float):
+        self.limit = limit
+
+    @classmethod
+    def compile(cls, settings):
+        return cls(float(settings["max_daily_limit"]))
+
+    def blocked(self, batch):
+        return batch.window_sum(DAY_SECONDS) > self.limit + 1e-6
+
+    def verdict(self, batch, row):
+        spent = batch.window_sum(DAY_SECONDS)[row] - batch.amount[row]
+        return {
+            "reason": f"Daily limit exceeded. Spent: ${spent:.2f}, This payment: ${batch.amount[row]:.2f}, Limit: ${self.limit:.2f}",
+            "daily_spent": spent,
+            "daily_remaining": self.limit - spent,
+        }
+
+
+class PolicyPlan:
+    """The compiled rules for one settings document"""
+
+    def __init__(self, rules: List[Rule]):
+        self.rules = rules
+
+    def masks(self, batch: PaymentBatch) -> Dict[str, np.ndarray]:
+        """blocked_by -> per-candidate mask, for every rule (a payment can fail several)"""
+        return {rule.blocked_by: batch.candidates(rule.blocked(batch)) for rule in self.rules}
+
+    def evaluate(self, batch: PaymentBatch) -> List[Optional[Dict]]:
+        """Per candidate: None if allowed, else the verdict of the first rule that blocks it"""
+        verdicts: List[Optional[Dict]] = [None] * batch.size
+        pending = np.ones(batch.size, dtype=bool)
+        for rule in self.rules:
+            hits = batch.candidates(rule.blocked(batch)) & pending
+            for candidate in np.nonzero(hits)[0]:
+                verdicts[candidate] = {
+                    "allowed": False,
+                    "policy": rule.policy,
+                    "blocked_by": rule.blocked_by,
+                    **rule.verdict(batch, batch.row_of(candidate)),
+                }
+            pending &= ~hits
+            if not pending.any():
+                break
+        return verdicts
+
+
+_plans: "OrderedDict[str, PolicyPlan]" = OrderedDict()
+
+
+def compile_policy(settings: Dict) -> PolicyPlan:
+    """Plan for a settings document - compiled on first use, then shared"""
+    key = json.dumps(settings, sort_keys=True, default=str)
+    plan = _plans.get(key)
+    if plan is None:
+        plan = PolicyPlan([rule for rule in (cls.compile(settings) for cls in RULE_TYPES) if rule is not None])
+        _plans[key] = plan
+        if len(_plans) > PLAN_CACHE_SIZE:
+            _plans.popitem(last=False)
+    else:
+        _plans.move_to_end(key)
+    return plan
+
+
+def backtest(settings: Dict, amounts: Sequence[float], recipients: Sequence[str], times: Sequence[float],
+             max_affected: int = 100, first_paid: Optional[Dict[str, float]] = None) -> Dict:
+    """Replay past payments against settings: per-rule block counts and the payments hit"""
+    batch = PaymentBatch(amounts, recipients, times, first_paid=first_paid)
+    rules = compile_policy(settings).rules if settings.get("enabled", True) else []
+    masks = np.array([batch.candidates(rule.blocked(batch)) for rule in rules], dtype=bool).reshape(len(rules), batch.size)
+    blocked = masks.any(axis=0)
+    affected = np.nonzero(blocked)[0]
+    names = [rule.blocked_by for rule in rules]
+    return {
+        "payments": batch.size,
+        "blocked": int(blocked.sum()),
+        "blocked_amount": round(float(np.asarray(amounts, dtype=np.float64)[blocked].sum()), 2) if batch.size else 0.0,
+        "by_rule": {name: int(count) for name, count in zip(names, masks.sum(axis=1))},
+        "affected": [
+            {"index": int(i), "blocked_by": [names[r] for r in np.nonzero(masks[:, i])[0]]}
+            for i in affected[:max_affected]
+        ],
+    }
+
+
+if __name__ == "__main__":
+    import random
+    import time
+
+    random.seed(3)
+    settings = {
+        "enabled": True, "max_single_payment": 1000, "max_daily_limit": 5000,
+        "night_time_enabled": True, "night_max_payment": 100, "night_hour_start": 22, "night_hour_end": 6,
+        "denylist": ["0xbad"], "recipient_caps": {"0xr1": 200}, "max_per_recipient_daily": 1500,
+        "velocity_max_payments": 10, "velocity_window_minutes": 60,
+        "new_recipient_cooling_hours": 24, "new_recipient_max_payment": 50,
+    }
+    started = time.perf_counter()
+    plan = compile_policy(settings)
+    print(f"Compiled {len(plan.rules)} rules in {(time.perf_counter() - started) * 1000:.2f} ms")
+
+    now = time.time()
+    for n in (1, 10, 1_000, 100_000):
+        amounts = [round(random.expovariate(1 / 80), 2) for _ in range(n)]
+        recipients = [f"0xr{random.randint(0, 200)}" for _ in range(n)]
+        times = [now + random.uniform(0, n * 3600) for _ in range(n)]  # ~1 payment an hour
+        started = time.perf_counter()
+        masks = plan.masks(PaymentBatch(amounts, recipients, times))
+        masked = (time.perf_counter() - started) * 1000
+        started = time.perf_counter()
+        verdicts = plan.evaluate(PaymentBatch(amounts, recipients, times))
+        explained = (time.perf_counter() - started) * 1000
+        blocked = sum(v is not None for v in verdicts)
+        print(f"{n:>7} payments: rule masks {masked:8.2f} ms, with verdicts {explained:8.2f} ms ({blocked} blocked)")
+
+    # A year of history, ~30 payments a day, replayed against tighter settings
+    n = 365 * 30
+    amounts = [round(random.expovariate(1 / 40), 2) for _ in range(n)]
+    recipients = [f"0xr{random.randint(0, 60)}" for _ in range(n)]
+    times = sorted(now - random.uniform(0, 365 * DAY_SECONDS) for _ in range(n))
+    started = time.perf_counter()
+    report = backtest(dict(settings, max_daily_limit=1500, night_max_payment=30), amounts, recipients, times)
+    print(f"backtest of {n} payments: {(time.perf_counter() - started) * 1000:.1f} ms, "
+          f"{report['blocked']} blocked {report['by_rule']}")
@@ -0,0 +1,67 @@
+# prompt_budget.py - Keeps the per-request part of the reasoning prompt small
+# The static instructions live in the model's system instruction (a shared,
+# cacheable prefix); each request only adds the contacts relevant to the
+# prompt (via the fuzzy contact index) and the history window. Prompt token
+# usage is recorded per request.
+
+import os
+from collections import deque
+from typing import Dict, List
+
+from contact_index import ContactIndex
+
+INTENT_MAX_CONTACTS = int(os.getenv("INTENT_MAX_CONTACTS", "8"))  # contacts sent to the model per request
+CHARS_PER_TOKEN = 4  # rough estimate when the API doesn't report usage
+RECENT_PROMPTS = 100  # per-request samples kept for /metrics
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def select_contacts(prompt: str, index: ContactIndex, k: int = INTENT_MAX_CONTACTS) -> List[Dict]:
+    """The k saved contacts most relevant to the prompt (unrelated contacts are dropped)"""
+    if not index.contacts:
+        return []
+    return index.relevant(prompt, k)
+
+
+class PromptStats:
+    """Per-request prompt sizes, as reported by the model API when available"""
+
+    def __init__(self, static_prefix: str = ""):
+        self.static_tokens = estimate_tokens(static_prefix) if static_prefix else 0
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.contacts_offered = 0
+        self.contacts_sent = 0
+        self.recent: deque = deque(maxlen=RECENT_PROMPTS)
+
+    def record_contacts(self, offered: int, sent: int):
+        """How many saved contacts made it into a prompt"""
+        self.contacts_offered += offered
+        self.contacts_sent += sent
+
+    def record(self, dynamic_prompt: str, usage=None):
+        """Token usage of one model call (estimated when the API reports none)"""
+        prompt_tokens = getattr(usage, "prompt_token_count", 0) or self.static_tokens + estimate_tokens(dynamic_prompt)
+        cached_tokens = getattr(usage, "cached_content_token_count", 0) or 0
+        self.requests += 1
+        self.prompt_tokens += prompt_tokens
+        self.cached_tokens += cached_tokens
+        self.recent.append({
+            "prompt_tokens": prompt_tokens,
+            "cached_tokens": cached_tokens,
+            "dynamic_tokens": estimate_tokens(dynamic_prompt),
+        })
+
+    def stats(self) -> Dict:
+        return {
+            "requests": self.requests,
+            "static_prefix_tokens": self.static_tokens,
+            "avg_prompt_tokens": round(self.prompt_tokens / self.requests, 1) if self.requests else 0,
+            "cached_token_share": round(self.cached_tokens / self.prompt_tokens, 3) if self.prompt_tokens else 0.0,
+            "contacts_sent_share": round(self.contacts_sent / self.contacts_offered, 3) if self.contacts_offered else 0.0,
+            "recent": list(self.recent)[-10:],
+        }
@@ -0,0 +1,136 @@
+# receipt_cache.py - Cache for /transaction/{tx_hash}/receipt
+# Confirmed receipts never change, so they are kept in an in-memory LRU with
+# an optional SQLite tier on disk. "Not found yet" results are cached briefly
+# (negative caching) so bursts of polls for a pending hash share one RPC call.
+# Disk reads and writes run in worker threads so they never stall the loop.
+
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+RECEIPT_CACHE_SIZE = int(os.getenv("RECEIPT_CACHE_SIZE", "10000"))  # confirmed receipts kept in memory
+RECEIPT_CACHE_PATH = os.getenv("RECEIPT_CACHE_PATH")  # e.g. /data/receipts.db - disk tier disabled if unset
+PENDING_TTL = float(os.getenv("RECEIPT_PENDING_TTL", "3"))  # seconds a "not yet confirmed" answer is reused
+
+
+def format_receipt(tx_hash: str, receipt: Dict) -> Dict:
+    """Shape a raw eth_getTransactionReceipt result like the receipt endpoint does"""
+    return {
+        "tx_hash": tx_hash,
+        "status": "success" if int(receipt["status"], 16) == 1 else "failed",
+        "gas_used": int(receipt["gasUsed"], 16),
+        "block_number": int(receipt["blockNumber"], 16),
+        "confirmed": True
+    }
+
+
+class ReceiptCache:
+    """Two-tier cache of confirmed receipts plus short-lived pending entries"""
+
+    def __init__(self, max_entries: int = RECEIPT_CACHE_SIZE, path: Optional[str] = RECEIPT_CACHE_PATH):
+        self.max_entries = max_entries
+        self._confirmed: "OrderedDict[str, Dict]" = OrderedDict()
+        self._pending: Dict[str, float] = {}  # tx_hash -> expiry (monotonic)
+        self._disk: Optional[sqlite3.Connection] = None
+        self._disk_lock = threading.Lock()  # one connection, used from worker threads
+        if path:
+            self._disk = sqlite3.connect(path, check_same_thread=False)
+            self._disk.execute(
+                "CREATE TABLE IF NOT EXISTS receipts (tx_hash TEXT PRIMARY KEY, body TEXT NOT NULL)"
+            )
+            self._disk.commit()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.pending_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    async def get(self, tx_hash: str) -> Tuple[bool, Optional[Dict]]:
+        """
+        Returns (hit, receipt). A hit with receipt None means the hash was
+        looked up moments ago and was still pending.
+        """
+        key = tx_hash.lower()
+
+        receipt = self._confirmed.get(key)
+        if receipt is not None:
+            self._confirmed.move_to_end(key)
+            self.hits += 1
+            return True, receipt
+
+        if self._disk is not None:
+            receipt = await asyncio.to_thread(self._disk_get, key)
+            if receipt is not None:
+                self._remember(key, receipt)
+                self.disk_hits += 1
+                return True, receipt
+
+        expires = self._pending.get(key)
+        if expires is not None:
+            if expires > time.monotonic():
+                self.pending_hits += 1
+                return True, None
+            del self._pending[key]
+
+        self.misses += 1
+        return False, None
+
+    async def put_confirmed(self, tx_hash: str, receipt: Dict):
+        """Store a confirmed receipt permanently"""
+        await self.put_confirmed_many({tx_hash: receipt})
+
+    async def put_confirmed_many(self, receipts: Dict[str, Dict]):
+        """Store confirmed receipts permanently - one disk transaction for the lot"""
+        rows = []
+        for tx_hash, receipt in receipts.items():
+            key = tx_hash.lower()
+            self._pending.pop(key, None)
+            self._remember(key, receipt)
+            rows.append((key, json.dumps(receipt)))
+        if self._disk is not None and rows:
+            await asyncio.to_thread(self._disk_put, rows)
+
+    def put_pending(self, tx_hash: str):
+        """Remember briefly that the hash has no receipt yet"""
+        now = time.monotonic()
+        if len(self._pending) >= self.max_entries:
+            self._pending = {k: v for k, v in self._pending.items() if v > now}
+            if len(self._pending) >= self.max_entries:
+                del self._pending[next(iter(self._pending))]
+        self._pending[tx_hash.lower()] = now + PENDING_TTL
+
+    def _disk_get(self, key: str) -> Optional[Dict]:
+        with self._disk_lock:
+            row = self._disk.execute("SELECT body FROM receipts WHERE tx_hash = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _disk_put(self, rows: List[tuple]):
+        with self._disk_lock, self._disk:
+            self._disk.executemany("INSERT OR REPLACE INTO receipts (tx_hash, body) VALUES (?, ?)", rows)
+
+    def _remember(self, key: str, receipt: Dict):
+        self._confirmed[key] = receipt
+        self._confirmed.move_to_end(key)
+        while len(self._confirmed) > self.max_entries:
+            self._confirmed.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.disk_hits + self.pending_hits + self.misses
+        return {
+            "entries": len(self._confirmed),
+            "pending_entries": len(self._pending),
+            "disk_tier": self._disk is not None,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "pending_hits": self.pending_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round((lookups - self.misses) / lookups, 3) if lookups else 0.0,
+        }
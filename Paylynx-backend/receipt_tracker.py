@@ -0,0 +1,167 @@
+# receipt_tracker.py - Background worker that resolves pending transactions
+# Follows new blocks, fetches receipts for every pending hash in JSON-RPC
+# batches and writes the final statuses back to the transactions table.
+# Each worker follows the hashes it recorded itself; the backlog left behind by
+# other (or restarted) workers is scanned by whichever worker holds the lease.
+
+import os
+import time
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from supabase import Client
+
+from rpc_pool import RPCPool
+from receipt_cache import ReceiptCache, format_receipt
+from worker_lease import WorkerLease
+
+RECEIPT_TRACKER_ENABLED = os.getenv("RECEIPT_TRACKER_ENABLED", "true").lower() == "true"
+RECEIPT_POLL_INTERVAL = float(os.getenv("RECEIPT_POLL_INTERVAL", "2"))  # seconds between block checks
+PENDING_RELOAD_INTERVAL = 60.0  # seconds between DB scans (picks up rows from other workers)
+PENDING_MAX_AGE_HOURS = 24  # stop tracking hashes that never landed
+PENDING_HANDOFF_SECONDS = 120  # younger rows are still followed by the worker that recorded them
+PENDING_PAGE_SIZE = 1000  # PostgREST's default row cap per request
+PENDING_MAX_ROWS = 10_000  # backlog rows loaded per scan
+DB_BATCH_SIZE = 100  # hashes per UPDATE ... WHERE tx_hash IN (...)
+
+
+class ReceiptTracker:
+    """Resolves pending transaction rows in bulk as new blocks arrive"""
+
+    def __init__(self, db: Client, pool: RPCPool, cache: Optional[ReceiptCache] = None,
+                 lease: Optional[WorkerLease] = None):
+        self.db = db
+        self.pool = pool
+        self.cache = cache  # resolved receipts are shared with the receipt endpoint
+        self.lease = lease or WorkerLease("receipt_tracker.backlog")  # only the holder scans the DB
+        self.pending: Dict[str, float] = {}  # tx_hash -> monotonic time first seen
+        self.last_block: Optional[int] = None
+        self.last_reload = 0.0
+        self.resolved = 0
+        self.rounds = 0
+        self.last_error: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def track(self, tx_hash: str):
+        """Start following a freshly recorded transaction"""
+        self.pending.setdefault(tx_hash, time.monotonic())
+
+    def start(self):
+        if RECEIPT_TRACKER_ENABLED and self._task is None:
+            self._task = asyncio.create_task(self._run())
+            print("🛰️ [RECEIPT TRACKER] Started")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.lease.held:
+            await asyncio.to_thread(self.lease.release)
+
+    async def _run(self):
+        while True:
+            try:
+                # The lease is renewed on its own schedule - the scan interval is longer than its TTL
+                if self.lease.renewal_due():
+                    await asyncio.to_thread(self.lease.acquire)
+                if self.lease.held and time.monotonic() - self.last_reload > PENDING_RELOAD_INTERVAL:
+                    self.last_reload = time.monotonic()
+                    await self._load_pending()
+
+                block = int(await self.pool.call("eth_blockNumber"), 16)
+                if block != self.last_block:
+                    self.last_block = block
+                    if self.pending:
+                        await self.sync()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+                print(f"❌ [RECEIPT TRACKER] {self.last_error}")
+            await asyncio.sleep(RECEIPT_POLL_INTERVAL)
+
+    async def _load_pending(self):
+        """Pick up pending rows any worker left behind, paged past the row cap"""
+        now = datetime.now(timezone.utc)
+        since = (now - timedelta(hours=PENDING_MAX_AGE_HOURS)).isoformat()
+        until = (now - timedelta(seconds=PENDING_HANDOFF_SECONDS)).isoformat()
+        for offset in range(0, PENDING_MAX_ROWS, PENDING_PAGE_SIZE):
+            response = await asyncio.to_thread(
+                lambda: self.db.table("transactions")
+                .select("tx_hash")
+                .eq("status", "pending")
+                .gte("created_at", since)
+                .lt("created_at", until)
+                .order("created_at")
+                .range(offset, offset + PENDING_PAGE_SIZE - 1)
+                .execute()
+            )
+            page = response.data or []
+            for row in page:
+                self.pending.setdefault(row["tx_hash"], self.last_reload)
+            if len(page) < PENDING_PAGE_SIZE:
+                break
+
+    async def sync(self):
+        """Fetch every pending receipt in batches and persist the resolved ones"""
+        self.rounds += 1
+        self._expire()
+        hashes = list(self.pending)
+        receipts = await self.pool.batch(
+            [("eth_getTransactionReceipt", [h]) for h in hashes],
+            return_exceptions=True
+        )
+
+        by_status: Dict[str, List[str]] = {"success": [], "failed": []}
+        confirmed: Dict[str, Dict] = {}
+        for tx_hash, receipt in zip(hashes, receipts):
+            if receipt is None or isinstance(receipt, Exception):
+                continue  # still pending (or the node errored - retry next block)
+            confirmed[tx_hash] = format_receipt(tx_hash, receipt)
+            by_status[confirmed[tx_hash]["status"]].append(tx_hash)
+        if self.cache is not None and confirmed:
+            await self.cache.put_confirmed_many(confirmed)
+
+        for status, resolved in by_status.items():
+            for i in range(0, len(resolved), DB_BATCH_SIZE):
+                chunk = resolved[i:i + DB_BATCH_SIZE]
+                await self._write_status(status, chunk)
+                for tx_hash in chunk:
+                    self.pending.pop(tx_hash, None)
+                self.resolved += len(chunk)
+
+        done = len(by_status["success"]) + len(by_status["failed"])
+        if done:
+            print(f"🛰️ [RECEIPT TRACKER] Block {self.last_block}: resolved {done}, {len(self.pending)} still pending")
+
+    def _expire(self):
+        """Forget hashes that never landed (dropped or replaced transactions)"""
+        cutoff = time.monotonic() - PENDING_MAX_AGE_HOURS * 3600
+        for tx_hash in [h for h, seen in self.pending.items() if seen < cutoff]:
+            del self.pending[tx_hash]
+
+    async def _write_status(self, status: str, tx_hashes: List[str]):
+        await asyncio.to_thread(
+            lambda: self.db.table("transactions")
+            .update({"status": status})
+            .in_("tx_hash", tx_hashes)
+            .eq("status", "pending")
+            .execute()
+        )
+
+    def status(self) -> Dict:
+        return {
+            "enabled": RECEIPT_TRACKER_ENABLED,
+            "running": self._task is not None and not self._task.done(),
+            "pending": len(self.pending),
+            "resolved": self.resolved,
+            "rounds": self.rounds,
+            "last_block": self.last_block,
+            "backlog_lease": self.lease.status(),
+            "last_error": self.last_error,
+        }
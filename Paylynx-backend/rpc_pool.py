@@ -0,0 +1,356 @@
+# rpc_pool.py - Async JSON-RPC client pool with health-scored failover
+
+import os
+import json
+import time
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple
+
+import aiohttp
+
+# ════════════════════════════════════════════════════════════════
+# POOL CONFIGURATION
+# ════════════════════════════════════════════════════════════════
+
+RPC_TIMEOUT = float(os.getenv("RPC_TIMEOUT", "10"))  # seconds per attempt
+RPC_POOL_SIZE = int(os.getenv("RPC_POOL_SIZE", "20"))  # keep-alive connections per endpoint
+RPC_KEEPALIVE_TIMEOUT = float(os.getenv("RPC_KEEPALIVE_TIMEOUT", "60"))
+RPC_MAX_BATCH_SIZE = int(os.getenv("RPC_MAX_BATCH_SIZE", "100"))  # calls per JSON-RPC batch
+
+EWMA_ALPHA = 0.2  # weight of the newest sample in latency / error averages
+DEFAULT_LATENCY_MS = 250.0  # assumed latency for endpoints that were never measured
+ERROR_PENALTY = 4.0  # score multiplier per unit of error rate
+MAX_CONSECUTIVE_FAILURES = 3  # failures before an endpoint is benched
+COOLDOWN_SECONDS = 30.0  # how long a benched endpoint is skipped
+
+USER_AGENT = "Paylynx/1.0"
+
+
+class RPCError(Exception):
+    """Error object returned by a node - the endpoint itself is healthy"""
+
+    def __init__(self, code: int, message: str, data: Any = None):
+        super().__init__(f"RPC error {code}: {message}")
+        self.code = code
+        self.message = message
+        self.data = data
+
+
+class RPCUnavailable(Exception):
+    """Every endpoint in the pool failed at the transport level"""
+
+
+# ════════════════════════════════════════════════════════════════
+# ENDPOINT HEALTH TRACKING
+# ════════════════════════════════════════════════════════════════
+
+class EndpointHealth:
+    """Rolling latency / error statistics for one RPC endpoint"""
+
+    def __init__(self, url: str, index: int):
+        self.url = url
+        self.index = index  # configured priority, used to break ties
+        self.latency_ms: Optional[float] = None
+        self.error_rate = 0.0
+        self.total_requests = 0
+        self.total_errors = 0
+        self.consecutive_failures = 0
+        self.benched_until = 0.0
+        self.last_error: Optional[str] = None
+        self.chain_verified = False
+        self.disabled = False  # permanently excluded (e.g. wrong chain)
+
+    def record_success(self, latency_ms: float):
+        self.total_requests += 1
+        self.consecutive_failures = 0
+        if self.latency_ms is None:
+            self.latency_ms = latency_ms
+        else:
+            self.latency_ms += EWMA_ALPHA * (latency_ms - self.latency_ms)
+        self.error_rate *= (1 - EWMA_ALPHA)
+
+    def record_failure(self, error: str):
+        self.total_requests += 1
+        self.total_errors += 1
+        self.consecutive_failures += 1
+        self.last_error = error
+        self.error_rate += EWMA_ALPHA * (1 - self.error_rate)
+        if self.consecutive_failures >= MAX_CONSECUTIVE_FAILURES:
+            self.benched_until = time.monotonic() + COOLDOWN_SECONDS
+
+    def is_benched(self) -> bool:
+        return time.monotonic() < self.benched_until
+
+    @property
+    def score(self) -> float:
+        """Lower is better: expected latency inflated by recent errors"""
+        latency = self.latency_ms if self.latency_ms is not None else DEFAULT_LATENCY_MS
+        return latency * (1 + ERROR_PENALTY * self.error_rate)
+
+    def to_dict(self) -> Dict:
+        return {
+            "url": self.url[:50],
+            "latency_ms": round(self.latency_ms, 1) if self.latency_ms is not None else None,
+            "error_rate": round(self.error_rate, 3),
+            "score": round(self.score, 1),
+            "total_requests": self.total_requests,
+            "total_errors": self.total_errors,
+            "consecutive_failures": self.consecutive_failures,
+            "benched": self.is_benched(),
+            "disabled": self.disabled,
+            "last_error": self.last_error,
+        }
+
+
+# ════════════════════════════════════════════════════════════════
+# RPC POOL
+# ════════════════════════════════════════════════════════════════
+
+class RPCPool:
+    """
+    Non-blocking JSON-RPC client over several endpoints.
+    Each endpoint keeps its own pool of keep-alive connections; requests go
+    to the healthiest endpoint first and fail over to the next one mid-request.
+    """
+
+    def __init__(
+        self,
+        endpoints: List[str],
+        name: str = "",
+        chain_id: Optional[int] = None,
+        timeout: float = RPC_TIMEOUT,
+        pool_size: int = RPC_POOL_SIZE,
+    ):
+        urls = []
+        for url in endpoints:
+            if url and url not in urls:
+                urls.append(url)
+        if not urls:
+            raise ValueError(f"RPC pool '{name}' has no endpoints configured")
+
+        self.name = name
+        self.chain_id = chain_id  # endpoints reporting another chain are disabled
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.endpoints = [EndpointHealth(url, i) for i, url in enumerate(urls)]
+        self._sessions: Dict[str, aiohttp.ClientSession] = {}
+        self._request_id = 0
+
+    def _session(self, endpoint: EndpointHealth) -> aiohttp.ClientSession:
+        """Lazily open the keep-alive session (needs a running event loop)"""
+        session = self._sessions.get(endpoint.url)
+        if session is None or session.closed:
+            session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self.pool_size,
+                    keepalive_timeout=RPC_KEEPALIVE_TIMEOUT,
+                ),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers={"User-Agent": USER_AGENT, "Content-Type": "application/json"},
+            )
+            self._sessions[endpoint.url] = session
+        return session
+
+    def _ranked(self) -> List[EndpointHealth]:
+        """Healthy endpoints by score, benched ones last as a final resort"""
+        candidates = [e for e in self.endpoints if not e.disabled]
+        return sorted(candidates, key=lambda e: (e.is_benched(), e.score, e.index))
+
+    def _next_id(self) -> int:
+        self._request_id += 1
+        return self._request_id
+
+    async def _post(self, endpoint: EndpointHealth, payload: Any) -> Any:
+        """Single HTTP round trip; raises on any transport-level problem"""
+        session = self._session(endpoint)
+        async with session.post(endpoint.url, json=payload) as response:
+            if response.status == 429 or response.status >= 500:
+                raise aiohttp.ClientResponseError(
+                    response.request_info,
+                    response.history,
+                    status=response.status,
+                    message=f"HTTP {response.status}",
+                )
+            return await response.json(content_type=None)
+
+    async def _verify_chain(self, endpoint: EndpointHealth):
+        """
+        Check once that the endpoint serves the chain this pool is for. Only a
+        successful reply naming another chain disables it; an error reply is an
+        ordinary failure (health/backoff) and the check runs again next time.
+        """
+        if endpoint.chain_verified or self.chain_id is None:
+            return
+        reply = await self._post(endpoint, {
+            "jsonrpc": "2.0", "id": self._next_id(), "method": "eth_chainId", "params": []
+        })
+        if not isinstance(reply, dict) or "error" in reply or not isinstance(reply.get("result"), str):
+            detail = reply.get("error") if isinstance(reply, dict) else reply
+            raise ValueError(f"eth_chainId failed: {detail}")
+        if int(reply["result"], 16) != self.chain_id:
+            endpoint.disabled = True
+            endpoint.last_error = f"chain id mismatch (expected {self.chain_id})"
+            print(f"⚠️ [RPC {self.name}] Disabled {endpoint.url[:50]}: {endpoint.last_error}")
+            raise RPCUnavailable(endpoint.last_error)
+        endpoint.chain_verified = True
+
+    async def _send(self, payload: Any) -> Any:
+        """Send a payload, failing over through endpoints in health order"""
+        errors = []
+        for endpoint in self._ranked():
+            started = time.perf_counter()
+            try:
+                await self._verify_chain(endpoint)
+                reply = await self._post(endpoint, payload)
+            except RPCUnavailable as e:
+                errors.append(f"{endpoint.url[:50]}: {e}")
+                continue
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, KeyError) as e:
+                error = f"{type(e).__name__}: {e}"
+                endpoint.record_failure(error)
+                errors.append(f"{endpoint.url[:50]}: {error}")
+                print(f"❌ [RPC {self.name}] {endpoint.url[:50]} failed ({error}), failing over...")
+                continue
+            endpoint.record_success((time.perf_counter() - started) * 1000)
+            return reply
+
+        raise RPCUnavailable(f"All RPC endpoints failed for '{self.name}': {'; '.join(errors)}")
+
+    @staticmethod
+    def _unwrap(reply: Dict) -> Any:
+        if "error" in reply:
+            error = reply["error"]
+            raise RPCError(error.get("code", -1), error.get("message", ""), error.get("data"))
+        return reply.get("result")
+
+    async def call(self, method: str, params: Optional[List] = None) -> Any:
+        """Make one JSON-RPC call and return its result"""
+        reply = await self._send({
+            "jsonrpc": "2.0",
+            "id": self._next_id(),
+            "method": method,
+            "params": params or [],
+        })
+        return self._unwrap(reply)
+
+    async def batch(self, calls: List[Tuple[str, List]], return_exceptions: bool = False) -> List[Any]:
+        """
+        Send many calls as JSON-RPC batches (one round trip per
+        RPC_MAX_BATCH_SIZE calls). Results come back in call order; with
+        return_exceptions=True failed items are returned as RPCError instead
+        of raising, like asyncio.gather.
+        """
+        if not calls:
+            return []
+
+        chunks = [calls[i:i + RPC_MAX_BATCH_SIZE] for i in range(0, len(calls), RPC_MAX_BATCH_SIZE)]
+        replies = await asyncio.gather(*(self._send_batch(chunk) for chunk in chunks))
+
+        results = []
+        for reply in (r for chunk_replies in replies for r in chunk_replies):
+            try:
+                results.append(self._unwrap(reply))
+            except RPCError as e:
+                if not return_exceptions:
+                    raise
+                results.append(e)
+        return results
+
+    async def _send_batch(self, calls: List[Tuple[str, List]]) -> List[Dict]:
+        """One batch round trip; replies are matched back to calls by id"""
+        payload = [
+            {"jsonrpc": "2.0", "id": self._next_id(), "method": method, "params": params or []}
+            for method, params in calls
+        ]
+        reply = await self._send(payload)
+
+        if not isinstance(reply, list):
+            # Endpoint rejected batching - fall back to concurrent single calls
+            print(f"⚠️ [RPC {self.name}] Batch rejected, sending {len(payload)} calls individually")
+            return await asyncio.gather(*(self._send(item) for item in payload))
+
+        by_id = {item.get("id"): item for item in reply}
+        missing = {"error": {"code": -32603, "message": "Missing reply in batch response"}}
+        return [by_id.get(item["id"], missing) for item in payload]
+
+    def status(self) -> Dict:
+        """Current per-endpoint health, in the order requests would try them"""
+        ranked = self._ranked()
+        return {
+            "network": self.name,
+            "chain_id": self.chain_id,
+            "healthy": any(not e.is_benched() for e in ranked),
+            "preferred": ranked[0].url[:50] if ranked else None,
+            "endpoints": [e.to_dict() for e in self.endpoints],
+        }
+
+    async def close(self):
+        for session in self._sessions.values():
+            if not session.closed:
+                await session.close()
+        self._sessions.clear()
+
+
+# ════════════════════════════════════════════════════════════════
+# REQUEST-SCOPED BATCHING
+# ════════════════════════════════════════════════════════════════
+
+class RPCBatch:
+    """
+    Collects the reads one request needs and sends them as a single
+    JSON-RPC batch. Identical calls are only sent once.
+
+        async with RPCBatch(pool) as batch:
+            chain_id = batch.add("eth_chainId")
+            block = batch.add("eth_getBlockByNumber", ["latest", False])
+        print(chain_id.result(), block.result())
+    """
+
+    def __init__(self, pool: RPCPool):
+        self.pool = pool
+        self._calls: List[Tuple[str, List]] = []
+        self._futures: Dict[str, asyncio.Future] = {}
+
+    def add(self, method: str, params: Optional[List] = None) -> asyncio.Future:
+        """Queue a call; the returned future resolves when the batch executes"""
+        params = params or []
+        key = f"{method}:{json.dumps(params, sort_keys=True)}"
+        future = self._futures.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._futures[key] = future
+            self._calls.append((method, params))
+        return future
+
+    async def execute(self):
+        """Send every queued call in one round trip and resolve the futures"""
+        calls, futures = self._calls, list(self._futures.values())
+        self._calls, self._futures = [], {}
+        if not calls:
+            return
+        try:
+            results = await self.pool.batch(calls, return_exceptions=True)
+        except Exception as e:
+            for future in futures:
+                self._fail(future, e)
+            return
+        for future, result in zip(futures, results):
+            if isinstance(result, RPCError):
+                self._fail(future, result)
+            else:
+                future.set_result(result)
+
+    @staticmethod
+    def _fail(future: asyncio.Future, error: Exception):
+        future.set_exception(error)
+        future.exception()  # mark as retrieved so unused results aren't logged; .result() still raises
+
+    async def __aenter__(self) -> "RPCBatch":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            await self.execute()
+        else:
+            for future in self._futures.values():
+                future.cancel()
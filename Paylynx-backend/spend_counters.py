@@ -0,0 +1,183 @@
+# spend_counters.py - Compact per-worker spend counters
+# One slot per active user in parallel array columns (spent, as-of time,
+# last use) instead of a dict/tuple per user. User ids are interned and map
+# to slot numbers; slots of users not seen for max_age are reclaimed lazily
+# by a sweep that inspects a few slots per write, so memory follows active users.
+
+import os
+import sys
+from array import array
+from typing import Dict, Iterator, List, Optional
+
+SPEND_COUNTERS_CAPACITY = int(os.getenv("SPEND_COUNTERS_CAPACITY", "1000000"))  # slots before forced eviction
+SWEEP_STEP = 2  # slots inspected per write
+
+
+class SpendCounters:
+    """user_id -> (spent, as_of, used) in array columns, with lazy expiry"""
+
+    def __init__(self, max_age: float, capacity: int = SPEND_COUNTERS_CAPACITY):
+        self.max_age = max_age
+        self.capacity = capacity
+        self._slot: Dict[str, int] = {}
+        self._user: List[Optional[str]] = []
+        self._spent = array("d")
+        self._as_of = array("d")  # when spent was last known to be right
+        self._used = array("d")  # when a request last touched the user - drives expiry
+        self._free = array("q")  # reusable slot numbers
+        self._cursor = 0
+        self.evicted = 0
+
+    def __len__(self) -> int:
+        return len(self._slot)
+
+    def get(self, user_id: str, now: float, max_age: Optional[float] = None) -> Optional[float]:
+        """Spent for the user if the counter is younger than max_age"""
+        slot = self._slot.get(user_id)
+        if slot is None or now - self._as_of[slot] >= (self.max_age if max_age is None else max_age):
+            return None
+        self._used[slot] = now
+        return self._spent[slot]
+
+    def set(self, user_id: str, spent: float, now: float):
+        self._sweep(now)
+        slot = self._slot.get(user_id)
+        if slot is None:
+            if len(self._slot) >= self.capacity:
+                self._evict_next()
+            slot = self._allocate(sys.intern(user_id))
+        self._spent[slot] = spent
+        self._as_of[slot] = now
+        self._used[slot] = now
+
+    def refresh(self, user_id: str, spent: float, read_at: float, now: float):
+        """Background update read at read_at - doesn't count as use, never overwrites newer values"""
+        slot = self._slot.get(user_id)
+        if slot is not None and self._as_of[slot] <= read_at:
+            self._spent[slot] = spent
+            self._as_of[slot] = now
+
+    def discard(self, user_id: str):
+        slot = self._slot.pop(user_id, None)
+        if slot is not None:
+            self._user[slot] = None
+            self._free.append(slot)
+
+    def active(self, now: float) -> Iterator[str]:
+        """Users whose counters are still within max_age"""
+        for user_id, slot in list(self._slot.items()):
+            if now - self._used[slot] < self.max_age:
+                yield user_id
+
+    def sweep(self, now: float) -> int:
+        """Reclaim every expired slot (the reconcile loop calls this)"""
+        before = len(self._slot)
+        for slot, user_id in enumerate(self._user):
+            if user_id is not None and now - self._used[slot] >= self.max_age:
+                self.discard(user_id)
+        self.evicted += before - len(self._slot)
+        return before - len(self._slot)
+
+    def _allocate(self, user_id: str) -> int:
+        if self._free:
+            slot = self._free.pop()
+            self._user[slot] = user_id
+        else:
+            slot = len(self._user)
+            self._user.append(user_id)
+            self._spent.append(0.0)
+            self._as_of.append(0.0)
+            self._used.append(0.0)
+        self._slot[user_id] = slot
+        return slot
+
+    def _sweep(self, now: float):
+        """Inspect the next few slots and free the expired ones"""
+        total = len(self._user)
+        for _ in range(min(SWEEP_STEP, total)):
+            self._cursor = (self._cursor + 1) % total
+            user_id = self._user[self._cursor]
+            if user_id is not None and now - self._used[self._cursor] >= self.max_age:
+                self.discard(user_id)
+                self.evicted += 1
+
+    def _evict_next(self):
+        """Full of live users - drop the next one under the sweep cursor (clock order)"""
+        while True:
+            self._cursor = (self._cursor + 1) % len(self._user)
+            user_id = self._user[self._cursor]
+            if user_id is not None:
+                self.discard(user_id)
+                self.evicted += 1
+                return
+
+    def memory_bytes(self) -> int:
+        """Container overhead (columns, index, free list) - excludes the id strings themselves"""
+        return (
+            sys.getsizeof(self._slot) + sys.getsizeof(self._user)
+            + sum(column.buffer_info()[1] * column.itemsize for column in (self._spent, self._as_of, self._used, self._free))
+        )
+
+    def stats(self) -> Dict:
+        return {
+            "users": len(self._slot),
+            "slots": len(self._user),
+            "free_slots": len(self._free),
+            "evicted": self.evicted,
+            "memory_bytes": self.memory_bytes(),
+        }
+
+
+if __name__ == "__main__":
+    import gc
+    import time
+    import tracemalloc
+    from datetime import date
+
+    USERS = 1_000_000
+    user_ids = [f"did:privy:cm{i:022d}" for i in range(USERS)]  # Privy-style ids, allocated up front
+    today = date.today()
+
+    def measure(build):
+        gc.collect()
+        tracemalloc.start()
+        store = build()
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return store, current
+
+    def build_dicts():
+        daily_spending = {}
+        for i, user_id in enumerate(user_ids):
+            daily_spending[user_id] = {"date": today, "amount": float(i % 500)}
+        return daily_spending
+
+    def build_counters():
+        counters = SpendCounters(max_age=60.0, capacity=USERS)
+        for i, user_id in enumerate(user_ids):
+            counters.set(user_id, float(i % 500), 1000.0)
+        return counters
+
+    old, old_bytes = measure(build_dicts)
+    print(f"dict per user : {old_bytes / 2**20:6.1f} MiB ({old_bytes / USERS:5.1f} B/user)")
+    del old
+    counters, new_bytes = measure(build_counters)
+    print(f"SpendCounters : {new_bytes / 2**20:6.1f} MiB ({new_bytes / USERS:5.1f} B/user)")
+
+    started = time.perf_counter()
+    for user_id in user_ids[:100_000]:
+        counters.get(user_id, 1010.0)
+    lookup = (time.perf_counter() - started) / 100_000 * 1e9
+    started = time.perf_counter()
+    for user_id in user_ids[:100_000]:
+        counters.set(user_id, 2.0, 1010.0)
+    update = (time.perf_counter() - started) / 100_000 * 1e9
+    print(f"get {lookup:.0f} ns, set {update:.0f} ns")
+
+    # A day later, 300k new users arrive: lazy sweeps hand them the expired slots
+    later = 1000.0 + 86_400
+    for i in range(300_000):
+        counters.set(f"did:privy:new{i:021d}", 1.0, later)
+    print(f"300k new users a day later: {counters.stats()}")
+    counters.sweep(later)
+    print(f"after the reconcile sweep : {counters.stats()}")
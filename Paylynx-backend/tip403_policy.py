@@ -2,16 +2,28 @@
 
 from web3 import Web3
 
-from typing import Optional, Dict
+import math
+import time
+
+from typing import Optional, Dict, List
 
 from datetime import datetime
 
+from dateutil.parser import isoparse
+
 from supabase import Client
 
+from policy_cache import PolicySettingsCache, InvalidationBus
+from spend_ledger import SpendLedger
+from policy_rules import PaymentBatch, compile_policy, RULE_DEFAULTS
+
 # TIP-403 Registry on Tempo (you found this earlier!)
 
 TIP403_REGISTRY_ADDRESS = "0x403c000000000000000000000000000000000000"
 
+FIRST_PAID_PAGE_SIZE = 1000  # PostgREST's default row cap per request
+FIRST_PAID_MAX_ROWS = 100_000  # transactions read when backfilling first-paid times
+
 DEFAULT_SETTINGS = {
     "enabled": True,
     "max_single_payment": 1000.0,  # $1000 USDC
@@ -19,7 +31,8 @@ DEFAULT_SETTINGS = {
     "night_hour_start": 22,  # 10 PM
     "night_hour_end": 6,  # 6 AM
     "night_max_payment": 100.0,  # $100 during night
-    "night_time_enabled": True
+    "night_time_enabled": True,
+    **RULE_DEFAULTS
 }
 
 class TIP403PolicyChecker:
@@ -28,12 +41,32 @@ class TIP403PolicyChecker:
     This runs BEFORE your normal USDC transfer
     """
 
-    def __init__(self, db: Client):
+    def __init__(self, db: Client, settings_cache: Optional[PolicySettingsCache] = None,
+                 invalidations: Optional[InvalidationBus] = None, ledger: Optional[SpendLedger] = None):
         self.db = db
-        # Track daily spending (in production, store in Supabase)
-        self.daily_spending = {}  # user_id -> {amount, reset_time}
+        # Settings rarely change - served from memory, refreshed on write or invalidation
+        self.settings_cache = settings_cache or PolicySettingsCache()
+        self.invalidations = invalidations
+        # Daily spending over a rolling 24h window, shared by all workers
+        self.ledger = ledger or SpendLedger()
 
     def get_user_settings(self, user_id: str) -> Dict:
+        """User-specific policy settings (cached, DB on a miss)"""
+        settings = self.settings_cache.get(user_id)
+        if settings is None:
+            version = self.settings_cache.version()  # before the read: a write landing meanwhile wins
+            settings = self._load_user_settings(user_id)
+            self.settings_cache.put(user_id, settings, version)
+        return settings
+
+    def settings_updated(self, user_id: str, settings: Dict):
+        """Write-through after the DB row changed: refresh this worker, invalidate the others"""
+        self.settings_cache.invalidate(user_id)  # reads still in flight hold the old row
+        self.settings_cache.put(user_id, settings)
+        if self.invalidations is not None:
+            self.invalidations.publish(user_id)
+
+    def _load_user_settings(self, user_id: str) -> Dict:
         """Fetch user-specific policy settings from DB"""
         response = self.db.table("paylynx_user_profiles") \
             .select("policy_settings") \
@@ -53,15 +86,27 @@ class TIP403PolicyChecker:
         user_id: str,
         amount: float,
         recipient: str,
-        context: str = ""
+        context: str = "",
+        settings: Optional[Dict] = None
     ) -> Dict:
         """
         Check if payment is allowed by policy
         
         Returns: {allowed: bool, reason: str, policy_name: str}
         """
-        # Load user-specific settings
-        settings = self.get_user_settings(user_id)
+        if not (math.isfinite(amount) and amount > 0):
+            return {
+                "allowed": False,
+                "reason": f"Invalid payment amount: {amount}",
+                "policy": "TIP-403 Amount Validation",
+                "blocked_by": "invalid_amount",
+                "daily_spent": 0,
+                "daily_remaining": 0
+            }
+
+        # Load user-specific settings (unless the caller already fetched them)
+        if settings is None:
+            settings = self.get_user_settings(user_id)
         
         if not settings.get("enabled", True):
             return {
@@ -72,74 +117,116 @@ class TIP403PolicyChecker:
                 "daily_remaining": 0
             }
 
-        # Check 1: Single payment limit
-        if amount > settings["max_single_payment"]:
+        # Checks 1..n: the user's compiled rules, against recent ledger activity
+        self._ensure_first_paid(user_id, settings)
+        history, first_paid = self.ledger.activity(user_id, [recipient])
+        batch = PaymentBatch([amount], [recipient], [time.time()], history, first_paid)
+        verdict = compile_policy(settings).evaluate(batch)[0]
+        if verdict is not None:
+            return verdict
+
+        # Daily limit again, checked and reserved atomically (another worker may have just spent)
+        reservation_id, spent = self.ledger.reserve(user_id, amount, settings["max_daily_limit"], recipient)
+        if reservation_id is None:
             return {
                 "allowed": False,
-                "reason": f"Amount ${amount:.2f} exceeds single payment limit of ${settings['max_single_payment']:.2f}",
-                "policy": "TIP-403 Single Payment Limit",
-                "blocked_by": "max_single_payment"
+                "reason": f"Daily limit exceeded. Spent: ${spent:.2f}, This payment: ${amount:.2f}, Limit: ${settings['max_daily_limit']:.2f}",
+                "policy": "TIP-403 Daily Spending Limit",
+                "blocked_by": "max_daily_limit",
+                "daily_spent": spent,
+                "daily_remaining": settings["max_daily_limit"] - spent
             }
 
-        # Check 2: Daily limit
-        today = datetime.now().date()
-        if user_id in self.daily_spending:
-            spent_data = self.daily_spending[user_id]
-            if spent_data['date'] == today:
-                total = spent_data['amount'] + amount
-                if total > settings["max_daily_limit"]:
-                    return {
-                        "allowed": False,
-                        "reason": f"Daily limit exceeded. Spent: ${spent_data['amount']:.2f}, This payment: ${amount:.2f}, Limit: ${settings['max_daily_limit']:.2f}",
-                        "policy": "TIP-403 Daily Spending Limit",
-                        "blocked_by": "max_daily_limit",
-                        "daily_spent": spent_data['amount'],
-                        "daily_remaining": settings["max_daily_limit"] - spent_data['amount']
-                    }
-
-        # Check 3: Night time restrictions
-        current_hour = datetime.now().hour
-        is_night = settings.get("night_time_enabled", True) and (
-            current_hour >= settings["night_hour_start"] or current_hour < settings["night_hour_end"]
-        )
-
-        if is_night and amount > settings["night_max_payment"]:
-            return {
-                "allowed": False,
-                "reason": f"Night time payments limited to ${settings['night_max_payment']:.2f}. Current amount: ${amount:.2f}",
-                "policy": "TIP-403 Time-Based Restriction",
-                "blocked_by": "night_time_limit",
-                "time": f"{current_hour}:00"
-            }
-
-        # All checks passed!
-        # Update daily spending
-        if user_id not in self.daily_spending or self.daily_spending[user_id]['date'] != today:
-            self.daily_spending[user_id] = {'date': today, 'amount': 0}
-
-        self.daily_spending[user_id]['amount'] += amount
-
+        # All checks passed! The amount stays reserved until the transaction is recorded
         return {
             "allowed": True,
             "reason": "Payment approved - all TIP-403 policy checks passed",
             "policy": "TIP-403 Compliant",
-            "daily_spent": self.daily_spending[user_id]['amount'],
-            "daily_remaining": settings["max_daily_limit"] - self.daily_spending[user_id]['amount']
+            "daily_spent": spent + amount,
+            "daily_remaining": settings["max_daily_limit"] - spent - amount,
+            "reservation_id": reservation_id
         }
 
+    def check_payments(self, user_id: str, payments: List[Dict], settings: Optional[Dict] = None) -> List[Dict]:
+        """
+        Dry-run a batch (split bill, scheduled payouts) in one pass - nothing is reserved.
+        Each payment is {amount, recipient, at (epoch seconds, default now)}; later payments
+        count the earlier ones in the batch as sent.
+        """
+        if settings is None:
+            settings = self.get_user_settings(user_id)
+        if not settings.get("enabled", True):
+            return [{"allowed": True, "reason": "TIP-403 policy is disabled for this user"} for _ in payments]
+
+        now = time.time()
+        recipients = [p["recipient"] for p in payments]
+        self._ensure_first_paid(user_id, settings)
+        history, first_paid = self.ledger.activity(user_id, recipients)
+        batch = PaymentBatch(
+            [p["amount"] for p in payments], recipients, [p.get("at") or now for p in payments], history, first_paid
+        )
+        verdicts = compile_policy(settings).evaluate(batch)
+        return [v or {"allowed": True, "reason": "All TIP-403 policy checks passed"} for v in verdicts]
+
+    def first_paid(self, user_id: str, recipients: List[str]) -> Dict[str, float]:
+        """When each recipient was first paid (lowercased), backfilled from history if needed"""
+        self._ensure_first_paid(user_id)
+        return self.ledger.activity(user_id, recipients)[1]
+
+    def _ensure_first_paid(self, user_id: str, settings: Optional[Dict] = None):
+        """
+        The ledger only learns first payments from commits, so the first time
+        the cooling rule needs a user, their earlier recipients are backfilled
+        from the transactions table - otherwise every old payee looks new.
+        """
+        if settings is not None and not settings.get("new_recipient_cooling_hours"):
+            return
+        if self.ledger.seeded(user_id):
+            return
+        try:
+            self.ledger.seed_first_paid(user_id, self._load_first_paid(user_id))
+        except Exception as e:
+            # Not marked seeded, so the next check retries; until then unknown payees count as new
+            print(f"⚠️ [TIP-403] Could not backfill first-paid times for {user_id}: {e}")
+
+    def _load_first_paid(self, user_id: str) -> Dict[str, float]:
+        """Earliest non-failed transaction per recipient, paged past the row cap"""
+        first_paid: Dict[str, float] = {}
+        for offset in range(0, FIRST_PAID_MAX_ROWS, FIRST_PAID_PAGE_SIZE):
+            page = self.db.table("transactions") \
+                .select("recipient, created_at") \
+                .eq("user_id", user_id) \
+                .neq("status", "failed") \
+                .order("created_at") \
+                .range(offset, offset + FIRST_PAID_PAGE_SIZE - 1) \
+                .execute().data or []
+            for row in page:
+                recipient = (row.get("recipient") or "").lower()
+                if recipient and recipient not in first_paid:
+                    first_paid[recipient] = isoparse(row["created_at"]).timestamp()
+            if len(page) < FIRST_PAID_PAGE_SIZE:
+                break
+        return first_paid
+
+    def record_payment(self, user_id: str, amount: float, recipient: str, reservation_id: Optional[str] = None):
+        """A prepared payment was sent - make its reservation final"""
+        self.ledger.commit(user_id, amount, recipient, reservation_id)
+
+    def release_payment(self, user_id: str, reservation_id: Optional[str]):
+        """A prepare failed after its check passed - give the daily-limit headroom back"""
+        if reservation_id:
+            self.ledger.release(user_id, reservation_id)
+
     def get_policy_info(self, user_id: str) -> Dict:
         """Get current policy limits and user's status"""
         settings = self.get_user_settings(user_id)
         
-        today = datetime.now().date()
         current_hour = datetime.now().hour
         is_night = settings.get("night_time_enabled", True) and (
             current_hour >= settings["night_hour_start"] or current_hour < settings["night_hour_end"]
         )
 
-        daily_spent = 0
-        if user_id in self.daily_spending and self.daily_spending[user_id]['date'] == today:
-            daily_spent = self.daily_spending[user_id]['amount']
+        daily_spent = self.ledger.spent(user_id)
 
         return {
             "policy_framework": "TIP-403",
@@ -155,5 +242,6 @@ class TIP403PolicyChecker:
                 "daily_remaining": settings["max_daily_limit"] - daily_spent,
                 "is_night_time": is_night,
                 "current_max_payment": settings["night_max_payment"] if is_night else settings["max_single_payment"]
-            }
+            },
+            "active_rules": [rule.blocked_by for rule in compile_policy(settings).rules]
         }
\ No newline at end of file
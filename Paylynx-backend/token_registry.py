@@ -0,0 +1,120 @@
+# token_registry.py - Per-network token metadata and chain-id cache
+# Decimals, symbol, name and chain id never change for a configured network,
+# so they are loaded once (prewarmed at startup) and served from memory.
+
+import asyncio
+from typing import Dict, Optional
+
+from rpc_pool import RPCPool, RPCBatch
+
+PREWARM_TIMEOUT = 10.0  # seconds per network at startup
+
+
+class TokenMetadata:
+    """Immutable token / chain facts for one network"""
+
+    def __init__(self, network: str, chain_id: int, contract, decimals: int,
+                 symbol: Optional[str] = None, name: Optional[str] = None):
+        self.network = network
+        self.chain_id = chain_id
+        self.contract = contract  # web3 Contract, built once per network
+        self.address = contract.address
+        self.decimals = decimals
+        self.symbol = symbol
+        self.name = name
+
+    def to_dict(self) -> Dict:
+        return {
+            "network": self.network,
+            "chain_id": self.chain_id,
+            "address": self.address,
+            "decimals": self.decimals,
+            "symbol": self.symbol,
+            "name": self.name,
+        }
+
+
+class TokenRegistry:
+    """Loads and caches the USDC / stablecoin metadata for every configured network"""
+
+    def __init__(self, w3, networks: Dict[str, Dict], pools: Dict[str, RPCPool], abi: list):
+        self.w3 = w3
+        self.networks = networks
+        self.pools = pools
+        self._contracts = {
+            key: w3.eth.contract(address=w3.to_checksum_address(cfg["USDC_ADDRESS"]), abi=abi)
+            for key, cfg in networks.items()
+        }
+        self._tokens: Dict[str, TokenMetadata] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    def contract(self, network: str):
+        """Token contract for a network (no RPC needed)"""
+        return self._contracts[network]
+
+    def get(self, network: str) -> Optional[TokenMetadata]:
+        """Cached metadata, or None if the network was never loaded"""
+        return self._tokens.get(network)
+
+    async def ensure(self, network: str) -> TokenMetadata:
+        """Cached metadata, loading it on first use"""
+        token = self._tokens.get(network)
+        if token is not None:
+            return token
+        lock = self._locks.setdefault(network, asyncio.Lock())
+        async with lock:
+            if network not in self._tokens:
+                self._tokens[network] = await self._load(network)
+        return self._tokens[network]
+
+    async def _load(self, network: str) -> TokenMetadata:
+        """Fetch chain id, decimals, symbol and name in one batch"""
+        contract = self._contracts[network]
+
+        def call(fn_name: str) -> list:
+            return [{"to": contract.address, "data": contract.encode_abi(fn_name)}, "latest"]
+
+        async with RPCBatch(self.pools[network]) as batch:
+            chain_id = batch.add("eth_chainId")
+            decimals = batch.add("eth_call", call("decimals"))
+            symbol = batch.add("eth_call", call("symbol"))
+            name = batch.add("eth_call", call("name"))
+
+        token = TokenMetadata(
+            network=network,
+            chain_id=int(chain_id.result(), 16),
+            contract=contract,
+            decimals=self._decode("uint8", decimals.result()),
+            symbol=self._decode_optional("string", symbol),
+            name=self._decode_optional("string", name),
+        )
+        print(f"🪙 [TOKENS] {network}: {token.symbol} ({token.decimals} decimals) on chain {token.chain_id}")
+        return token
+
+    def _decode(self, abi_type: str, raw: str):
+        return self.w3.codec.decode([abi_type], bytes.fromhex(raw[2:]))[0]
+
+    def _decode_optional(self, abi_type: str, future: asyncio.Future):
+        """symbol() / name() are optional on some tokens"""
+        if future.exception():
+            return None
+        try:
+            return self._decode(abi_type, future.result())
+        except Exception:
+            return None
+
+    async def prewarm(self):
+        """Load every network concurrently; failures are retried lazily on first use"""
+        async def load(network: str):
+            try:
+                await asyncio.wait_for(self.ensure(network), timeout=PREWARM_TIMEOUT)
+            except Exception as e:
+                print(f"⚠️ [TOKENS] Could not prewarm {network}: {type(e).__name__}: {e}")
+
+        await asyncio.gather(*(load(network) for network in self.networks))
+
+    def status(self) -> Dict:
+        return {
+            network: self._tokens[network].to_dict() if network in self._tokens else None
+            for network in self.networks
+        }
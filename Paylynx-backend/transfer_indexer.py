@@ -0,0 +1,253 @@
+# transfer_indexer.py - Local index of token Transfer events
+# Streams Transfer logs for the active token with adaptive eth_getLogs block
+# ranges, checkpoints progress, and stores transfers in SQLite indexed by
+# sender and recipient so a user's full history is one indexed lookup.
+# Every worker serves queries from the shared file, but only the worker
+# holding the lease scans - the others would repeat the same eth_getLogs.
+
+import os
+import asyncio
+import sqlite3
+import threading
+from typing import Dict, List, Optional
+
+from rpc_pool import RPCPool, RPCError
+from worker_lease import WorkerLease
+
+TRANSFER_INDEXER_ENABLED = os.getenv("TRANSFER_INDEXER_ENABLED", "true").lower() == "true"
+TRANSFER_INDEX_PATH = os.getenv("TRANSFER_INDEX_PATH", "transfer_index.db")
+TRANSFER_INDEX_START_BLOCK = os.getenv("TRANSFER_INDEX_START_BLOCK")  # default: latest - INITIAL_LOOKBACK
+INITIAL_LOOKBACK = 100_000  # blocks scanned on the very first run
+CONFIRMATIONS = int(os.getenv("TRANSFER_INDEX_CONFIRMATIONS", "2"))  # stay this far behind the head
+POLL_INTERVAL = 5.0  # seconds between catch-up rounds once at the head
+
+MIN_CHUNK = 1
+MAX_CHUNK = 10_000
+INITIAL_CHUNK = 2_000
+TARGET_LOGS_PER_CHUNK = 5_000  # grow the range while responses stay below this
+CEILING_RECOVERY_CHUNKS = 20  # clean chunks at the ceiling before it is allowed to double again
+# Provider wording for "range too wide / too many results" - anything else (rate limits,
+# internal errors) is transient and must not shrink the range
+RANGE_ERROR_HINTS = ("range", "more than", "too many results", "too many logs", "too large",
+                     "response size", "result size", "max results")
+
+
+def event_topic(w3, abi: list, name: str) -> str:
+    """topic0 for an event in an ABI, e.g. Transfer(address,address,uint256)"""
+    event = next(e for e in abi if e.get("type") == "event" and e["name"] == name)
+    signature = f"{name}({','.join(i['type'] for i in event['inputs'])})"
+    return "0x" + w3.keccak(text=signature).hex().removeprefix("0x")
+
+
+class TransferIndexer:
+    """Follows Transfer events for one token contract on one network"""
+
+    def __init__(self, w3, pool: RPCPool, network: str, token_address: str, abi: list,
+                 path: str = TRANSFER_INDEX_PATH, lease: Optional[WorkerLease] = None):
+        self.w3 = w3
+        self.pool = pool
+        self.network = network
+        self.token_address = token_address
+        self.topic = event_topic(w3, abi, "Transfer")
+        self.chunk = INITIAL_CHUNK
+        self.chunk_ceiling = MAX_CHUNK  # lowered whenever the provider rejects a range
+        self.clean_chunks = 0  # successful chunks since the ceiling last moved
+        self.indexed = 0
+        self.head: Optional[int] = None
+        self.last_error: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+        self.lease = lease or WorkerLease(f"transfer_indexer.{network}.{token_address.lower()}")
+
+        self._lock = threading.Lock()  # one connection, used from the loop and worker threads
+        self.db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")  # readers in other workers don't block the writer
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS transfers (
+                network TEXT NOT NULL,
+                token TEXT NOT NULL,
+                block_number INTEGER NOT NULL,
+                log_index INTEGER NOT NULL,
+                tx_hash TEXT NOT NULL,
+                from_addr TEXT NOT NULL,
+                to_addr TEXT NOT NULL,
+                amount_wei TEXT NOT NULL,
+                PRIMARY KEY (network, tx_hash, log_index)
+            );
+            CREATE INDEX IF NOT EXISTS idx_transfers_from ON transfers (network, token, from_addr, block_number);
+            CREATE INDEX IF NOT EXISTS idx_transfers_to ON transfers (network, token, to_addr, block_number);
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                network TEXT NOT NULL,
+                token TEXT NOT NULL,
+                last_block INTEGER NOT NULL,
+                PRIMARY KEY (network, token)
+            );
+        """)
+        self.db.commit()
+        self.last_checkpoint = self.checkpoint()  # kept current by _store, so status() never queries
+
+    # ── Checkpoints ───────────────────────────────────
+
+    def checkpoint(self) -> Optional[int]:
+        with self._lock:
+            row = self.db.execute(
+                "SELECT last_block FROM checkpoints WHERE network = ? AND token = ?",
+                (self.network, self.token_address)
+            ).fetchone()
+        return row[0] if row else None
+
+    def _store(self, logs: List[Dict], last_block: int):
+        """Insert a chunk of transfers and advance the checkpoint atomically (blocking)"""
+        rows = [
+            (
+                self.network,
+                self.token_address,
+                int(log["blockNumber"], 16),
+                int(log["logIndex"], 16),
+                log["transactionHash"],
+                "0x" + log["topics"][1][-40:].lower(),
+                "0x" + log["topics"][2][-40:].lower(),
+                str(int(log["data"], 16) if log["data"] not in ("0x", "") else 0),
+            )
+            for log in logs
+            if len(log.get("topics", [])) == 3  # ERC-721 style Transfer logs have 4 topics
+        ]
+        with self._lock, self.db:
+            self.db.executemany("INSERT OR IGNORE INTO transfers VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self.db.execute(
+                "INSERT OR REPLACE INTO checkpoints (network, token, last_block) VALUES (?, ?, ?)",
+                (self.network, self.token_address, last_block)
+            )
+        self.last_checkpoint = last_block
+        self.indexed += len(rows)
+
+    # ── Scanning ──────────────────────────────────────
+
+    async def catch_up(self) -> int:
+        """Index everything from the checkpoint to the confirmed head; returns blocks scanned"""
+        latest = int(await self.pool.call("eth_blockNumber"), 16)
+        self.head = latest - CONFIRMATIONS
+
+        start = await asyncio.to_thread(self.checkpoint)
+        if start is None:
+            start = int(TRANSFER_INDEX_START_BLOCK) if TRANSFER_INDEX_START_BLOCK else max(latest - INITIAL_LOOKBACK, 0)
+            start -= 1  # checkpoint is the last block already indexed
+
+        scanned = 0
+        from_block = start + 1
+        while from_block <= self.head:
+            to_block = min(from_block + self.chunk - 1, self.head)
+            try:
+                logs = await self.pool.call("eth_getLogs", [{
+                    "address": self.token_address,
+                    "topics": [self.topic],
+                    "fromBlock": hex(from_block),
+                    "toBlock": hex(to_block),
+                }])
+            except RPCError as e:
+                # Range too large / too many results - shrink and retry; other errors end the round
+                if not self._range_error(e) or self.chunk <= MIN_CHUNK:
+                    raise
+                self.chunk = max(self.chunk // 2, MIN_CHUNK)
+                self.chunk_ceiling = self.chunk
+                self.clean_chunks = 0
+                print(f"🔎 [INDEXER] {self.network}: {e.message[:80]} - chunk now {self.chunk} blocks")
+                continue
+
+            await asyncio.to_thread(self._store, logs, to_block)
+            scanned += to_block - from_block + 1
+            from_block = to_block + 1
+            if len(logs) < TARGET_LOGS_PER_CHUNK // 2:
+                self.clean_chunks += 1
+                if self.clean_chunks >= CEILING_RECOVERY_CHUNKS and self.chunk_ceiling < MAX_CHUNK:
+                    # A rejected range may have been a busy endpoint - probe larger ranges again
+                    self.chunk_ceiling = min(self.chunk_ceiling * 2, MAX_CHUNK)
+                    self.clean_chunks = 0
+                self.chunk = min(self.chunk * 2, self.chunk_ceiling)
+            # A long backfill outlives the lease - renew it, and stop if another worker took over
+            if self.lease.renewal_due() and not await asyncio.to_thread(self.lease.acquire):
+                break
+        return scanned
+
+    @staticmethod
+    def _range_error(error: RPCError) -> bool:
+        message = error.message.lower()
+        return any(hint in message for hint in RANGE_ERROR_HINTS)
+
+    def start(self):
+        if TRANSFER_INDEXER_ENABLED and self._task is None:
+            self._task = asyncio.create_task(self._run())
+            print(f"🔎 [INDEXER] Started for {self.network} token {self.token_address}")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.lease.held:
+            await asyncio.to_thread(self.lease.release)
+
+    async def _run(self):
+        while True:
+            try:
+                if await asyncio.to_thread(self.lease.acquire):
+                    await self.catch_up()
+                else:
+                    self.last_checkpoint = await asyncio.to_thread(self.checkpoint)  # the holder's progress
+                self.last_error = None
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+                print(f"❌ [INDEXER] {self.network}: {self.last_error}")
+            await asyncio.sleep(POLL_INTERVAL)
+
+    # ── Queries ───────────────────────────────────────
+
+    def history(self, address: str, limit: int = 50, before_block: Optional[int] = None) -> List[Dict]:
+        """Transfers sent or received by an address, newest first"""
+        address = address.lower()
+        before = before_block if before_block is not None else 2 ** 62
+        with self._lock:
+            rows = self.db.execute("""
+                SELECT * FROM (
+                    SELECT block_number, log_index, tx_hash, from_addr, to_addr, amount_wei FROM transfers
+                    WHERE network = ? AND token = ? AND from_addr = ? AND block_number < ?
+                    UNION
+                    SELECT block_number, log_index, tx_hash, from_addr, to_addr, amount_wei FROM transfers
+                    WHERE network = ? AND token = ? AND to_addr = ? AND block_number < ?
+                )
+                ORDER BY block_number DESC, log_index DESC
+                LIMIT ?
+            """, (
+                self.network, self.token_address, address, before,
+                self.network, self.token_address, address, before,
+                limit,
+            )).fetchall()
+        return [
+            {
+                "block_number": block_number,
+                "log_index": log_index,
+                "tx_hash": tx_hash,
+                "from": from_addr,
+                "to": to_addr,
+                "amount_wei": int(amount_wei),
+                "direction": "out" if from_addr == address else "in",
+            }
+            for block_number, log_index, tx_hash, from_addr, to_addr, amount_wei in rows
+        ]
+
+    def status(self) -> Dict:
+        return {
+            "enabled": TRANSFER_INDEXER_ENABLED,
+            "running": self._task is not None and not self._task.done(),
+            "network": self.network,
+            "checkpoint": self.last_checkpoint,
+            "head": self.head,
+            "chunk_size": self.chunk,
+            "lease": self.lease.status(),
+            "indexed_this_run": self.indexed,
+            "last_error": self.last_error,
+        }
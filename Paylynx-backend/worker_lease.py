@@ -0,0 +1,85 @@
+# worker_lease.py - Elects one worker for background jobs that must not run everywhere
+# Every uvicorn worker starts the same background tasks. For jobs that scan
+# shared state (the pending-transaction backlog, the Transfer log index) a
+# row in a small SQLite table acts as a lease: the holder renews it each
+# round, and another worker takes over once it lapses (crash or shutdown).
+
+import os
+import time
+import uuid
+import sqlite3
+import threading
+from typing import Dict
+
+# Next to this module, not the working directory - every worker must share one file
+DEFAULT_LEASE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "worker_leases.db")
+WORKER_LEASE_PATH = os.getenv("WORKER_LEASE_PATH", DEFAULT_LEASE_PATH)
+WORKER_LEASE_TTL = float(os.getenv("WORKER_LEASE_TTL", "30"))  # seconds a silent holder keeps the job
+RENEWALS_PER_TTL = 3  # the holder renews this often per TTL, so one slow round doesn't lose the lease
+
+
+class WorkerLease:
+    """A named lease held by at most one worker at a time (blocking - call via asyncio.to_thread)"""
+
+    def __init__(self, name: str, path: str = WORKER_LEASE_PATH, ttl: float = WORKER_LEASE_TTL):
+        self.name = name
+        self.ttl = ttl
+        self.owner = uuid.uuid4().hex[:12]
+        self.held = False
+        self.takeovers = 0
+        self.checked_at = float("-inf")  # monotonic time of the last acquire()
+        self._lock = threading.Lock()  # one connection, used from worker threads
+        self.db = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS worker_leases (
+                name TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        """)
+
+    def acquire(self) -> bool:
+        """Take or renew the lease; False while another live worker holds it"""
+        self.checked_at = time.monotonic()
+        now = time.time()
+        with self._lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.db.execute(
+                    "SELECT owner, expires_at FROM worker_leases WHERE name = ?", (self.name,)
+                ).fetchone()
+                held = row is None or row[0] == self.owner or row[1] < now
+                if held:
+                    self.db.execute(
+                        "INSERT OR REPLACE INTO worker_leases (name, owner, expires_at) VALUES (?, ?, ?)",
+                        (self.name, self.owner, now + self.ttl)
+                    )
+                self.db.execute("COMMIT")
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+
+        if held and not self.held:
+            self.takeovers += 1
+            print(f"👑 [LEASE] {self.name}: worker {self.owner} took over")
+        self.held = held
+        return held
+
+    def renewal_due(self) -> bool:
+        """Time to call acquire() again - holders must renew well inside the TTL"""
+        return time.monotonic() - self.checked_at >= self.ttl / RENEWALS_PER_TTL
+
+    def release(self):
+        """Give the lease up now instead of letting it lapse (shutdown)"""
+        with self._lock:
+            self.db.execute("DELETE FROM worker_leases WHERE name = ? AND owner = ?", (self.name, self.owner))
+        self.held = False
+
+    def status(self) -> Dict:
+        return {
+            "name": self.name,
+            "owner": self.owner,
+            "held": self.held,
+            "takeovers": self.takeovers,
+        }